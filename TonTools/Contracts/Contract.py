@@ -29,36 +29,86 @@ def is_boc(b64str: str):
         return False
 
 
+_UNSET = object()
+
+
+def _try_parse_boc(b64str: str) -> typing.Optional[Cell]:
+    try:
+        return Cell.one_from_boc(b64str_to_bytes(b64str))
+    except Exception:
+        return None
+
+
 class Msg:
+    """
+    ``msg_data`` and ``op_code`` are decoded on first access (body BOC is parsed at most once) and cached.
+    """
+    __slots__ = ('created_lt', 'source', 'destination', 'value', '_raw_msg_data', '_msg_data_hex', '_msg_data', '_op_code')
+
     def __init__(self, data: dict):
         self.created_lt = data['created_lt']
         self.source = data['source']
         self.destination = data['destination']
         self.value = data['value']
-        if data.get('msg_data') is None:
-            self.msg_data = base64.b64encode(bytes.fromhex(data['msg_data_hex'])).decode() if 'msg_data_hex' in data else None
+        self._raw_msg_data = data.get('msg_data')
+        self._msg_data_hex = data.get('msg_data_hex')
+        self._msg_data = _UNSET
+        self._op_code = data['op_code'] if 'op_code' in data else _UNSET
+
+    def _decode(self):
+        raw = self._raw_msg_data
+        cell = None
+        if raw is None:
+            msg_data = base64.b64encode(bytes.fromhex(self._msg_data_hex)).decode() if self._msg_data_hex is not None else None
+            if msg_data and self._op_code is _UNSET:
+                cell = _try_parse_boc(msg_data)
+        elif isinstance(raw, dict):
+            msg_data = raw
         else:
-            if isinstance(data['msg_data'], dict) or is_boc(data['msg_data']):
-                self.msg_data = data['msg_data']
-            else:
-                self.msg_data = base64.b64decode(data['msg_data']).decode().split('\x00')[-1]
-        self.op_code = self.try_get_op() if 'op_code' not in data else data['op_code']
+            cell = _try_parse_boc(raw)
+            msg_data = raw if cell is not None else base64.b64decode(raw).decode().split('\x00')[-1]
+        self._msg_data = msg_data
+        if self._op_code is _UNSET:
+            self._op_code = self._op_from_cell(msg_data, cell)
+        self._raw_msg_data = self._msg_data_hex = None
+
+    @staticmethod
+    def _op_from_cell(msg_data, cell: typing.Optional[Cell]):
+        if not msg_data:
+            return None
+        if cell is None:
+            return '000000'
+        _slice = cell.begin_parse()
+        if len(_slice) >= 32:
+            return _slice.read_bytes(4).hex()
+        return None
+
+    @property
+    def msg_data(self):
+        if self._msg_data is _UNSET:
+            self._decode()
+        return self._msg_data
+
+    @msg_data.setter
+    def msg_data(self, value):
+        self._msg_data = value
+
+    @property
+    def op_code(self):
+        if self._op_code is _UNSET:
+            self._decode()
+        return self._op_code
+
+    @op_code.setter
+    def op_code(self, value):
+        self._op_code = value
 
     def try_detect_type(self):
         return known_prefixes.get(self.op_code)
 
     def try_get_op(self):
-        if not self.msg_data:
-            return None
-        if not is_boc(self.msg_data):
-            op = '000000'
-        else:
-            _slice = Cell.one_from_boc(b64str_to_bytes(self.msg_data)).begin_parse()
-            if len(_slice) >= 32:
-                op = _slice.read_bytes(4).hex()
-            else:
-                return None
-        return op
+        msg_data = self.msg_data
+        return self._op_from_cell(msg_data, _try_parse_boc(msg_data) if isinstance(msg_data, str) else None)
 
     def to_dict(self):
         return {
@@ -72,6 +122,7 @@ class Msg:
 
 
 class InMsg(Msg):
+    __slots__ = ()
 
     def is_external(self) -> bool:
         if not self.source:
@@ -80,19 +131,43 @@ class InMsg(Msg):
 
 
 class OutMsg(Msg):
-    pass
+    __slots__ = ()
 
 
 class Transaction:
-    def __init__(self, data: dict):
+    """
+    ``status`` (which needs the whole transaction BOC to be deserialized) and messages' data are computed on first access
+    and cached, so reading ``lt``, ``utime`` or values doesn't pay for them. ``to_dict`` outputs are built from them
+    on every call, so they reflect changes of the transaction and can be modified by the caller.
+    With ``keep_data=False`` the status is computed right away and the raw ``data`` is dropped to save memory.
+    """
+    __slots__ = ('utime', 'fee', 'data', 'hash', 'lt', '_status', 'in_msg', 'out_msgs')
+
+    keep_data = True  # default for all transactions
+
+    def __init__(self, data: dict, keep_data: bool = None):
         self.utime = data['utime']
         self.fee = data['fee']
         self.data = data['data']
         self.hash = data['hash']
         self.lt = data['lt']
-        self.status = transaction_status(data['data']) if 'status' not in data else data['status']
+        self._status = data['status'] if 'status' in data else _UNSET
         self.in_msg: InMsg = InMsg(data['in_msg'])
         self.out_msgs: typing.List[OutMsg] = [OutMsg(out_msg) for out_msg in data['out_msgs']]
+        if not (self.keep_data if keep_data is None else keep_data):
+            if self._status is _UNSET:
+                self._status = transaction_status(self.data)
+            self.data = None
+
+    @property
+    def status(self):
+        if self._status is _UNSET:
+            self._status = transaction_status(self.data)
+        return self._status
+
+    @status.setter
+    def status(self, value):
+        self._status = value
 
     def to_dict(self):
         return {
@@ -116,17 +191,16 @@ class Transaction:
                 'to': self.in_msg.destination,
                 'comment': self.in_msg.msg_data if 'te6' not in (self.in_msg.msg_data or ()) else ''
             }
-        else:
-            return {
-                'type': 'out',
-                'utime': self.utime,
-                'status': self.status,
-                'hash': self.hash,
-                'value': int(self.out_msgs[0].value) / 10**9 if len(self.out_msgs) == 1 else [int(out_msg.value) / 10**9 for out_msg in self.out_msgs],
-                'from': self.out_msgs[0].source,
-                'to': self.out_msgs[0].destination if len(self.out_msgs) == 1 else [out_msg.destination for out_msg in self.out_msgs],
-                'comment': (self.out_msgs[0].msg_data if 'te6' not in (self.out_msgs[0].msg_data or ()) else '') if len(self.out_msgs) == 1 else [out_msg.msg_data if 'te6' not in (out_msg.msg_data or ()) else '' for out_msg in self.out_msgs],
-            }
+        return {
+            'type': 'out',
+            'utime': self.utime,
+            'status': self.status,
+            'hash': self.hash,
+            'value': int(self.out_msgs[0].value) / 10**9 if len(self.out_msgs) == 1 else [int(out_msg.value) / 10**9 for out_msg in self.out_msgs],
+            'from': self.out_msgs[0].source,
+            'to': self.out_msgs[0].destination if len(self.out_msgs) == 1 else [out_msg.destination for out_msg in self.out_msgs],
+            'comment': (self.out_msgs[0].msg_data if 'te6' not in (self.out_msgs[0].msg_data or ()) else '') if len(self.out_msgs) == 1 else [out_msg.msg_data if 'te6' not in (out_msg.msg_data or ()) else '' for out_msg in self.out_msgs],
+        }
 
     def __str__(self):
         return 'Transaction(' + json.dumps(self.to_dict_user_friendly()) + ')'
@@ -148,6 +222,13 @@ class Contract:
     async def get_transactions(self, limit: int = 10**9, limit_per_one_request: int = 100) -> typing.List[Transaction]:
         return await self.provider.get_transactions(self.address, limit, limit_per_one_request)
 
+    def iter_transactions(self, limit: int = None, from_lt: int = None, from_hash: str = None,
+                          to_lt: int = 0) -> typing.AsyncIterator[Transaction]:
+        """
+        Yields transactions from newest to oldest page by page, see provider's ``iter_transactions``.
+        """
+        return self.provider.iter_transactions(self.address, limit, from_lt, from_hash, to_lt)
+
     async def run_get_method(self, method: str, stack: list):  # TonCenterClient or LsClient required
         """
         Please, note that currently the response types for TonCenterClient, LsClient and DtonClient are different.
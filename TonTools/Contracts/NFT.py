@@ -110,6 +110,10 @@ class NftCollection(Contract):
     async def get_collection_items(self, limit_per_one_request=0):
         return await self.provider.get_collection_items(self, limit_per_one_request)
 
+    def iter_collection_items(self, start_index: int = 0, stop_index: int = None, window: int = 100, ordered: bool = True,
+                              derive_addresses: bool = False, processes: int = None):  # TonCenterClient or LsClient required
+        return self.provider.iter_collection_items(self, start_index, stop_index, window, ordered, derive_addresses, processes)
+
     def to_dict(self):
         if self.is_full():
             return {
@@ -0,0 +1,194 @@
+"""
+Minimal reader of transaction BOCs for the status check.
+
+Only the cells on the way to the compute and action phase results are decoded: the BOC is indexed
+(offsets of cells, no objects are built), then the description (the last ref of the root cell)
+is read with the phases before compute phase skipped by their lengths.
+"""
+
+import base64
+import typing
+
+
+BOC_MAGIC = b'\xb5\xee\x9c\x72'
+
+
+class _CellData:
+    __slots__ = ('data', 'bits', 'pos', 'refs', 'ref_pos')
+
+    def __init__(self, data: int, bits: int, refs: typing.List[int]):
+        self.data = data
+        self.bits = bits
+        self.pos = 0
+        self.refs = refs
+        self.ref_pos = 0
+
+    def read_uint(self, n: int) -> int:
+        if self.pos + n > self.bits:
+            raise ValueError('not enough bits in cell')
+        self.pos += n
+        return (self.data >> (self.bits - self.pos)) & ((1 << n) - 1)
+
+    def read_int(self, n: int) -> int:
+        value = self.read_uint(n)
+        return value - (1 << n) if value >> (n - 1) else value
+
+    def read_bit(self) -> bool:
+        return bool(self.read_uint(1))
+
+    def read_var_uint(self, header_bits: int) -> int:
+        return self.read_uint(self.read_uint(header_bits) * 8)
+
+    def read_ref(self) -> int:
+        ref = self.refs[self.ref_pos]
+        self.ref_pos += 1
+        return ref
+
+
+class Boc:
+    """
+    Index of cells of a bag of cells. Cells are decoded on demand with ``cell(index)``.
+    """
+
+    def __init__(self, boc: bytes):
+        if boc[:4] != BOC_MAGIC:
+            raise ValueError('not a BOC (or unsupported BOC format)')
+        flags = boc[4]
+        has_idx = flags & 0x80
+        self.ref_size = flags & 0x07
+        off_size = boc[5]
+        pos = 6
+        size = self.ref_size
+        cells_num = int.from_bytes(boc[pos:pos + size], 'big')
+        roots_num = int.from_bytes(boc[pos + size:pos + 2 * size], 'big')
+        pos += 3 * size + off_size  # absent_num, tot_cells_size
+        self.roots = [int.from_bytes(boc[pos + i * size:pos + (i + 1) * size], 'big') for i in range(roots_num)]
+        pos += roots_num * size
+        if has_idx:
+            pos += cells_num * off_size
+        self.boc = boc
+        self.offsets = []
+        for _ in range(cells_num):
+            self.offsets.append(pos)
+            d1, d2 = boc[pos], boc[pos + 1]
+            pos += 2
+            if d1 & 16:  # hashes and depths are stored
+                pos += (bin(d1 >> 5).count('1') + 1) * 34
+            pos += (d2 + 1) // 2 + (d1 & 7) * size
+
+    def cell(self, index: int) -> _CellData:
+        boc, pos, size = self.boc, self.offsets[index], self.ref_size
+        d1, d2 = boc[pos], boc[pos + 1]
+        pos += 2
+        if d1 & 16:
+            pos += (bin(d1 >> 5).count('1') + 1) * 34
+        data_len = (d2 + 1) // 2
+        data = int.from_bytes(boc[pos:pos + data_len], 'big')
+        bits = data_len * 8
+        if d2 & 1 and data:  # remove completion tag
+            trailing = (data & -data).bit_length()
+            data >>= trailing
+            bits -= trailing
+        pos += data_len
+        refs = [int.from_bytes(boc[pos + i * size:pos + (i + 1) * size], 'big') for i in range(d1 & 7)]
+        return _CellData(data, bits, refs)
+
+
+def _skip_acc_status_change(cell: _CellData):
+    if cell.read_bit():  # acst_frozen$10, acst_deleted$11
+        cell.read_uint(1)
+
+
+def _skip_storage_phase(cell: _CellData):
+    cell.read_var_uint(4)  # storage_fees_collected:Grams
+    if cell.read_bit():
+        cell.read_var_uint(4)  # storage_fees_due:(Maybe Grams)
+    _skip_acc_status_change(cell)
+
+
+def _skip_credit_phase(cell: _CellData):
+    if cell.read_bit():
+        cell.read_var_uint(4)  # due_fees_collected:(Maybe Grams)
+    cell.read_var_uint(4)  # credit:CurrencyCollection
+    if cell.read_bit():
+        cell.read_ref()  # extra currencies
+
+
+def _compute_phase_failed(boc: Boc, cell: _CellData) -> bool:
+    if not cell.read_bit():  # tr_phase_compute_skipped$0
+        # cskip_no_state$00, cskip_bad_state$01, cskip_no_gas$10, cskip_suspended$110
+        if cell.read_uint(2) == 0b11 and cell.read_bit():
+            raise ValueError('invalid compute skip reason')
+        return False
+    cell.read_uint(3)  # success, msg_state_used, account_activated
+    cell.read_var_uint(4)  # gas_fees
+    vm = boc.cell(cell.read_ref())
+    vm.read_var_uint(3)  # gas_used:(VarUInteger 7)
+    vm.read_var_uint(3)  # gas_limit:(VarUInteger 7)
+    if vm.read_bit():
+        vm.read_var_uint(2)  # gas_credit:(Maybe (VarUInteger 3))
+    vm.read_uint(8)  # mode
+    return vm.read_int(32) != 0  # exit_code
+
+
+def _action_phase_failed(boc: Boc, cell: _CellData) -> bool:
+    if not cell.read_bit():  # action:(Maybe ^TrActionPhase)
+        return False
+    action = boc.cell(cell.read_ref())
+    action.read_uint(3)  # success, valid, no_funds
+    _skip_acc_status_change(action)
+    for _ in range(2):  # total_fwd_fees, total_action_fees
+        if action.read_bit():
+            action.read_var_uint(4)
+    return action.read_int(32) != 0  # result_code
+
+
+def parse_transaction_status(boc: bytes) -> bool:
+    """
+    True if compute phase (if it was executed) and action phase (if any) have returned zero code.
+    """
+    boc = Boc(boc)
+    root = boc.cell(boc.roots[0])
+    if root.read_uint(4) != 0b0111:
+        raise ValueError('not a transaction')
+    description = boc.cell(root.refs[-1])
+    if description.read_uint(3) == 0b001:  # trans_tick_tock$001
+        description.read_uint(1)  # is_tock
+        _skip_storage_phase(description)
+    else:
+        description.pos = 0
+        prefix = description.read_uint(4)
+        if prefix == 0b0000:  # trans_ord
+            description.read_uint(1)  # credit_first
+            if description.read_bit():
+                _skip_storage_phase(description)
+            if description.read_bit():
+                _skip_credit_phase(description)
+        elif prefix == 0b0100:  # trans_split_prepare
+            description.read_uint(524)  # split_info
+            if description.read_bit():
+                _skip_storage_phase(description)
+        elif prefix == 0b0111:  # trans_merge_install
+            description.read_uint(524)  # split_info
+            description.read_ref()  # prepare_transaction
+            if description.read_bit():
+                _skip_storage_phase(description)
+            if description.read_bit():
+                _skip_credit_phase(description)
+        else:  # trans_storage, trans_split_install, trans_merge_prepare have no compute and action phases
+            return True
+    if _compute_phase_failed(boc, description):
+        return False
+    return not _action_phase_failed(boc, description)
+
+
+def decode_boc(tr_data: typing.Union[str, bytes]) -> bytes:
+    """
+    Accepts BOC as bytes, hex or base64 string.
+    """
+    if isinstance(tr_data, (bytes, bytearray)):
+        return bytes(tr_data)
+    if tr_data[:8].lower() == 'b5ee9c72':
+        return bytes.fromhex(tr_data)
+    return base64.b64decode(tr_data)
+
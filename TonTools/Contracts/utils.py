@@ -1,23 +1,45 @@
+import typing
+from concurrent.futures import ProcessPoolExecutor
+
 from tvm_valuetypes import deserialize_boc
 from pytonlib.utils.tlb import Transaction as PytonlibTransaction, Slice as PytonlibSlice
-from tonsdk.utils import b64str_to_bytes
+
+from .tlb import decode_boc, parse_transaction_status
 
 
 def transaction_status(tr_data: str):
     """
     return True if transaction was successful, False otherwise
     """
-    if is_hex(tr_data):
-        cell = deserialize_boc(bytes.fromhex(tr_data))
-    else:
-        cell = deserialize_boc(b64str_to_bytes(tr_data))
-    tr = PytonlibTransaction(PytonlibSlice(cell))
+    boc = decode_boc(tr_data)
+    try:
+        return parse_transaction_status(boc)
+    except (ValueError, IndexError):
+        pass  # full parser below reports what's wrong with the BOC
+    tr = PytonlibTransaction(PytonlibSlice(deserialize_boc(boc)))
     if not (tr.description.action and tr.description.action.result_code) and \
             not (tr.description.compute_ph.type == 'tr_phase_compute_vm' and tr.description.compute_ph.exit_code):
         return True
     return False
 
 
+def _transaction_statuses(tr_datas: typing.List[typing.Union[str, bytes]]) -> typing.List[bool]:
+    return [transaction_status(tr_data) for tr_data in tr_datas]
+
+
+def transaction_statuses(tr_datas: typing.Iterable[typing.Union[str, bytes]], processes: int = None,
+                         chunk_size: int = 1000) -> typing.List[bool]:
+    """
+    Statuses of many transactions (BOCs as bytes, hex or base64), in a pool of ``processes`` if specified.
+    """
+    tr_datas = list(tr_datas)
+    if not processes:
+        return _transaction_statuses(tr_datas)
+    chunks = [tr_datas[i:i + chunk_size] for i in range(0, len(tr_datas), chunk_size)]
+    with ProcessPoolExecutor(processes) as executor:
+        return [status for chunk in executor.map(_transaction_statuses, chunks) for status in chunk]
+
+
 def is_hex(string: str):
     try:
         int(string, 16)
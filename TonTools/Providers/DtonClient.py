@@ -1,9 +1,12 @@
 import asyncio
+import copy
+import itertools
 import logging
+import re
+import typing
 from datetime import datetime
 import base64
 import aiohttp
-import requests
 from graphql_query import Argument, Field, Operation, Query
 
 from tonsdk.utils import Address
@@ -13,12 +16,58 @@ from ..Contracts.NFT import NftItem, NftCollection
 from ..Contracts.Contract import Transaction
 from ..Contracts.Jetton import Jetton, JettonWallet
 from ..Enums.Address import AddressForm
+from .transport import HttpTransport
+from .address_codec import default_address_codec
+from .flow_control import make_rate_limiter, AdaptiveConcurrencyLimiter, RetryPolicy, CircuitBreaker, SingleFlight, deepcopy_except, prefetch, sliding_window
+from .derivation import JettonWalletCodeCache
+from .graphql_templates import compile_query, compile_batch, fields_key, args_shape, batch_shape
+
+
+_TRANSACTION_FIELDS = [
+    'gen_utime', 'total_fees_grams', 'hash', 'lt', 'compute_ph_success',
+    'action_ph_success', 'in_msg_created_lt', 'in_msg_src_addr_workchain_id',
+    'in_msg_src_addr_address_hex', 'in_msg_dest_addr_workchain_id', 'in_msg_dest_addr_address_hex',
+    'in_msg_value_grams', 'in_msg_body', 'in_msg_op_code', 'outmsg_cnt', 'out_msg_created_lt', 'out_msg_dest_addr_workchain_id',
+    'out_msg_dest_addr_address_hex', 'out_msg_value_grams', 'out_msg_body', 'out_msg_op_code'
+]
+
+_NFT_ITEM_FIELDS = [
+    'parsed_nft_index', 'parsed_nft_collection_address_workchain', 'parsed_nft_collection_address_address',
+    'parsed_nft_owner_address_workchain', 'parsed_nft_owner_address_address', 'parsed_owner_is_seller',
+    'parsed_nft_content_offchain_url'
+]
+
+_NFT_SALE_FIELDS = [
+    'parsed_seller_nft_prev_owner_address_workchain', 'parsed_seller_nft_prev_owner_address_address',
+    'parsed_seller_market_address_workchain', 'parsed_seller_market_address_address',
+    'parsed_seller_nft_price', 'parsed_seller_min_bid'
+]
+
+_JETTON_WALLET_FIELDS = [
+    'parsed_jetton_wallet_balance', 'parsed_jetton_wallet_owner_address_workchain',
+    'parsed_jetton_wallet_owner_address_address', 'parsed_jetton_wallet_jetton_address_workchain',
+    'parsed_jetton_wallet_jetton_address_address', 'account_state_state_init_code'
+]
+
+
+# GraphQL validation errors of variables: the inferred type doesn't match the schema
+_VARIABLE_ERROR = re.compile(r'variable|\$\w|expect(?:ed|ing) type|unknown type|invalid value|cannot represent', re.IGNORECASE)
+# limits on the size of a document which a batch of aliased sub-queries may exceed
+_BATCH_ERROR = re.compile(r'complex|depth|alias|too many|too large', re.IGNORECASE)
 
 
 class DtonError(BaseException):
     pass
 
 
+def _rejected(response: dict, *patterns: typing.Pattern) -> bool:
+    """
+    True if the query has failed validation with one of the errors matching ``patterns``.
+    """
+    return any(pattern.search(str(error.get('message', ''))) for error in response.get('errors') or []
+               for pattern in patterns if isinstance(error, dict))
+
+
 async def process_response(response: aiohttp.ClientResponse):
     try:
         response_dict: dict = await response.json()
@@ -34,9 +83,25 @@ class DtonClient:
                  key: str = None,  # dton api key
                  addresses_form: str = AddressForm.USER_FRIENDLY,
                  testnet=False,
-                 private_graphql=False
+                 private_graphql=False,
+                 pool_size: int = 100,  # max simultaneous http connections
+                 rps: float = None,  # max requests per second for all methods of the client, None for unlimited
+                 burst: int = None,  # max requests sent at once before rps applies, 1 by default
+                 max_retries: int = 5,  # retries of 429, 5xx responses and connection errors
+                 circuit_breaker: CircuitBreaker = None,  # fail fast while the backend keeps failing
+                 derive_jetton_wallets: bool = False,  # compute jetton wallet addresses locally for standard jettons
+                 batch_size: int = 50  # max sub-queries in one request of bulk methods
                  ):
         self.form = addresses_form
+        self.transport = HttpTransport(pool_size=pool_size,
+                                       rate_limiter=make_rate_limiter(rps, burst),
+                                       concurrency_limiter=AdaptiveConcurrencyLimiter(max_limit=pool_size or 1000),
+                                       retry_policy=RetryPolicy(max_retries=max_retries),
+                                       circuit_breaker=circuit_breaker)
+        self.single_flight = SingleFlight()
+        self.jetton_wallet_codes = JettonWalletCodeCache() if derive_jetton_wallets else None
+        self.literal_queries = set()  # templates whose variable types were rejected by the server
+        self.batch_size = batch_size
         if testnet:
             self.testnet = True
             self.base_url = 'https://testnet.dton.io/'
@@ -47,39 +112,65 @@ class DtonClient:
             self.base_url += 'graphql_private/'
         else:
             self.base_url += 'graphql/'
-        if key:
-            response = requests.get(url=self.base_url + f'login?token={key}')
-            if not response.json()['success']:
-                raise DtonError('invalid api token')
-            self.cookies = response.cookies.get_dict()  # get cookies for login
-        else:
-            self.cookies = {}
+        self.key = key
+        self.cookies = None if key else {}  # login cookies, None until init()
 
     def _process_address(self, address):
-        if self.form == AddressForm.RAW:
-            return Address(address).to_string(is_user_friendly=False)
-        elif self.form == AddressForm.USER_FRIENDLY:
-            if self.testnet:
-                return Address(address).to_string(True, True, True, True)
-            else:
-                return Address(address).to_string(True, True, True)
+        return default_address_codec.convert(address, self.form, self.testnet)
+
+    async def init(self):
+        """
+        Logs in with the api key. If it wasn't called, the client logs in before the first query.
+        """
+        if self.cookies is None:
+            await self.login()
+        return self
+
+    async def login(self):
+        await self.single_flight.do('login', self._login)
+
+    async def _login(self):
+        response = await self.transport.get(url=self.base_url + 'login', params={'token': self.key})
+        try:
+            success = (await response.json(content_type=None))['success']
+        except Exception:
+            raise DtonError(f'Failed to log in, status {response.status}')
+        if not success:
+            raise DtonError('invalid api token')
+        self.cookies = {name: morsel.value for name, morsel in response.cookies.items()}
+
+    async def close(self):
+        await self.transport.close()
+
+    async def __aenter__(self):
+        return await self.init()
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
 
     @staticmethod
     def get_friendly(address: str):
-        return Address(address).to_string(True, True, True)
+        return default_address_codec.convert(address, AddressForm.USER_FRIENDLY)
 
     def get_addr_from_wc_hex(self, wc: int, hex_: str):
-        return self._process_address(
-            Address(str(wc) + ':' + hex_).to_string()
-        )
+        return default_address_codec.from_wc_hex(wc, hex_, self.form, self.testnet)
 
     async def send_query(self, graphql_query: str, variables=None):
+        response = await self._post_query(graphql_query, variables)
+        return response['data']
+
+    async def _post_query(self, graphql_query: str, variables=None):
         if variables is None:
             variables = {}
-        async with aiohttp.ClientSession(cookies=self.cookies) as session:
-            response = await session.post(url=self.base_url, json={'query': graphql_query, 'variables': variables})
-            response = await process_response(response)
-            return response['data']
+        if self.cookies is None:
+            await self.init()
+        cookies = self.cookies
+        response = await self.transport.post(url=self.base_url, json={'query': graphql_query, 'variables': variables}, cookies=cookies)
+        if self.key and response.status in (401, 403):  # login cookie has expired
+            if self.cookies is cookies:  # not renewed by a concurrent query yet
+                await self.login()
+            response = await self.transport.post(url=self.base_url, json={'query': graphql_query, 'variables': variables}, cookies=self.cookies)
+        return await process_response(response)
 
     """
     low level part
@@ -120,6 +211,29 @@ class DtonClient:
         return result
 
     async def raw_send_query(self, table_name: str, fields: list, type='query', **kwargs):
+        """
+        Sends a query compiled once per table, fields and shape of arguments (see ``graphql_templates``),
+        argument values are passed as variables.
+        """
+        shape, variables = args_shape(kwargs)
+        key = (type, table_name, fields_key(fields), shape)
+        if variables and key not in self.literal_queries:
+            response = await self._post_query(compile_query(*key), variables)
+            if response.get('data') is not None:
+                return response['data'][table_name]
+            if not _rejected(response, _VARIABLE_ERROR):
+                raise DtonError(f'DTon failed to execute {table_name} query: {response.get("errors")}')
+            # variable types are inferred from python values, if the schema expects other ones
+            # the query is retried with inlined arguments
+            logging.info(f'DTon rejected variables of {table_name} query, arguments will be inlined')
+            self.literal_queries.add(key)
+            return await self.raw_send_literal_query(table_name, fields, type, **kwargs)
+        if not variables:
+            result = await self.send_query(compile_query(*key))
+            return result[table_name]
+        return await self.raw_send_literal_query(table_name, fields, type, **kwargs)
+
+    async def raw_send_literal_query(self, table_name: str, fields: list, type='query', **kwargs):
         result_args = self.process_args(kwargs)
         result_fields = self.process_fields(fields)
 
@@ -137,35 +251,91 @@ class DtonClient:
         result = await self.send_query(query)
         return result[table_name]
 
+    async def raw_send_batch(self, table_name: str, fields: list, args_list: typing.List[dict], type='query',
+                             batch_size: int = None):
+        """
+        Sends a query per arguments of ``args_list`` packing up to ``batch_size`` (client's ``batch_size`` by default)
+        of them into one request as aliased sub-queries. Returns results in order of ``args_list``.
+        """
+        batch_size = batch_size or self.batch_size
+        chunks = [args_list[i:i + batch_size] for i in range(0, len(args_list), batch_size)]
+        results = await asyncio.gather(*[self._send_batch(table_name, fields, chunk, type) for chunk in chunks])
+        return [result for chunk in results for result in chunk]
+
+    async def _send_batch(self, table_name: str, fields: list, args_list: typing.List[dict], type: str):
+        if len(args_list) == 1:
+            return [await self.raw_send_query(table_name, fields, type, **args_list[0])]
+        shapes, variables = batch_shape(args_list)
+        key = (type, table_name, fields_key(fields), shapes)
+        if key not in self.literal_queries:
+            response = await self._post_query(compile_batch(*key), variables)
+            if response.get('data') is not None:
+                return [response['data'][f'q{i}'] for i in range(len(args_list))]
+            if not _rejected(response, _VARIABLE_ERROR, _BATCH_ERROR):
+                raise DtonError(f'DTon failed to execute batched {table_name} query: {response.get("errors")}')
+            logging.info(f'DTon rejected batched {table_name} query, sub-queries will be sent separately')
+            self.literal_queries.add(key)
+        return await asyncio.gather(*[self.raw_send_query(table_name, fields, type, **args) for args in args_list])
+
     async def page_generator(self, table_name: str, fields: list, **kwargs):
         kwargs['page'] = 0
         while True:
             yield self.raw_send_query(table_name, fields, **kwargs)
             kwargs['page'] += 1
 
-    async def query_with_pagination(self, table_name: str, fields: list, **kwargs):
-        if 'limit' not in kwargs:
-            kwargs['limit'] = -1
-        if 'page_size' not in kwargs:
-            kwargs['page_size'] = 150
-        limit = kwargs.pop('limit')
-        if 'page' not in kwargs:
-            result = []
-            async for i in self.page_generator(table_name, fields, **kwargs):
-                resp = await i
+    async def iter_pages(self, table_name: str, fields: list, page_size: int = 150, pages_in_flight: int = 1,
+                         max_pages: int = None, **kwargs):
+        """
+        Yields pages of the query in order keeping ``pages_in_flight`` requests in flight,
+        stops after the first short page (requests for the pages after it are cancelled).
+        """
+        def fetch(page):
+            return self.raw_send_query(table_name, fields, page=page, page_size=page_size, **kwargs)
+
+        pages = range(max_pages) if max_pages is not None else itertools.count()
+        responses = sliding_window(fetch, pages, max(pages_in_flight, 1))
+        try:
+            async for _, resp in responses:
                 if isinstance(resp, dict) and 'data' in resp:
                     resp = resp['data']
-                result += resp
-                if len(result) >= limit != -1:
-                    return result[:limit]
-                if len(resp) < kwargs['page_size']:
-                    return result
+                yield resp
+                if len(resp) < page_size:
+                    return
+        finally:
+            await responses.aclose()
+
+    async def iter_query(self, table_name: str, fields: list, limit: int = -1, page_size: int = 150,
+                         pages_in_flight: int = 4, **kwargs):
+        """
+        Yields rows of the query while the next ``pages_in_flight`` pages are being downloaded.
+        """
+        max_pages = None if limit == -1 else -(-limit // page_size)
+        count = 0
+        pages = self.iter_pages(table_name, fields, page_size, pages_in_flight, max_pages, **kwargs)
+        try:
+            async for page in pages:
+                for row in page:
+                    if count == limit:
+                        return
+                    yield row
+                    count += 1
+        finally:
+            await pages.aclose()
+
+    async def query_with_pagination(self, table_name: str, fields: list, **kwargs):
+        """
+        Pass ``pages_in_flight`` to download several pages at once.
+        """
+        limit = kwargs.pop('limit', -1)
+        kwargs.setdefault('page_size', 150)
+        pages_in_flight = kwargs.pop('pages_in_flight', 1)
+        if 'page' not in kwargs:
+            return [row async for row in self.iter_query(table_name, fields, limit, pages_in_flight=pages_in_flight, **kwargs)]
+        result = await self.raw_send_query(table_name, fields, **kwargs)
+        if limit == -1:
+            return result
         else:
-            result = await self.raw_send_query(table_name, fields, **kwargs)
-            if limit == -1:
-                return result
-            else:
-                return result[:limit]
+            return result[:limit]
 
     async def raw_get_transactions(self, fields: list, **kwargs):
         if 'address' in kwargs and not is_hex(kwargs['address']):
@@ -200,6 +370,13 @@ class DtonClient:
         return await self.raw_send_query('run_method', fields, 'mutation', **kwargs)
 
     async def run_get_method(self, address: str, method: str, stack: list):
+        """
+        Concurrent calls with the same address, method and stack share one request.
+        """
+        key = SingleFlight.make_key('run_get_method', address, method, stack)
+        return await self.single_flight.do(key, lambda: self._run_get_method(address, method, stack), copy.deepcopy)
+
+    async def _run_get_method(self, address: str, method: str, stack: list):
         data = await self.raw_run_method(
             fields=['exit_code', 'gas_used', 'vm_steps', 'success', {'stack': ['value_type', 'value']}],
             account_search_by_address={'address_friendly': self.get_friendly(address)}, method_name=method, stack=stack
@@ -211,82 +388,124 @@ class DtonClient:
 
         return data['stack']
 
-    async def get_nft_items(self, nft_addresses: list):
-        # in future will be replaced for searchNFTs
-        return await asyncio.gather(*[self.get_nft_item(nft_address) for nft_address in nft_addresses])
+    def _last_transaction_args(self, address: str) -> dict:
+        return {'account': {'address_friendly': self.get_friendly(address)}, 'page': 0, 'page_size': 1}
 
-    async def get_nft_item(self, nft_address: str):
-        data = (await self.raw_get_transactions(["parsed_nft_index",
-                                                 'parsed_nft_collection_address_workchain',
-                                                 'parsed_nft_collection_address_address',
-                                                 'parsed_nft_owner_address_workchain',
-                                                 'parsed_nft_owner_address_address',
-                                                 'parsed_owner_is_seller',
-                                                 'parsed_nft_content_offchain_url'],
-                                                account={'address_friendly': self.get_friendly(nft_address)}, limit=1))[0]
-
-        col_addr = self.get_addr_from_wc_hex(data['parsed_nft_collection_address_workchain'], data['parsed_nft_collection_address_address'])
-        result = {
-            'address': self._process_address(nft_address),
-            'index': int(data['parsed_nft_index']),
-            'collection_address': col_addr,
-            'owner': self.get_addr_from_wc_hex(data['parsed_nft_owner_address_workchain'], data['parsed_nft_owner_address_address']),
-            'collection': {
-                'address': col_addr
-            },
-            'metadata': await get(data['parsed_nft_content_offchain_url']) if data['parsed_nft_content_offchain_url'] else {}
-        }
+    def _account_state_args(self, address: str) -> dict:
+        address = Address(address)
+        # same order as raw_get_account_states uses by default
+        return {'address': address.hash_part.hex().upper(), 'workchain': address.wc, 'order_by': 'gen_utime',
+                'page': 0, 'page_size': 1}
 
-        if data['parsed_owner_is_seller']:
-            sale = await self._get_nft_sale(result['owner'])
-            result['sale'] = sale
+    async def _first_rows(self, table_name: str, fields: list, args_list: typing.List[dict]) -> typing.List[typing.Optional[dict]]:
+        """
+        First row of every sub-query, None if dton has no rows for it (e.g. the account doesn't exist).
+        """
+        result = []
+        for resp in await self.raw_send_batch(table_name, fields, args_list):
+            if isinstance(resp, dict) and 'data' in resp:
+                resp = resp['data']
+            result.append(resp[0] if resp else None)
+        return result
 
-        return NftItem(result, provider=self)
+    @staticmethod
+    def _single(result: list, what: str, address: str):
+        if result[0] is None:
+            raise DtonError(f'dton has no {what} for {address}')
+        return result[0]
 
-    async def _get_nft_sale(self, owner_address: str):
+    async def get_nft_items(self, nft_addresses: list):
+        """
+        Items are requested in batches of ``batch_size`` addresses per request.
+        None is returned for addresses dton has no data for.
+        """
+        rows = await self._first_rows('transactions', _NFT_ITEM_FIELDS,
+                                      [self._last_transaction_args(address) for address in nft_addresses])
+        owners = [self.get_addr_from_wc_hex(data['parsed_nft_owner_address_workchain'], data['parsed_nft_owner_address_address'])
+                  if data is not None else None for data in rows]
+        on_sale = list(dict.fromkeys(owner for data, owner in zip(rows, owners) if data is not None and data['parsed_owner_is_seller']))
+        sales = dict(zip(on_sale, await self._get_nft_sales(on_sale))) if on_sale else {}
+
+        async def get_metadata(url):
+            return await get(url, self.transport) if url else {}
+
+        metadata = await asyncio.gather(*[get_metadata(data['parsed_nft_content_offchain_url'] if data is not None else None)
+                                          for data in rows])
+
+        items = []
+        for nft_address, data, owner, item_metadata in zip(nft_addresses, rows, owners, metadata):
+            if data is None:
+                items.append(None)
+                continue
+            col_addr = self.get_addr_from_wc_hex(data['parsed_nft_collection_address_workchain'], data['parsed_nft_collection_address_address'])
+            result = {
+                'address': self._process_address(nft_address),
+                'index': int(data['parsed_nft_index']),
+                'collection_address': col_addr,
+                'owner': owner,
+                'collection': {
+                    'address': col_addr
+                },
+                'metadata': item_metadata
+            }
+            if data['parsed_owner_is_seller'] and sales[owner] is not None:
+                result['sale'] = sales[owner]
+            items.append(NftItem(result, provider=self))
+        return items
 
-        data = (await self.raw_get_transactions(["parsed_seller_nft_prev_owner_address_workchain",
-                                                 "parsed_seller_nft_prev_owner_address_address",
-                                                 "parsed_seller_market_address_workchain",
-                                                 "parsed_seller_market_address_address",
-                                                 "parsed_seller_nft_price",
-                                                 "parsed_seller_min_bid"],
-                                                account={'address_friendly': self.get_friendly(owner_address)}, limit=1))[0]
+    async def get_nft_item(self, nft_address: str):
+        return self._single(await self.get_nft_items([nft_address]), 'NFT item', nft_address)
 
-        market_address = self.get_addr_from_wc_hex(data['parsed_seller_market_address_workchain'], data['parsed_seller_market_address_address'])
+    async def _get_nft_sale(self, owner_address: str):
+        return self._single(await self._get_nft_sales([owner_address]), 'sale', owner_address)
 
-        market_name = markets_adresses.get(Address(market_address).to_string(False), '')
+    async def _get_nft_sales(self, owner_addresses: list):
+        rows = await self._first_rows('transactions', _NFT_SALE_FIELDS,
+                                      [self._last_transaction_args(address) for address in owner_addresses])
+        result = []
+        for owner_address, data in zip(owner_addresses, rows):
+            if data is None:
+                result.append(None)
+                continue
+            market_address = self.get_addr_from_wc_hex(data['parsed_seller_market_address_workchain'], data['parsed_seller_market_address_address'])
 
-        real_owner = self.get_addr_from_wc_hex(data['parsed_seller_nft_prev_owner_address_workchain'], data['parsed_seller_nft_prev_owner_address_address'])
+            market_name = markets_adresses.get(Address(market_address).to_string(False), '')
 
-        data['price'] = int(data['parsed_seller_nft_price'])
-        data['min_bid'] = int(data['parsed_seller_min_bid'])
-        if not data['price']:
-            price = data['min_bid']
-        else:
-            price = data['price']
+            real_owner = self.get_addr_from_wc_hex(data['parsed_seller_nft_prev_owner_address_workchain'], data['parsed_seller_nft_prev_owner_address_address'])
 
-        return {
-            'address': self._process_address(owner_address),
-            'market': {
-                'address': market_address,
-                'name': market_name
-            },
-            'owner': real_owner,
-            'price': {
-                'token_name': 'TON',
-                'value': price,
-            }
-        }
+            data['price'] = int(data['parsed_seller_nft_price'])
+            data['min_bid'] = int(data['parsed_seller_min_bid'])
+            if not data['price']:
+                price = data['min_bid']
+            else:
+                price = data['price']
+
+            result.append({
+                'address': self._process_address(owner_address),
+                'market': {
+                    'address': market_address,
+                    'name': market_name
+                },
+                'owner': real_owner,
+                'price': {
+                    'token_name': 'TON',
+                    'value': price,
+                }
+            })
+        return result
 
     async def get_collection(self, collection_address: str):
+        key = SingleFlight.make_key('get_collection', collection_address)
+        return await self.single_flight.do(key, lambda: self._get_collection(collection_address), deepcopy_except(self))
+
+    async def _get_collection(self, collection_address: str):
         data = (await self.raw_get_transactions(["parsed_collection_items_count",
                                                  "parsed_collection_content_offchain_url",
                                                  "parsed_collection_owner_address_workchain",
                                                  "parsed_collection_owner_address_address"],
                                                 account={'address_friendly': self.get_friendly(collection_address)}, limit=1))[0]
 
-        collection_metadata = await get(data['parsed_collection_content_offchain_url']) if data['parsed_collection_content_offchain_url'] else {}
+        collection_metadata = await get(data['parsed_collection_content_offchain_url'], self.transport) if data['parsed_collection_content_offchain_url'] else {}
 
         owner_address = self.get_addr_from_wc_hex(data['parsed_collection_owner_address_workchain'], data['parsed_collection_owner_address_address'])
 
@@ -313,53 +532,73 @@ class DtonClient:
             result.append(NftItem(self._process_address(self.get_addr_from_wc_hex(item['workchain'], item['address'])), self))
         return result
 
-    async def get_transactions(self, address: str, limit: int = -1):
-        transactions = await self.raw_get_transactions(
-            fields=[
-                'gen_utime', 'total_fees_grams', 'hash', 'lt', 'compute_ph_success',
-                'action_ph_success', 'in_msg_created_lt', 'in_msg_src_addr_workchain_id',
-                'in_msg_src_addr_address_hex', 'in_msg_dest_addr_workchain_id', 'in_msg_dest_addr_address_hex',
-                'in_msg_value_grams', 'in_msg_body', 'in_msg_op_code', 'outmsg_cnt', 'out_msg_created_lt', 'out_msg_dest_addr_workchain_id',
-                'out_msg_dest_addr_address_hex', 'out_msg_value_grams', 'out_msg_body', 'out_msg_op_code'
-            ], account={'address_friendly': self.get_friendly(address)}
-        )
-        result = []
-        for tr in transactions:
-            temp = {
-                'utime': int(datetime.fromisoformat(tr['gen_utime'] + '+03:00').timestamp()),
-                'fee': tr['total_fees_grams'],
-                'data': None,
-                'hash': base64.b64encode(s=bytearray.fromhex(tr['hash'])).decode(),
-                'lt': int(tr['lt']),
-                'status': tr['compute_ph_success'] and tr['action_ph_success'],
-                'in_msg': {
-                    'created_lt': tr['in_msg_created_lt'],
-                    'source': self.get_addr_from_wc_hex(tr['in_msg_src_addr_workchain_id'], tr['in_msg_src_addr_address_hex']) if tr[
-                                                                                                  'in_msg_src_addr_workchain_id'] is not None else '',
-                    'destination': self.get_addr_from_wc_hex(tr['in_msg_dest_addr_workchain_id'], tr['in_msg_dest_addr_address_hex']) if tr['in_msg_dest_addr_workchain_id'] is not None else '',
-                    'value': tr['in_msg_value_grams'],
-                    'msg_data': tr['in_msg_body'],
-                    'op_code': hex(int(tr['in_msg_op_code'])).replace('0x', '') if tr['in_msg_op_code'] is not None else ''
-                },
-                'out_msgs': [
-                    {
-                        'created_lt': tr['out_msg_created_lt'][i],
-                        'source': self._process_address(address),
-                        'destination': self.get_addr_from_wc_hex(tr['out_msg_dest_addr_workchain_id'][i], tr['out_msg_dest_addr_address_hex'][i]) if
-                        tr['out_msg_dest_addr_workchain_id'][i] is not None else '',
-                        'value': tr['out_msg_value_grams'][i],
-                        'msg_data': tr['out_msg_body'][i],
-                        'op_code': hex(int(tr['out_msg_op_code'][i])).replace('0x', '') if tr['out_msg_op_code'][i] is not None else ''
-                    }
-                    for i in range(tr['outmsg_cnt'])
-                ]
-            }
-            result.append(Transaction(temp))
-        if limit == -1:
-            return result
-        return result[:limit]
+    async def get_transactions(self, address: str, limit: int = -1, limit_per_one_request: int = 150):
+        limit = None if limit == -1 else limit
+        return [tr async for tr in self.iter_transactions(address, limit, limit_per_one_request=limit_per_one_request)]
+
+    async def iter_transactions(self, address: str, limit: int = None, from_lt: int = None, from_hash: str = None,
+                                to_lt: int = 0, limit_per_one_request: int = 150):
+        """
+        Yields transactions from newest to oldest, starting with ``from_lt`` (inclusive, latest by default)
+        down to ``to_lt`` (exclusive). The next page is fetched while the current one is consumed.
+        ``from_hash`` isn't needed by dton and is ignored.
+        """
+        count = 0
+        async for page in prefetch(self._transaction_pages(address, from_lt, to_lt, limit_per_one_request)):
+            for tr in page:
+                if limit is not None and count >= limit:
+                    return
+                yield self._parse_transaction(address, tr)
+                count += 1
+
+    async def _transaction_pages(self, address: str, from_lt: int = None, to_lt: int = 0, limit_per_one_request: int = 150):
+        kwargs = {'account': {'address_friendly': self.get_friendly(address)}, 'page_size': limit_per_one_request}
+        if from_lt is not None:
+            kwargs['lt_lt'] = str(from_lt + 1)
+        if to_lt:
+            kwargs['lt_gt'] = str(to_lt)
+        async for page in self.page_generator('transactions', _TRANSACTION_FIELDS, **kwargs):
+            transactions = await page
+            yield transactions
+            if len(transactions) < limit_per_one_request:
+                return
+
+    def _parse_transaction(self, address: str, tr: dict) -> Transaction:
+        return Transaction({
+            'utime': int(datetime.fromisoformat(tr['gen_utime'] + '+03:00').timestamp()),
+            'fee': tr['total_fees_grams'],
+            'data': None,
+            'hash': base64.b64encode(s=bytearray.fromhex(tr['hash'])).decode(),
+            'lt': int(tr['lt']),
+            'status': tr['compute_ph_success'] and tr['action_ph_success'],
+            'in_msg': {
+                'created_lt': tr['in_msg_created_lt'],
+                'source': self.get_addr_from_wc_hex(tr['in_msg_src_addr_workchain_id'], tr['in_msg_src_addr_address_hex']) if tr[
+                                                                                              'in_msg_src_addr_workchain_id'] is not None else '',
+                'destination': self.get_addr_from_wc_hex(tr['in_msg_dest_addr_workchain_id'], tr['in_msg_dest_addr_address_hex']) if tr['in_msg_dest_addr_workchain_id'] is not None else '',
+                'value': tr['in_msg_value_grams'],
+                'msg_data': tr['in_msg_body'],
+                'op_code': hex(int(tr['in_msg_op_code'])).replace('0x', '') if tr['in_msg_op_code'] is not None else ''
+            },
+            'out_msgs': [
+                {
+                    'created_lt': tr['out_msg_created_lt'][i],
+                    'source': self._process_address(address),
+                    'destination': self.get_addr_from_wc_hex(tr['out_msg_dest_addr_workchain_id'][i], tr['out_msg_dest_addr_address_hex'][i]) if
+                    tr['out_msg_dest_addr_workchain_id'][i] is not None else '',
+                    'value': tr['out_msg_value_grams'][i],
+                    'msg_data': tr['out_msg_body'][i],
+                    'op_code': hex(int(tr['out_msg_op_code'][i])).replace('0x', '') if tr['out_msg_op_code'][i] is not None else ''
+                }
+                for i in range(tr['outmsg_cnt'])
+            ]
+        })
 
     async def get_jetton_data(self, jetton_master_address: str):
+        key = SingleFlight.make_key('get_jetton_data', jetton_master_address)
+        return await self.single_flight.do(key, lambda: self._get_jetton_data(jetton_master_address), deepcopy_except(self))
+
+    async def _get_jetton_data(self, jetton_master_address: str):
         data = (await self.raw_get_transactions(
             fields=[
                 'parsed_jetton_total_supply', 'parsed_jetton_content_offchain_url',
@@ -370,7 +609,7 @@ class DtonClient:
         ))[0]
 
         if data['parsed_jetton_content_offchain_url'] is not None:
-            result = await get(data['parsed_jetton_content_offchain_url'])
+            result = await get(data['parsed_jetton_content_offchain_url'], self.transport)
         else:
             result = {
                 'name': data['parsed_jetton_content_name_value'],
@@ -393,18 +632,20 @@ class DtonClient:
         return int(data[0]['value'])
 
     async def get_balance(self, address: str):
-        data = (await self.raw_get_account_states(['account_storage_balance_grams'],
-                                                  address=Address(address).hash_part.hex().upper(),
-                                                  workchain=Address(address).wc))[0]
+        return self._single(await self.get_balances([address]), 'account state', address)
 
-        return int(data['account_storage_balance_grams'])
+    async def get_balances(self, addresses: list):
+        rows = await self._first_rows('account_states', ['account_storage_balance_grams'],
+                                      [self._account_state_args(address) for address in addresses])
+        return [int(data['account_storage_balance_grams']) if data is not None else None for data in rows]
 
     async def get_state(self, address: str):
-        data = (await self.raw_get_account_states(['account_state_type'],
-                                                  address=Address(address).hash_part.hex().upper(),
-                                                  workchain=Address(address).wc))[0]
+        return self._single(await self.get_states([address]), 'account state', address)
 
-        return data['account_state_type']
+    async def get_states(self, addresses: list):
+        rows = await self._first_rows('account_states', ['account_state_type'],
+                                      [self._account_state_args(address) for address in addresses])
+        return [data['account_state_type'] if data is not None else None for data in rows]
 
     async def get_all_jetton_wallets_by_owner(self, owner_address: str):
         data = await self.raw_get_account_states(
@@ -423,24 +664,37 @@ class DtonClient:
         return result
 
     async def get_jetton_wallet_address(self, jetton_master_address: str, owner_address: str):
+        if self.jetton_wallet_codes is not None:
+            return self._process_address(await self.jetton_wallet_codes.get_address(self, jetton_master_address, owner_address))
+        return await self._get_jetton_wallet_address(jetton_master_address, owner_address)
 
+    async def _get_jetton_wallet_address(self, jetton_master_address: str, owner_address: str):
         addr = await self.raw_send_query('getJettonWalletAddress', [], minter_address=jetton_master_address, user_address=owner_address)
 
         return self._process_address(addr)
 
+    async def _get_jetton_wallet_code(self, jetton_master_address: str):
+        data = await self.run_get_method(method='get_jetton_data', address=jetton_master_address, stack=[])
+        code = data[4]['value']
+        return bytes.fromhex(code) if is_hex(code) else base64.b64decode(code)
+
     async def get_jetton_wallet(self, jetton_wallet_address: str):
-        data = (await self.raw_get_account_states([
-                            'parsed_jetton_wallet_balance', 'parsed_jetton_wallet_owner_address_workchain',
-                            'parsed_jetton_wallet_owner_address_address', 'parsed_jetton_wallet_jetton_address_workchain',
-                            'parsed_jetton_wallet_jetton_address_address', 'account_state_state_init_code'],
-                            address=Address(jetton_wallet_address).hash_part.hex().upper(),
-                            workchain=Address(jetton_wallet_address).wc))[0]
-
-        wallet = {
-            'address': self._process_address(jetton_wallet_address),
-            'balance': int(data['parsed_jetton_wallet_balance']),
-            'owner': self.get_addr_from_wc_hex(data['parsed_jetton_wallet_owner_address_workchain'], data['parsed_jetton_wallet_owner_address_address']),
-            'jetton_master_address': self.get_addr_from_wc_hex(data['parsed_jetton_wallet_jetton_address_workchain'], data['parsed_jetton_wallet_jetton_address_address']),
-            'jetton_wallet_code': data['account_state_state_init_code'],
-        }
-        return JettonWallet(wallet, self)
+        return self._single(await self.get_jetton_wallets([jetton_wallet_address]), 'jetton wallet', jetton_wallet_address)
+
+    async def get_jetton_wallets(self, jetton_wallet_addresses: list):
+        rows = await self._first_rows('account_states', _JETTON_WALLET_FIELDS,
+                                      [self._account_state_args(address) for address in jetton_wallet_addresses])
+        result = []
+        for jetton_wallet_address, data in zip(jetton_wallet_addresses, rows):
+            if data is None:
+                result.append(None)
+                continue
+            wallet = {
+                'address': self._process_address(jetton_wallet_address),
+                'balance': int(data['parsed_jetton_wallet_balance']),
+                'owner': self.get_addr_from_wc_hex(data['parsed_jetton_wallet_owner_address_workchain'], data['parsed_jetton_wallet_owner_address_address']),
+                'jetton_master_address': self.get_addr_from_wc_hex(data['parsed_jetton_wallet_jetton_address_workchain'], data['parsed_jetton_wallet_jetton_address_address']),
+                'jetton_wallet_code': data['account_state_state_init_code'],
+            }
+            result.append(JettonWallet(wallet, self))
+        return result
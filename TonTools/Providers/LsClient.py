@@ -1,17 +1,18 @@
+import copy
 import logging
 import typing
 import asyncio
 import random
-from math import ceil
 from pathlib import Path
 
 import aiohttp
 import base64
-import requests
 from tonsdk.boc import Cell
 from ton.utils.cell import read_address
 from tonsdk.utils import Address, bytes_to_b64str, b64str_to_bytes
 from ton import TonlibClient
+from ton.tl.functions import Raw_GetTransactions
+from ton.tl.types import Internal_TransactionId
 
 from ..Contracts.NFT import NftItem, NftCollection
 from ..Contracts.Contract import Transaction
@@ -19,7 +20,11 @@ from ..Contracts.Wallet import Wallet
 from ..Contracts.Jetton import Jetton, JettonWallet
 from ..Enums.Address import AddressForm
 from ..Enums.Exception import TVMExitCode
-from .utils import markets_adresses, get, process_jetton_data
+from .utils import markets_adresses, get_content, get_jetton_content, load_config
+from .derivation import JettonWalletCodeCache, parse_nft_item_code, prepare_nft_item_derivation, derive_nft_item_addresses
+from .address_codec import default_address_codec
+from .flow_control import SingleFlight, deepcopy_except, sliding_window, prefetch
+from .account_cache import AccountHandleCache
 
 
 class LsClientError(BaseException):
@@ -49,7 +54,10 @@ class LsClient(TonlibClient):
                  workchain_id: int = 0,
                  verbosity_level=0,
                  default_timeout=10,
-                 addresses_form: str = AddressForm.USER_FRIENDLY
+                 addresses_form: str = AddressForm.USER_FRIENDLY,
+                 derive_jetton_wallets: bool = False,  # compute jetton wallet addresses locally for standard jettons
+                 account_cache_size: int = 1000,  # account handles reused within a masterchain block, 0 to disable
+                 masterchain_seqno_ttl: float = 1  # seconds the last known masterchain seqno is trusted by the cache
                  ):
         if not cdll_path:
             logging.warning('You should provide a path to the tonlibjson library (.dll|.so|.dylib).\n'
@@ -61,37 +69,66 @@ class LsClient(TonlibClient):
             cdll_path = str(cdll_path)
         self.cdll_path = cdll_path
         self.form = addresses_form
+        self.single_flight = SingleFlight()
+        self.jetton_wallet_codes = JettonWalletCodeCache() if derive_jetton_wallets else None
+        self.accounts = AccountHandleCache(self, account_cache_size, masterchain_seqno_ttl)
         super().__init__(ls_index, config, keystore, workchain_id, verbosity_level, default_timeout)
         TonlibClient.enable_unaudited_binaries()
 
     async def init(self):
+        self.config = await load_config(self.config)  # init_tonlib would download it with blocking requests
         if self.ls_index is None:
-            if isinstance(self.config, str):
-                # noinspection HttpUrlsUsage
-                if self.config.find('http://') == 0 or self.config.find('https://') == 0:
-                    self.config: dict = requests.get(self.config).json()
             self.ls_index = random.randrange(0, len(self.config['liteservers']))
         return await super().init_tonlib(self.cdll_path)
 
     def _process_address(self, address):
-        if self.form == AddressForm.USER_FRIENDLY:
-            return Address(address).to_string(True, True, True)
-        elif self.form == AddressForm.RAW:
-            return Address(address).to_string(is_user_friendly=False)
+        return default_address_codec.convert(address, self.form)
+
+    async def get_masterchain_seqno(self) -> int:
+        result = await self.execute({'@type': 'blocks.getMasterchainInfo'})
+        return result.last.seqno
+
+    async def close(self):
+        """
+        Stops tonlib of the client.
+        """
+        self.accounts.clear()
+        wrapper = getattr(self, 'tonlib_wrapper', None)
+        if wrapper is not None:
+            await wrapper.close()
 
     async def run_get_method(self, method: str, address: str, stack: list):
-        account = await self.find_account(address, preload_state=False)
+        """
+        Concurrent calls with the same address, method and stack share one request.
+        """
+        key = SingleFlight.make_key('run_get_method', address, method, stack)
+        return await self.single_flight.do(key, lambda: self._run_get_method(method, address, stack), copy.deepcopy)
+
+    async def _run_get_method(self, method: str, address: str, stack: list, fresh: bool = False):
+        account = await self.accounts.get_smc(address, fresh)
         response = await account.run_get_method(method=method, stack=stack)
+        return self._get_method_result(method, address, response)
 
+    @staticmethod
+    def _get_method_result(method: str, address: str, response):
         if response.exit_code != 0:
             logging.error(f'Failed to run method {method} on {address}. Exit code: {response.exit_code}')
             raise GetMethodError(response.exit_code)
         return response.stack
 
+    async def run_get_methods(self, address: str, methods: typing.List[typing.Tuple[str, list]]) -> list:
+        """
+        Runs several get-methods ``[(method, stack), ...]`` against one loaded state of the account,
+        returns their stacks in the same order.
+        """
+        account = await self.accounts.get_smc(address)
+        responses = await asyncio.gather(*[account.run_get_method(method=method, stack=stack) for method, stack in methods])
+        return [self._get_method_result(method, address, response) for (method, _), response in zip(methods, responses)]
+
     async def get_nft_owner(self, nft_address: str):
-        sale = await self._get_nft_sale(nft_address)
+        data = await self.run_get_method(method='get_nft_data', address=nft_address, stack=[])
+        sale = await self._get_nft_sale(nft_address, data)
         if not sale:
-            data = await self.run_get_method(method='get_nft_data', address=nft_address, stack=[])
             owner_address = read_address(Cell.one_from_boc(base64.b64decode(data[3].cell.bytes))).to_string()
         else:
             owner_address = sale['owner']
@@ -127,20 +164,17 @@ class LsClient(TonlibClient):
                 }
             }]
         content_data = await self.run_get_method(method='get_nft_content', address=result['collection_address'], stack=request_stack)
-        collection_content_url = Cell.one_from_boc(base64.b64decode(content_data[0].cell.bytes)).bits.get_top_upped_array().decode().split('\x01')[-1]
-        nft_content_url = collection_content_url + Cell.one_from_boc(base64.b64decode(content_data[0].cell.bytes)).refs[0].bits.get_top_upped_array().decode()
+        result['metadata'] = await get_content(content_data[0].cell.bytes)
 
-        result['metadata'] = await get(nft_content_url)
-
-        sale = await self._get_nft_sale(nft_address)
+        sale = await self._get_nft_sale(nft_address, data)
         if not sale:
             return NftItem(result, provider=self)
         else:
             result['sale'] = sale
             return NftItem(result, provider=self)
 
-    async def _get_nft_sale(self, nft_address: str):
-        data = await self.run_get_method(method='get_nft_data', address=nft_address, stack=[])
+    async def _get_nft_sale(self, nft_address: str, nft_data: list = None):
+        data = nft_data or await self.run_get_method(method='get_nft_data', address=nft_address, stack=[])
         owner_address = self._process_address(read_address(Cell.one_from_boc(base64.b64decode(data[3].cell.bytes))).to_string())
         try:
             data = await self.run_get_method(method='get_sale_data', address=owner_address, stack=[])
@@ -203,11 +237,12 @@ class LsClient(TonlibClient):
             }
 
     async def get_collection(self, collection_address):
+        key = SingleFlight.make_key('get_collection', collection_address)
+        return await self.single_flight.do(key, lambda: self._get_collection(collection_address), deepcopy_except(self))
+
+    async def _get_collection(self, collection_address):
         data = await self.run_get_method(method='get_collection_data', address=collection_address, stack=[])
-        collection_content_url = Cell.one_from_boc(base64.b64decode(data[1].cell.bytes)).bits.get_top_upped_array().decode().split('\x01')[-1]
-        # if '\x01' in collection_content_url:
-        #     collection_content_url = collection_content_url.split('\x01')[1]
-        collection_metadata = await get(collection_content_url)
+        collection_metadata = await get_content(data[1].cell.bytes)
         result = {
             'address': self._process_address(collection_address),
             'next_item_index': int(data[0].number.number),
@@ -219,42 +254,108 @@ class LsClient(TonlibClient):
     async def get_collection_items(self, collection: NftCollection, limit_per_one_request=0):
         if not collection.is_full():
             await collection.update()
-        if not limit_per_one_request:
-            items = await asyncio.gather(*[self.run_get_method(address=collection.address, method='get_nft_address_by_index', stack=[{"@type": "tvm.stackEntryNumber", "number": {"@type": "tvm.numberDecimal", "number": str(i)}}]) for i in range(collection.next_item_index)])
-        else:
-            items = []
-            for p in range(ceil(collection.next_item_index / limit_per_one_request)):
-                items += await asyncio.gather(*[self.run_get_method(address=collection.address, method='get_nft_address_by_index', stack=[{"@type": "tvm.stackEntryNumber", "number": {"@type": "tvm.numberDecimal", "number": str(i)}}]) for i in range(p * limit_per_one_request, min(collection.next_item_index, limit_per_one_request * (p + 1)))])
-
-        result = []
-        for data in items:
-            result.append(NftItem(self._process_address(read_address(Cell.one_from_boc(base64.b64decode(data[0].cell.bytes)))), self))
-        return result
+        window = limit_per_one_request or collection.next_item_index
+        return [item async for item in self.iter_collection_items(collection, window=window)]
+
+    async def iter_collection_items(self, collection: NftCollection, start_index: int = 0, stop_index: int = None,
+                                    window: int = 100, ordered: bool = True, derive_addresses: bool = False,
+                                    processes: int = None):
+        """
+        Yields NftItem (with ``index`` attribute) for every index in [start_index, stop_index) keeping ``window``
+        get-method calls in flight. Pass ``start_index`` to resume an interrupted crawl.
+        With ``derive_addresses`` item addresses of standard collections are computed locally from the collection's
+        item code (in a pool of ``processes`` if specified) instead of calling get_nft_address_by_index for every index.
+        """
+        if stop_index is None:
+            if not collection.is_full():
+                await collection.update()
+            stop_index = collection.next_item_index
+        if derive_addresses:
+            try:
+                code = await prepare_nft_item_derivation(self, collection.address, start_index, stop_index)
+            except ValueError as e:
+                logging.warning(f'{e}, falling back to get-methods')
+            else:
+                async for index, address in derive_nft_item_addresses(code, collection.address, start_index, stop_index, processes):
+                    item = NftItem(self._process_address(address), self)
+                    item.index = index
+                    yield item
+                return
+        async for index, address in sliding_window(lambda i: self._get_nft_address_by_index(collection.address, i),
+                                                   range(start_index, stop_index), max(1, window), ordered):
+            item = NftItem(address, self)
+            item.index = index
+            yield item
+
+    async def _get_nft_address_by_index(self, collection_address: str, index: int):
+        stack = [{"@type": "tvm.stackEntryNumber", "number": {"@type": "tvm.numberDecimal", "number": str(index)}}]
+        data = await self.run_get_method(address=collection_address, method='get_nft_address_by_index', stack=stack)
+        return self._process_address(read_address(Cell.one_from_boc(base64.b64decode(data[0].cell.bytes))))
+
+    async def _get_nft_item_code(self, collection_address: str):
+        state = (await self.accounts.get_state(collection_address)).to_json()
+        return parse_nft_item_code(base64.b64decode(state['data']))
 
     async def get_transactions(self, address: str, limit: int = 10**9, limit_per_one_request: int = 100):
-        account = await self.find_account(address)
-        # ton lib method does all the work of getting the required tx amount in a loop
-        transactions = map(lambda x: x.to_json(), await account.get_transactions(limit=limit))
-        result = []
-        for tr in transactions:
-            tr['hash'] = tr['transaction_id']['hash']
-            tr['lt'] = tr['transaction_id']['lt']
-            tr['in_msg']['source'] = self._process_address(tr['in_msg']['source']['account_address']) if tr['in_msg']['source']['account_address'] else ''
-            tr['in_msg']['destination'] = self._process_address(tr['in_msg']['destination']['account_address']) if tr['in_msg']['destination']['account_address'] else ''
-            tr['in_msg']['msg_data'] = tr['in_msg']['msg_data']['text'] if 'text' in tr['in_msg']['msg_data'] else tr['in_msg']['msg_data']['body']
-            out_msgs = tr['out_msgs']
-            for out_msg in out_msgs:
-                out_msg['source'] = self._process_address(out_msg['source']['account_address']) if out_msg['source']['account_address'] else ''
-                out_msg['destination'] = self._process_address(out_msg['destination']['account_address']) if out_msg['destination']['account_address'] else ''
-                out_msg['msg_data'] = out_msg['msg_data']['text'] if 'text' in out_msg['msg_data'] else out_msg['msg_data']['body']
-            tr['out_msgs'] = out_msgs
-            result.append(Transaction(tr))
-        return result[:limit]
+        return [tr async for tr in self.iter_transactions(address, limit)]
+
+    async def iter_transactions(self, address: str, limit: int = None, from_lt: int = None, from_hash: str = None,
+                                to_lt: int = 0, limit_per_one_request: int = None):
+        """
+        Yields transactions from newest to oldest, starting with ``from_lt`` (inclusive, latest by default)
+        down to ``to_lt`` (exclusive). The next page is fetched while the current one is consumed.
+        Page size is defined by the liteserver, ``limit_per_one_request`` is ignored.
+        ``from_lt`` without ``from_hash`` is supported, but history above it is still walked.
+        """
+        count = 0
+        async for page in prefetch(self._transaction_pages(address, from_lt, from_hash, to_lt)):
+            for tr in page:
+                if limit is not None and count >= limit:
+                    return
+                if from_lt is not None and int(tr.transaction_id.lt) > from_lt:
+                    continue
+                yield self._parse_transaction(tr.to_json())
+                count += 1
+
+    async def _transaction_pages(self, address: str, from_lt: int = None, from_hash: str = None, to_lt: int = 0):
+        account = await self.accounts.get(address)
+        if from_lt is None or from_hash is None:
+            state = await self.accounts.get_state(address)
+            current = state.last_transaction_id
+        else:
+            current = Internal_TransactionId(from_lt, from_hash)
+        while current is not None and int(current.lt) != 0:
+            response = await self.tonlib_wrapper.execute(Raw_GetTransactions(account.account_address, current))
+            transactions = []
+            for tr in response.transactions:
+                if int(tr.transaction_id.lt) <= to_lt:
+                    yield transactions
+                    return
+                transactions.append(tr)
+            yield transactions
+            current = response.__dict__.get('previous_transaction_id', None)
+
+    def _parse_transaction(self, tr: dict) -> Transaction:
+        tr['hash'] = tr['transaction_id']['hash']
+        tr['lt'] = tr['transaction_id']['lt']
+        tr['in_msg']['source'] = self._process_address(tr['in_msg']['source']['account_address']) if tr['in_msg']['source']['account_address'] else ''
+        tr['in_msg']['destination'] = self._process_address(tr['in_msg']['destination']['account_address']) if tr['in_msg']['destination']['account_address'] else ''
+        tr['in_msg']['msg_data'] = tr['in_msg']['msg_data']['text'] if 'text' in tr['in_msg']['msg_data'] else tr['in_msg']['msg_data']['body']
+        out_msgs = tr['out_msgs']
+        for out_msg in out_msgs:
+            out_msg['source'] = self._process_address(out_msg['source']['account_address']) if out_msg['source']['account_address'] else ''
+            out_msg['destination'] = self._process_address(out_msg['destination']['account_address']) if out_msg['destination']['account_address'] else ''
+            out_msg['msg_data'] = out_msg['msg_data']['text'] if 'text' in out_msg['msg_data'] else out_msg['msg_data']['body']
+        tr['out_msgs'] = out_msgs
+        return Transaction(tr)
 
     async def get_jetton_data(self, jetton_master_address: str):
+        key = SingleFlight.make_key('get_jetton_data', jetton_master_address)
+        return await self.single_flight.do(key, lambda: self._get_jetton_data(jetton_master_address), deepcopy_except(self))
+
+    async def _get_jetton_data(self, jetton_master_address: str):
         data = await self.run_get_method(method='get_jetton_data', address=jetton_master_address, stack=[])
-        processed = process_jetton_data(data[3].cell.bytes)
-        result = processed if isinstance(processed, dict) else await get(processed)
+        result = await get_jetton_content(data[3].cell.bytes)
         result['address'] = self._process_address(jetton_master_address)
         result['supply'] = int(data[0].number.number)
 
@@ -264,21 +365,24 @@ class LsClient(TonlibClient):
         response = await super().send_boc(b64str_to_bytes(boc))
         return response
 
-    async def get_wallet_seqno(self, address: str):
-        data = await self.run_get_method(address=address, method='seqno', stack=[])
+    async def get_wallet_seqno(self, address: str, fresh: bool = True):
+        """
+        With ``fresh`` (default) the cached account handle isn't used, so the seqno is up to date right after a transfer.
+        """
+        data = await self._run_get_method('seqno', address, [], fresh)
         return int(data[0].number.number)
 
-    async def get_balance(self, address: str):
-        account = await self.find_account(address)
-        balance = await account.get_balance()
+    async def get_balance(self, address: str, fresh: bool = True):
+        """
+        With ``fresh`` (default) the cached account handle isn't used.
+        """
+        balance = int((await self.accounts.get_state(address, fresh)).balance)
         if balance == -1:
             return 0
         return int(balance)
 
     async def get_state(self, address: str):
-        account = await self.find_account(address)
-        state = await account.get_state()
-        state = state.to_json()
+        state = (await self.accounts.get_state(address)).to_json()
         if state['frozen_hash']:
             return 'frozen'
         if not state['data']:
@@ -287,6 +391,11 @@ class LsClient(TonlibClient):
             return 'active'
 
     async def get_jetton_wallet_address(self, jetton_master_address: str, owner_address: str):
+        if self.jetton_wallet_codes is not None:
+            return self._process_address(await self.jetton_wallet_codes.get_address(self, jetton_master_address, owner_address))
+        return await self._get_jetton_wallet_address(jetton_master_address, owner_address)
+
+    async def _get_jetton_wallet_address(self, jetton_master_address: str, owner_address: str):
         cell = Cell()
         cell.bits.write_address(Address(owner_address))
         request_stack = [
@@ -301,6 +410,10 @@ class LsClient(TonlibClient):
         jetton_wallet_address = self._process_address(read_address(Cell.one_from_boc(base64.b64decode(data[0].slice.bytes))).to_string())
         return jetton_wallet_address
 
+    async def _get_jetton_wallet_code(self, jetton_master_address: str):
+        data = await self.run_get_method(method='get_jetton_data', address=jetton_master_address, stack=[])
+        return base64.b64decode(data[4].cell.bytes)
+
     async def get_jetton_wallet(self, jetton_wallet_address: str):
         data = await self.run_get_method(address=jetton_wallet_address, method='get_wallet_data', stack=[])
         wallet = {
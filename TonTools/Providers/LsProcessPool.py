@@ -0,0 +1,528 @@
+import asyncio
+import io
+import itertools
+import logging
+import multiprocessing
+import os
+import pickle
+import random
+import threading
+import typing
+from pathlib import Path
+
+from ..Contracts.Contract import _UNSET
+from ..Contracts.NFT import NftCollection, NftItem
+from ..Enums.Address import AddressForm
+from ..Enums.Exception import TVMExitCode
+from .LsClient import LsClient
+from .address_codec import default_address_codec
+from .flow_control import sliding_window, prefetch
+from .derivation import prepare_nft_item_derivation, nft_item_addresses
+from .utils import load_config
+
+
+_DERIVATION_CHUNK_SIZE = 10000  # item addresses derived per call to a worker
+
+
+class LsWorkerError(BaseException):
+    pass
+
+
+class _Pickler(pickle.Pickler):
+    """
+    Pickles the provider of the sending side as a reference, it's replaced by the provider of the receiving side.
+    """
+
+    def __init__(self, file, provider):
+        super().__init__(file, pickle.HIGHEST_PROTOCOL)
+        self.provider = provider
+
+    def persistent_id(self, obj):
+        if obj is self.provider:
+            return 'provider'
+        if obj is _UNSET:
+            return 'unset'
+        return None
+
+    def reducer_override(self, obj):
+        if isinstance(obj, TVMExitCode):
+            return type(obj), (obj.code,)
+        return NotImplemented
+
+
+class _Unpickler(pickle.Unpickler):
+    def __init__(self, file, provider):
+        super().__init__(file)
+        self.provider = provider
+
+    def persistent_load(self, pid):
+        if pid == 'provider':
+            return self.provider
+        if pid == 'unset':
+            return _UNSET
+        raise pickle.UnpicklingError(f'unknown persistent id {pid}')
+
+
+def _dumps(obj, provider) -> bytes:
+    file = io.BytesIO()
+    _Pickler(file, provider).dump(obj)
+    return file.getvalue()
+
+
+def _loads(data: bytes, provider):
+    return _Unpickler(io.BytesIO(data), provider).load()
+
+
+async def _transactions_chunk(client: LsClient, address: str, limit: int, from_lt: int, from_hash: str, to_lt: int):
+    return [tr async for tr in client.iter_transactions(address, limit, from_lt, from_hash, to_lt)]
+
+
+async def _collection_addresses(client: LsClient, collection_address: str, start_index: int, stop_index: int,
+                                window: int):
+    collection = NftCollection(collection_address, client)
+    return [(item.index, item.address) async for item in
+            client.iter_collection_items(collection, start_index, stop_index, window, True)]
+
+
+async def _derive_addresses(client: LsClient, code_boc: bytes, collection_address: str, start_index: int, stop_index: int):
+    return [(index, client._process_address(address)) for index, address in
+            zip(range(start_index, stop_index), nft_item_addresses(code_boc, collection_address, start_index, stop_index))]
+
+
+_WORKER_FUNCTIONS = {
+    '_transactions_chunk': _transactions_chunk,
+    '_collection_addresses': _collection_addresses,
+    '_derive_addresses': _derive_addresses
+}
+
+
+def _worker_main(conn, ls_index: int, client_kwargs: dict):
+    asyncio.run(_serve(conn, LsClient(ls_index, **client_kwargs)))
+
+
+async def _serve(conn, client: LsClient):
+    """
+    Executes batches of calls ``(call_id, method, args, kwargs)`` concurrently, results of the calls completed
+    in one event loop iteration are sent back in one batch.
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        await client.init()
+    except Exception as e:
+        conn.send_bytes(_dumps(('error', repr(e)), client))
+        return
+    conn.send_bytes(_dumps(('ready', None), client))
+
+    outbox = []
+    tasks = set()
+
+    def flush():
+        batch = outbox[:]
+        outbox.clear()
+        conn.send_bytes(_dumps(('results', batch), client))
+
+    def reply(call_id: int, ok: bool, value):
+        try:
+            data = _dumps((ok, value), client)
+            if not ok:
+                _loads(data, client)  # the error must be restorable in the caller's process
+        except Exception as e:
+            data = _dumps((False, LsWorkerError(f'{value!r} (not transferable: {e})')), client)
+        if not outbox:
+            loop.call_soon(flush)
+        outbox.append((call_id, data))
+
+    async def run(call_id: int, method: str, args: tuple, kwargs: dict):
+        try:
+            if method in _WORKER_FUNCTIONS:
+                result = await _WORKER_FUNCTIONS[method](client, *args, **kwargs)
+            else:
+                result = await getattr(client, method)(*args, **kwargs)
+        except asyncio.CancelledError:
+            raise
+        except BaseException as e:  # errors of the package derive from BaseException
+            reply(call_id, False, e)
+        else:
+            reply(call_id, True, result)
+
+    while True:
+        try:
+            data = await loop.run_in_executor(None, conn.recv_bytes)
+        except (EOFError, OSError):
+            break
+        batch = _loads(data, client)
+        if batch is None:
+            break
+        for call in batch:
+            task = asyncio.ensure_future(run(*call))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+    for task in list(tasks):
+        task.cancel()
+    await client.close()
+
+
+class _Worker:
+    __slots__ = ('ls_index', 'process', 'conn', 'calls', 'outbox', 'ready', 'state')
+
+    def __init__(self, ls_index: int, process, conn, ready: asyncio.Future):
+        self.ls_index = ls_index
+        self.process = process
+        self.conn = conn
+        self.calls: typing.Dict[int, asyncio.Future] = {}
+        self.outbox = []
+        self.ready = ready
+        self.state = 'starting'  # starting, ready or dead
+
+
+class LsProcessPool:
+    """
+    Provider with the API of LsClient which runs ``processes`` LsClient workers in separate processes,
+    each with its own tonlib and lite server, so tonlib calls and parsing of their results use several cores.
+
+    Every call goes to the worker with the fewest calls in flight. Calls made in one event loop iteration
+    are sent to a worker in one message, results are sent back the same way. ``get_nft_items``, collection
+    items and transactions are split into chunks of ``chunk_size`` spread across all workers.
+    A worker which has exited is restarted with another lite server, its calls in flight fail with LsWorkerError.
+    """
+
+    def __init__(self,
+                 processes: int = None,  # None for the number of CPUs
+                 ls_index: int = None,  # lite server of the first worker, None for random
+                 cdll_path: typing.Union[str, Path] = None,
+                 config: typing.Union[str, dict] = 'https://ton.org/global-config.json',
+                 keystore: typing.Union[str, Path] = None,
+                 workchain_id: int = 0,
+                 verbosity_level=0,
+                 default_timeout=10,
+                 addresses_form: str = AddressForm.USER_FRIENDLY,
+                 derive_jetton_wallets: bool = False,  # compute jetton wallet addresses locally for standard jettons
+                 account_cache_size: int = 1000,  # account handles reused within a masterchain block in every worker
+                 chunk_size: int = 50,  # NFT items, collection indexes or transactions per call to a worker
+                 init_timeout: float = 60  # seconds to wait for a worker to start
+                 ):
+        self.processes = processes or os.cpu_count() or 1
+        self.ls_index = ls_index
+        self.config = config
+        self.form = addresses_form
+        self.chunk_size = chunk_size
+        self.init_timeout = init_timeout
+        self.client_kwargs = {
+            'cdll_path': str(cdll_path) if cdll_path else None,
+            'keystore': str(keystore) if keystore else None,
+            'workchain_id': workchain_id,
+            'verbosity_level': verbosity_level,
+            'default_timeout': default_timeout,
+            'addresses_form': addresses_form,
+            'derive_jetton_wallets': derive_jetton_wallets,
+            'account_cache_size': account_cache_size
+        }
+        self.workers: typing.List[_Worker] = []
+        self._context = multiprocessing.get_context('spawn')  # tonlib isn't fork safe
+        self._ids = itertools.count()
+        self._next_worker = 0
+        self._next_ls = 0
+        self._tasks: typing.Set[asyncio.Task] = set()
+        self._closed = False
+
+    async def init(self):
+        self.config = await load_config(self.config)
+        count = len(self.config['liteservers'])
+        self._next_ls = random.randrange(count) if self.ls_index is None else self.ls_index % count
+        workers = [self._start(self._next_ls_index()) for _ in range(self.processes)]
+        results = await asyncio.gather(*[self._wait_ready(worker) for worker in workers])
+        self.workers = [worker for worker, ok in zip(workers, results) if ok]
+        if not self.workers:
+            raise LsWorkerError('failed to start any LsClient worker')
+
+    async def __aenter__(self):
+        await self.init()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    def _next_ls_index(self) -> int:
+        index = self._next_ls % len(self.config['liteservers'])
+        self._next_ls += 1
+        return index
+
+    def _start(self, ls_index: int) -> _Worker:
+        loop = asyncio.get_running_loop()
+        conn, child_conn = self._context.Pipe()
+        process = self._context.Process(target=_worker_main, args=(child_conn, ls_index, dict(self.client_kwargs, config=self.config)),
+                                        daemon=True)
+        process.start()
+        child_conn.close()
+        worker = _Worker(ls_index, process, conn, loop.create_future())
+        threading.Thread(target=self._read, args=(worker, loop), daemon=True).start()
+        return worker
+
+    async def _wait_ready(self, worker: _Worker) -> bool:
+        try:
+            await asyncio.wait_for(asyncio.shield(worker.ready), self.init_timeout)
+        except (Exception, LsWorkerError, asyncio.TimeoutError) as e:
+            logging.warning(f'Failed to start LsClient worker for lite server {worker.ls_index}: {e!r}')
+            self._stop(worker)
+            return False
+        worker.state = 'ready'
+        return True
+
+    def _read(self, worker: _Worker, loop: asyncio.AbstractEventLoop):
+        """
+        Reader thread of a worker's pipe.
+        """
+        while True:
+            try:
+                data = worker.conn.recv_bytes()
+            except (EOFError, OSError):
+                break
+            try:
+                loop.call_soon_threadsafe(self._on_message, worker, data)
+            except RuntimeError:  # loop is closed
+                return
+        try:
+            loop.call_soon_threadsafe(self._on_exit, worker)
+        except RuntimeError:
+            pass
+
+    def _on_message(self, worker: _Worker, data: bytes):
+        kind, payload = _loads(data, self)
+        if kind == 'ready':
+            if not worker.ready.done():
+                worker.ready.set_result(None)
+        elif kind == 'error':
+            if not worker.ready.done():
+                worker.ready.set_exception(LsWorkerError(payload))
+        else:
+            for call_id, item in payload:
+                future = worker.calls.pop(call_id, None)
+                if future is None or future.done():
+                    continue
+                ok, value = _loads(item, self)
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+
+    def _on_exit(self, worker: _Worker):
+        was_ready = worker.state == 'ready'
+        worker.state = 'dead'
+        if not worker.ready.done():
+            worker.ready.set_exception(LsWorkerError(f'worker for lite server {worker.ls_index} has exited'))
+        self._fail_calls(worker, LsWorkerError(f'worker for lite server {worker.ls_index} has exited'))
+        if was_ready and not self._closed:
+            logging.warning(f'LsClient worker for lite server {worker.ls_index} has exited, restarting')
+            self._spawn(self._restart(worker))
+
+    @staticmethod
+    def _fail_calls(worker: _Worker, error: BaseException):
+        calls, worker.calls = worker.calls, {}
+        worker.outbox.clear()
+        for future in calls.values():
+            if not future.done():
+                future.set_exception(error)
+
+    async def _restart(self, worker: _Worker):
+        delay = 1
+        while not self._closed:
+            new = self._start(self._next_ls_index())
+            if await self._wait_ready(new):
+                if self._closed:
+                    self._stop(new)
+                else:
+                    self.workers[self.workers.index(worker)] = new
+                return
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 60)
+
+    def _spawn(self, coroutine: typing.Coroutine):
+        task = asyncio.ensure_future(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    @staticmethod
+    def _stop(worker: _Worker):
+        worker.state = 'dead'
+        if worker.process.is_alive():
+            worker.process.terminate()
+        worker.conn.close()
+
+    async def close(self):
+        self._closed = True
+        for task in list(self._tasks):
+            task.cancel()
+        loop = asyncio.get_running_loop()
+        for worker in self.workers:
+            if worker.state == 'ready':
+                try:
+                    worker.conn.send_bytes(_dumps(None, self))
+                except OSError:
+                    pass
+        for worker in self.workers:
+            await loop.run_in_executor(None, worker.process.join, 5)
+            self._stop(worker)
+            self._fail_calls(worker, LsWorkerError('pool is closed'))
+
+    def _choose(self) -> _Worker:
+        workers = [worker for worker in self.workers if worker.state == 'ready']
+        if not workers:
+            raise LsWorkerError('no running LsClient workers')
+        self._next_worker += 1
+        start = self._next_worker % len(workers)
+        return min(workers[start:] + workers[:start], key=lambda worker: len(worker.calls))
+
+    def _flush(self, worker: _Worker):
+        batch = worker.outbox[:]
+        worker.outbox.clear()
+        if not batch or worker.state != 'ready':
+            return
+        try:
+            worker.conn.send_bytes(_dumps(batch, self))
+        except OSError as e:
+            for call_id, *_ in batch:
+                future = worker.calls.pop(call_id, None)
+                if future is not None and not future.done():
+                    future.set_exception(LsWorkerError(f'failed to send to worker for lite server {worker.ls_index}: {e}'))
+
+    async def _call(self, _method: str, *args, **kwargs):
+        """
+        Calls ``_method`` of a worker's LsClient (or a worker function).
+        """
+        worker = self._choose()
+        call_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        worker.calls[call_id] = future
+        if not worker.outbox:
+            asyncio.get_running_loop().call_soon(self._flush, worker)
+        worker.outbox.append((call_id, _method, args, kwargs))
+        try:
+            return await future
+        finally:
+            worker.calls.pop(call_id, None)
+
+    def _chunk_size(self, count: int) -> int:
+        workers = max(1, sum(worker.state == 'ready' for worker in self.workers))
+        return max(1, min(self.chunk_size, -(-count // workers)))
+
+    def _process_address(self, address):
+        return default_address_codec.convert(address, self.form)
+
+    async def run_get_method(self, method: str, address: str, stack: list):
+        return await self._call('run_get_method', method=method, address=address, stack=stack)
+
+    async def run_get_methods(self, address: str, methods: typing.List[typing.Tuple[str, list]]) -> list:
+        return await self._call('run_get_methods', address, methods)
+
+    async def get_masterchain_seqno(self) -> int:
+        return await self._call('get_masterchain_seqno')
+
+    async def get_nft_owner(self, nft_address: str):
+        return await self._call('get_nft_owner', nft_address)
+
+    async def get_nft_items(self, nft_addresses: list):
+        size = self._chunk_size(len(nft_addresses))
+        chunks = [nft_addresses[i:i + size] for i in range(0, len(nft_addresses), size)]
+        results = await asyncio.gather(*[self._call('get_nft_items', chunk) for chunk in chunks])
+        return [item for chunk in results for item in chunk]
+
+    async def get_collection(self, collection_address):
+        return await self._call('get_collection', collection_address)
+
+    async def get_collection_items(self, collection: NftCollection, limit_per_one_request=0):
+        if not collection.is_full():
+            await collection.update()
+        return [item async for item in self.iter_collection_items(collection)]
+
+    async def iter_collection_items(self, collection: NftCollection, start_index: int = 0, stop_index: int = None,
+                                    window: int = 100, ordered: bool = True, derive_addresses: bool = False,
+                                    processes: int = None):
+        """
+        Like ``LsClient.iter_collection_items``, index ranges of ``chunk_size`` are crawled by all workers at once,
+        ``window`` get-method calls are kept in flight by every worker. With ``derive_addresses`` the item code
+        is fetched and verified once, workers only compute addresses of their ranges. ``processes`` is ignored.
+        """
+        if stop_index is None:
+            if not collection.is_full():
+                await collection.update()
+            stop_index = collection.next_item_index
+        workers = max(1, len(self.workers))
+
+        def fetch(r: range):
+            return self._call('_collection_addresses', collection.address, r.start, r.stop, window)
+
+        size = self._chunk_size(stop_index - start_index)
+        if derive_addresses:
+            try:
+                code = await prepare_nft_item_derivation(self, collection.address, start_index, stop_index)
+            except ValueError as e:
+                logging.warning(f'{e}, falling back to get-methods')
+            else:
+                code_boc = bytes(code.cell.to_boc(False))
+                size = max(1, min(_DERIVATION_CHUNK_SIZE, -(-(stop_index - start_index) // workers)))
+
+                def fetch(r: range):
+                    return self._call('_derive_addresses', code_boc, collection.address, r.start, r.stop)
+        ranges = [range(i, min(i + size, stop_index)) for i in range(start_index, stop_index, size)]
+        async for _, addresses in sliding_window(fetch, ranges, 2 * workers, ordered):
+            for index, address in addresses:
+                item = NftItem(address, self)
+                item.index = index
+                yield item
+
+    async def get_transactions(self, address: str, limit: int = 10**9, limit_per_one_request: int = 100):
+        return [tr async for tr in self.iter_transactions(address, limit)]
+
+    async def iter_transactions(self, address: str, limit: int = None, from_lt: int = None, from_hash: str = None,
+                                to_lt: int = 0, limit_per_one_request: int = None):
+        """
+        Like ``LsClient.iter_transactions``, transactions are fetched by workers in chunks of ``chunk_size``,
+        the next chunk is requested while the current one is consumed.
+        """
+        async for chunk in prefetch(self._transaction_chunks(address, limit, from_lt, from_hash, to_lt)):
+            for tr in chunk:
+                yield tr
+
+    async def _transaction_chunks(self, address: str, limit: int = None, from_lt: int = None, from_hash: str = None,
+                                  to_lt: int = 0):
+        count = 0
+        last_hash = None  # the chunk starts with the last transaction of the previous one
+        while limit is None or count < limit:
+            size = self.chunk_size if limit is None else min(self.chunk_size, limit - count)
+            if last_hash is not None:
+                size += 1
+            chunk = await self._call('_transactions_chunk', address, size, from_lt, from_hash, to_lt)
+            new = [tr for tr in chunk if last_hash is None or tr.hash != last_hash]
+            count += len(new)
+            yield new
+            if len(chunk) < size:
+                return
+            from_lt, from_hash = int(chunk[-1].lt), chunk[-1].hash
+            last_hash = from_hash
+
+    async def _get_nft_item_code(self, collection_address: str):
+        return await self._call('_get_nft_item_code', collection_address)
+
+    async def _get_nft_address_by_index(self, collection_address: str, index: int):
+        return await self._call('_get_nft_address_by_index', collection_address, index)
+
+    async def get_jetton_data(self, jetton_master_address: str):
+        return await self._call('get_jetton_data', jetton_master_address)
+
+    async def send_boc(self, boc, **kwargs):
+        return await self._call('send_boc', boc)
+
+    async def get_wallet_seqno(self, address: str):
+        return await self._call('get_wallet_seqno', address)
+
+    async def get_balance(self, address: str):
+        return await self._call('get_balance', address)
+
+    async def get_state(self, address: str):
+        return await self._call('get_state', address)
+
+    async def get_jetton_wallet_address(self, jetton_master_address: str, owner_address: str):
+        return await self._call('get_jetton_wallet_address', jetton_master_address, owner_address)
+
+    async def get_jetton_wallet(self, jetton_wallet_address: str):
+        return await self._call('get_jetton_wallet', jetton_wallet_address)
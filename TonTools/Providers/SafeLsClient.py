@@ -1,21 +1,25 @@
 import logging
 import typing
 import inspect
-import random
+import time
 from pathlib import Path
 
-import requests
-
 from .DtonClient import DtonClient
 from .LsClient import LsClient
+from .ls_pool import LsPool, LsPoolError
+from .flow_control import LatencyTracker, CircuitBreaker, CircuitOpenError, hedge
 from .TonApiClient import TonApiClient
 from .TonCenterClient import TonCenterClient
+from .utils import load_config
 from ..Contracts.NFT import NftCollection
 from ..Enums.Address import AddressForm
 
 
+_NOT_HEDGED = {'send_boc'}  # not sent twice
+
+
 class SafeLsClient:
-    ls_client: LsClient
+    pool: LsPool
 
     def __init__(self,
                  fallback_client: typing.Union[DtonClient, TonApiClient, TonCenterClient],
@@ -27,6 +31,15 @@ class SafeLsClient:
                  verbosity_level=0,
                  default_timeout=10,
                  addresses_form: str = AddressForm.USER_FRIENDLY,
+                 derive_jetton_wallets: bool = False,  # compute jetton wallet addresses locally for standard jettons
+                 pool_size: int = 3,  # connections to different lite servers requests are spread across
+                 standby: int = 1,  # initialized spare connections replacing unhealthy ones
+                 probe_interval: float = 10,  # seconds between health probes of lite servers, None to disable
+                 hedge: bool = False,  # also call the fallback if lite server is slower than usual, first result wins
+                 hedge_percentile: float = 0.95,  # lite server latency percentile after which the hedged call is sent
+                 hedge_delay: float = 1,  # seconds, used until enough latencies are recorded
+                 hedge_to_ls: bool = False,  # send hedged calls to the second best lite server (if any) instead of the fallback
+                 circuit_breakers: bool = True  # skip lite servers or the fallback while they keep failing
                  ):
         self.fallback = fallback_client
         self.ls_index = ls_index
@@ -37,23 +50,50 @@ class SafeLsClient:
         self.verbosity_level = verbosity_level
         self.default_timeout = default_timeout
         self.addresses_form = addresses_form
-        self._next_ls = False
+        self.derive_jetton_wallets = derive_jetton_wallets
+        self.pool_size = pool_size
+        self.standby = standby
+        self.probe_interval = probe_interval
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_delay = hedge_delay
+        self.hedge_to_ls = hedge_to_ls
+        self.latency = LatencyTracker()
+        self.circuit_breakers = circuit_breakers
+        self.fallback_breaker = CircuitBreaker('fallback') if circuit_breakers else None
+
+    def _make_ls_client(self, ls_index: int) -> LsClient:
+        return LsClient(ls_index, self.cdll_path, self.config, self.keystore, self.workchain_id,
+                        self.verbosity_level, self.default_timeout, self.addresses_form,
+                        derive_jetton_wallets=self.derive_jetton_wallets)
+
+    @staticmethod
+    def _make_ls_breaker(ls_index: int) -> CircuitBreaker:
+        return CircuitBreaker(f'lite server {ls_index}')
 
     async def init(self):
-        if isinstance(self.config, str):
-            # noinspection HttpUrlsUsage
-            if self.config.find('http://') == 0 or self.config.find('https://') == 0:
-                self.config = requests.get(self.config).json()
-        self.ls_index = random.randrange(0, len(self.config['liteservers'])) if self.ls_index is None else self.ls_index
-
-        self.ls_client = LsClient(self.ls_index, self.cdll_path, self.config, self.keystore, self.workchain_id,
-                                  self.verbosity_level, self.default_timeout, self.addresses_form)
-        await self.ls_client.init()
+        self.config = await load_config(self.config)
+        self.pool = LsPool(self.config, self._make_ls_client, self.pool_size, self.standby, self.ls_index,
+                           probe_interval=self.probe_interval,
+                           make_breaker=self._make_ls_breaker if self.circuit_breakers else None)
+        await self.pool.init()
+        self.ls_index = self.pool.best().ls_index
+
+    @property
+    def ls_client(self) -> LsClient:
+        """
+        Client of the healthiest lite server.
+        """
+        return self.pool.best().client
 
     async def next_ls(self):
-        self.ls_index = (self.ls_index + 1) % len(self.config['liteservers'])
-        self.ls_client.ls_index = self.ls_index
-        await self.ls_client.init()
+        """
+        Replaces the current best lite server with another one.
+        """
+        self.pool.eject(self.pool.best())
+
+    async def close(self):
+        await self.pool.close()
 
     async def _run_method(self, client, method, args, kwargs):
         method = getattr(client, method)
@@ -62,19 +102,48 @@ class SafeLsClient:
         kwargs = {k: v for k, v in kwargs.items() if k in params}
         return await method(*args, **kwargs)
 
+    @staticmethod
+    async def _guarded(breaker: typing.Optional[CircuitBreaker], factory: typing.Callable[[], typing.Awaitable],
+                       failure_on: tuple = (Exception,)):
+        if breaker is None:
+            return await factory()
+        return await breaker.call(factory, failure_on)
+
+    async def _call_fallback(self, _method: str, args: tuple, kwargs: dict):
+        return await self._guarded(self.fallback_breaker, lambda: self._run_method(self.fallback, _method, args, kwargs))
+
     async def _execute(self, _method: str, *args, **kwargs):
+        if self.hedge and _method not in _NOT_HEDGED:
+            return await self._execute_hedged(_method, args, kwargs)
         try:
-            if self._next_ls:
-                self._next_ls = False
-                await self.next_ls()
-            return await self._run_method(self.ls_client, _method, args, kwargs)
-        except Exception as e:
-            logging.warning(f'Error in {_method}: {e}\nTrying the fallback client and switching to another LS for the next request')
-            self._next_ls = True
-            return await self._run_method(self.fallback, _method, args, kwargs)
+            return await self.pool.execute(lambda client: self._run_method(client, _method, args, kwargs))
+        except (Exception, LsPoolError, CircuitOpenError) as e:
+            if not isinstance(e, CircuitOpenError):
+                logging.warning(f'Error in {_method}: {e}\nTrying the fallback client')
+            return await self._call_fallback(_method, args, kwargs)
+
+    async def _execute_hedged(self, _method: str, args: tuple, kwargs: dict):
+        async def primary():
+            started = time.monotonic()
+            result = await self.pool.run(self.pool.best(), lambda client: self._run_method(client, _method, args, kwargs))
+            self.latency.record(time.monotonic() - started)
+            return result
+
+        async def secondary():
+            if self.hedge_to_ls:
+                try:
+                    return await self.pool.execute(lambda client: self._run_method(client, _method, args, kwargs),
+                                                   attempts=1, exclude=[self.pool.best()])
+                except (Exception, LsPoolError):
+                    pass
+            return await self._call_fallback(_method, args, kwargs)
+
+        delay = self.latency.percentile(self.hedge_percentile)
+        return await hedge(primary, secondary, self.hedge_delay if delay is None else delay,
+                           (Exception, LsPoolError, CircuitOpenError))
 
     def _process_address(self, address):
-        return self.ls_client._process_address(address)
+        return self.pool.members[0].client._process_address(address)
 
     async def run_get_method(self, method: str, address: str, stack: list):
         return await self._execute(self.run_get_method.__name__, method=method, address=address, stack=stack)
@@ -94,6 +163,46 @@ class SafeLsClient:
     async def get_transactions(self, address: str, limit: int = 10**9, limit_per_one_request: int = 100):
         return await self._execute(self.get_transactions.__name__, address, limit, limit_per_one_request)
 
+    async def iter_transactions(self, address: str, limit: int = None, from_lt: int = None, from_hash: str = None,
+                                to_lt: int = 0):
+        last_lt = None
+        count = 0
+        member = None
+        breaker = None
+        unrecorded = False  # the breaker allowed the call, its result isn't recorded yet
+        try:
+            member = self.pool.best()
+            breaker = member.breaker
+            if breaker is not None:
+                if not breaker.allow():
+                    raise CircuitOpenError(f'circuit {breaker.name} is open')
+                unrecorded = True
+            async for tr in member.client.iter_transactions(address, limit, from_lt, from_hash, to_lt):
+                yield tr
+                last_lt, from_lt, from_hash = int(tr.lt), int(tr.lt), tr.hash
+                count += 1
+            if unrecorded:
+                unrecorded = False
+                breaker.record(True)
+        except (Exception, LsPoolError, CircuitOpenError) as e:
+            if unrecorded:
+                unrecorded = False
+                breaker.record(False)
+            if not isinstance(e, CircuitOpenError):
+                logging.warning(f'Error in iter_transactions: {e}\nContinuing with the fallback client')
+            if member is not None and not isinstance(e, (LsPoolError, CircuitOpenError)):
+                self.pool.report(member, False)
+            async for tr in self.fallback.iter_transactions(address, None, from_lt, from_hash, to_lt):
+                if limit is not None and count >= limit:
+                    return
+                if int(tr.lt) == last_lt:
+                    continue  # already yielded from the LS
+                yield tr
+                count += 1
+        finally:
+            if unrecorded:
+                breaker.release()  # the consumer has stopped iterating
+
     async def get_jetton_data(self, jetton_master_address: str):
         return await self._execute(self.get_jetton_data.__name__, jetton_master_address)
 
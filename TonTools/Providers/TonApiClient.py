@@ -8,6 +8,9 @@ from ..Contracts.Contract import Transaction
 from ..Contracts.Wallet import Wallet
 from ..Contracts.Jetton import Jetton
 from ..Enums.Address import AddressForm
+from .transport import HttpTransport
+from .address_codec import default_address_codec
+from .flow_control import make_rate_limiter, AdaptiveConcurrencyLimiter, RetryPolicy, CircuitBreaker, prefetch
 
 
 class TonApiError(BaseException):
@@ -29,9 +32,19 @@ class TonApiClient:
     def __init__(self,
                  key: str = None,  # api key from tonapi
                  addresses_form: str = AddressForm.USER_FRIENDLY,
-                 testnet=False
+                 testnet=False,
+                 pool_size: int = 100,  # max simultaneous http connections
+                 rps: float = None,  # max requests per second for all methods of the client, None for unlimited
+                 burst: int = None,  # max requests sent at once before rps applies, 1 by default
+                 max_retries: int = 5,  # retries of 429, 5xx responses and connection errors
+                 circuit_breaker: CircuitBreaker = None  # fail fast while the backend keeps failing
                  ):
         self.form = addresses_form
+        self.transport = HttpTransport(pool_size=pool_size,
+                                       rate_limiter=make_rate_limiter(rps, burst),
+                                       concurrency_limiter=AdaptiveConcurrencyLimiter(max_limit=pool_size or 1000),
+                                       retry_policy=RetryPolicy(max_retries=max_retries),
+                                       circuit_breaker=circuit_breaker)
         if testnet:
             self.testnet = True
             self.base_url = 'https://testnet.tonapi.io/v2'
@@ -46,151 +59,168 @@ class TonApiClient:
             self.headers = {}
 
     def _process_address(self, address):
-        if self.form == AddressForm.RAW:
-            return Address(address).to_string(is_user_friendly=False)
-        elif self.form == AddressForm.USER_FRIENDLY:
-            if self.testnet:
-                return Address(address).to_string(True, True, True, True)
-            else:
-                return Address(address).to_string(True, True, True)
+        return default_address_codec.convert(address, self.form, self.testnet)
+
+    async def init(self):
+        """
+        TonApiClient doesn't need initialization, the method is kept for a uniform interface of providers.
+        """
+        return self
+
+    async def close(self):
+        await self.transport.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
 
     async def get_nft_owner(self, nft_address: str):
-        async with aiohttp.ClientSession() as session:
-            url = f'{self.base_url}/nfts/{nft_address}'
-            response = await session.get(url=url, headers=self.headers)
-            response = await process_response(response)
-            if 'sale' in response:
-                return Wallet(self, self._process_address(response['sale']['owner']['address']))
-            return Wallet(self, self._process_address(response['owner']['address']))
+        url = f'{self.base_url}/nfts/{nft_address}'
+        response = await self.transport.get(url=url, headers=self.headers)
+        response = await process_response(response)
+        if 'sale' in response:
+            return Wallet(self, self._process_address(response['sale']['owner']['address']))
+        return Wallet(self, self._process_address(response['owner']['address']))
 
     async def get_nft_items(self, nft_addresses: list):
         result = []
-        async with aiohttp.ClientSession() as session:
-            url = f'{self.base_url}/nfts/_bulk'
-            params = {
-                'account_ids': nft_addresses
-            }
-            response = await session.post(url=url, json=params, headers=self.headers)
-            response = await process_response(response)
-            for item in response['nft_items']:
-                item['address'] = self._process_address(item['address'])
-                item['collection']['address'] = self._process_address(item['collection']['address'])
-                item['owner']['address'] = self._process_address(item['owner']['address'])
-                item['collection_address'] = item['collection']['address']
-                if 'sale' in item:
-                    item['sale']['address'] = self._process_address(item['sale']['address'])
-                    item['sale']['market']['address'] = self._process_address(item['sale']['market']['address'])
-                    item['sale']['owner'] = self._process_address(item['sale']['owner']['address'])
-                result.append(NftItem(item, self))
-            return result
+        url = f'{self.base_url}/nfts/_bulk'
+        params = {
+            'account_ids': nft_addresses
+        }
+        response = await self.transport.post(url=url, json=params, headers=self.headers)
+        response = await process_response(response)
+        for item in response['nft_items']:
+            item['address'] = self._process_address(item['address'])
+            item['collection']['address'] = self._process_address(item['collection']['address'])
+            item['owner']['address'] = self._process_address(item['owner']['address'])
+            item['collection_address'] = item['collection']['address']
+            if 'sale' in item:
+                item['sale']['address'] = self._process_address(item['sale']['address'])
+                item['sale']['market']['address'] = self._process_address(item['sale']['market']['address'])
+                item['sale']['owner'] = self._process_address(item['sale']['owner']['address'])
+            result.append(NftItem(item, self))
+        return result
 
     async def get_collection(self, collection_address):
-        async with aiohttp.ClientSession() as session:
-            url = f'{self.base_url}/nfts/collections/{collection_address}'
-            response = await session.get(url=url, headers=self.headers)
-            response = await process_response(response)
-            if 'owner' in response:
-                response['owner'] = self._process_address(response['owner']['address'])
-            return NftCollection(response, self)
+        url = f'{self.base_url}/nfts/collections/{collection_address}'
+        response = await self.transport.get(url=url, headers=self.headers)
+        response = await process_response(response)
+        if 'owner' in response:
+            response['owner'] = self._process_address(response['owner']['address'])
+        return NftCollection(response, self)
 
     async def get_collection_items(self, collection: NftCollection, limit: int = 10**9, limit_per_one_request=1000):
-        async with aiohttp.ClientSession() as session:
-            url = f'{self.base_url}/nfts/collections/{collection.address}/items'
-            i = 0
-            items = []
-            while len(items) < limit:
-                params = {
-                    'limit': limit_per_one_request,
-                    'offset': i
-                }
-                response = await session.get(url=url, params=params, headers=self.headers)
-                response = await process_response(response)
-                items += [NftItem(self._process_address(item['address']), self) for item in response['nft_items']]
-                if len(response['nft_items']) < limit_per_one_request:
-                    break
-                i += limit_per_one_request
-            return items[:limit]
+        url = f'{self.base_url}/nfts/collections/{collection.address}/items'
+        i = 0
+        items = []
+        while len(items) < limit:
+            params = {
+                'limit': limit_per_one_request,
+                'offset': i
+            }
+            response = await self.transport.get(url=url, params=params, headers=self.headers)
+            response = await process_response(response)
+            items += [NftItem(self._process_address(item['address']), self) for item in response['nft_items']]
+            if len(response['nft_items']) < limit_per_one_request:
+                break
+            i += limit_per_one_request
+        return items[:limit]
 
     async def get_transactions(self, address: str, limit: int = 10**9, limit_per_one_request: int = 100, before_lt: int = 0, after_lt: int = 0):
-        async with aiohttp.ClientSession() as session:
-            url = f'{self.base_url}/blockchain/accounts/{address}/transactions'
-            transactions = []
-            while len(transactions) < limit:
-                params = {
-                    'limit': limit_per_one_request,
-                    **({'before_lt': before_lt} if before_lt else {}),
-                    **({'after_lt': after_lt} if after_lt else {})
-                }
-                response = await session.get(url=url, params=params, headers=self.headers)
-                response = await process_response(response)
-                transactions.extend(response['transactions'])
-                if transactions:
-                    before_lt = transactions[-1]['lt']
-                if len(response['transactions']) < limit_per_one_request:
-                    break
-            result = []
-            for tr in transactions:
-                tr['data'] = None
-                tr['status'] = tr['success']
-                tr['fee'] = tr['total_fees']
-                tr['hash'] = base64.b64encode(s=bytearray.fromhex(tr['hash'])).decode()
-                tr['in_msg']['msg_data'] = tr['in_msg']['decoded_body'] if 'decoded_body' in tr['in_msg'] else None
-                tr['in_msg']['msg_data_hex'] = tr['in_msg']['raw_body'] if 'raw_body' in tr['in_msg'] else None
-                tr['in_msg']['source'] = self._process_address(tr['in_msg']['source']['address']) if 'source' in tr['in_msg'] else ''
-                tr['in_msg']['destination'] = self._process_address(tr['in_msg']['destination']['address']) if 'destination' in tr['in_msg'] else ''
-                tr['in_msg']['op_code'] = tr['in_msg']['op_code'].replace('0x', '') if 'op_code' in tr['in_msg'] else ''
-                out_msgs = tr['out_msgs']
-                for out_msg in out_msgs:
-                    out_msg['source'] = self._process_address(out_msg['source']['address']) if 'source' in out_msg else ''
-                    out_msg['destination'] = self._process_address(out_msg['destination']['address']) if 'destination' in out_msg else ''
-                    out_msg['op_code'] = out_msg['op_code'].replace('0x', '') if 'op_code' in out_msg else ''
-                tr['out_msgs'] = out_msgs
-                result.append(Transaction(tr))
-            return result[:limit]
+        from_lt = before_lt - 1 if before_lt else None
+        return [tr async for tr in self.iter_transactions(address, limit, from_lt, to_lt=after_lt, limit_per_one_request=limit_per_one_request)]
+
+    async def iter_transactions(self, address: str, limit: int = None, from_lt: int = None, from_hash: str = None,
+                                to_lt: int = 0, limit_per_one_request: int = 100):
+        """
+        Yields transactions from newest to oldest, starting with ``from_lt`` (inclusive, latest by default)
+        down to ``to_lt`` (exclusive). The next page is fetched while the current one is consumed.
+        ``from_hash`` isn't needed by tonapi and is ignored.
+        """
+        count = 0
+        async for page in prefetch(self._transaction_pages(address, from_lt, to_lt, limit_per_one_request)):
+            for tr in page:
+                if limit is not None and count >= limit:
+                    return
+                yield self._parse_transaction(tr)
+                count += 1
+
+    async def _transaction_pages(self, address: str, from_lt: int = None, to_lt: int = 0, limit_per_one_request: int = 100):
+        url = f'{self.base_url}/blockchain/accounts/{address}/transactions'
+        before_lt = from_lt + 1 if from_lt is not None else 0
+        while True:
+            params = {
+                'limit': limit_per_one_request,
+                **({'before_lt': before_lt} if before_lt else {}),
+                **({'after_lt': to_lt} if to_lt else {})
+            }
+            response = await self.transport.get(url=url, params=params, headers=self.headers)
+            response = await process_response(response)
+            transactions = response['transactions']
+            yield transactions
+            if len(transactions) < limit_per_one_request:
+                return
+            before_lt = transactions[-1]['lt']
+
+    def _parse_transaction(self, tr: dict) -> Transaction:
+        tr['data'] = None
+        tr['status'] = tr['success']
+        tr['fee'] = tr['total_fees']
+        tr['hash'] = base64.b64encode(s=bytearray.fromhex(tr['hash'])).decode()
+        tr['in_msg']['msg_data'] = tr['in_msg']['decoded_body'] if 'decoded_body' in tr['in_msg'] else None
+        tr['in_msg']['msg_data_hex'] = tr['in_msg']['raw_body'] if 'raw_body' in tr['in_msg'] else None
+        tr['in_msg']['source'] = self._process_address(tr['in_msg']['source']['address']) if 'source' in tr['in_msg'] else ''
+        tr['in_msg']['destination'] = self._process_address(tr['in_msg']['destination']['address']) if 'destination' in tr['in_msg'] else ''
+        tr['in_msg']['op_code'] = tr['in_msg']['op_code'].replace('0x', '') if 'op_code' in tr['in_msg'] else ''
+        out_msgs = tr['out_msgs']
+        for out_msg in out_msgs:
+            out_msg['source'] = self._process_address(out_msg['source']['address']) if 'source' in out_msg else ''
+            out_msg['destination'] = self._process_address(out_msg['destination']['address']) if 'destination' in out_msg else ''
+            out_msg['op_code'] = out_msg['op_code'].replace('0x', '') if 'op_code' in out_msg else ''
+        tr['out_msgs'] = out_msgs
+        return Transaction(tr)
 
     async def get_jetton_data(self, jetton_master_address: str):
-        async with aiohttp.ClientSession() as session:
-            url = f'{self.base_url}/jettons/{jetton_master_address}'
-            response = await session.get(url=url, headers=self.headers)
-            response = await process_response(response)
-            result = response['metadata']
-            result['description'] = unicodedata.normalize("NFKD", result['description']) if 'description' in result else ''
-            result['address'] = self._process_address(result['address'])
-            result['supply'] = response['total_supply']
-            return Jetton(result, self)
+        url = f'{self.base_url}/jettons/{jetton_master_address}'
+        response = await self.transport.get(url=url, headers=self.headers)
+        response = await process_response(response)
+        result = response['metadata']
+        result['description'] = unicodedata.normalize("NFKD", result['description']) if 'description' in result else ''
+        result['address'] = self._process_address(result['address'])
+        result['supply'] = response['total_supply']
+        return Jetton(result, self)
 
     async def send_boc(self, boc):
-        async with aiohttp.ClientSession() as session:
-            url = f'{self.base_url}/blockchain/message'
-            data = {
-                'boc': boc
-            }
-            response = await session.post(url=url, json=data, headers=self.headers)
-            return response.status
+        url = f'{self.base_url}/blockchain/message'
+        data = {
+            'boc': boc
+        }
+        response = await self.transport.post(url=url, json=data, headers=self.headers)
+        return response.status
 
     async def get_wallet_seqno(self, address: str):
-        async with aiohttp.ClientSession() as session:
-            url = f'{self.base_url}/wallet/{address}/seqno'
-            response = await session.get(url=url, headers=self.headers)
-            response = await process_response(response)
-            seqno = response['seqno']
-            return seqno
+        url = f'{self.base_url}/wallet/{address}/seqno'
+        response = await self.transport.get(url=url, headers=self.headers)
+        response = await process_response(response)
+        seqno = response['seqno']
+        return seqno
 
     async def get_balance(self, address: str):
-        async with aiohttp.ClientSession() as session:
-            url = f'{self.base_url}/accounts/{address}'
-            response = await session.get(url=url, headers=self.headers)
-            response = await process_response(response)
-            balance = response['balance']
-            return int(balance)
+        url = f'{self.base_url}/accounts/{address}'
+        response = await self.transport.get(url=url, headers=self.headers)
+        response = await process_response(response)
+        balance = response['balance']
+        return int(balance)
 
     async def get_state(self, address: str):
-        async with aiohttp.ClientSession() as session:
-            url = f'{self.base_url}/accounts/{address}'
-            response = await session.get(url=url, headers=self.headers)
-            response = await process_response(response)
-            state = response['status']
-            if state == 'empty' or state == 'uninit':
-                return 'uninitialized'
-            else:
-                return state
+        url = f'{self.base_url}/accounts/{address}'
+        response = await self.transport.get(url=url, headers=self.headers)
+        response = await process_response(response)
+        state = response['status']
+        if state == 'empty' or state == 'uninit':
+            return 'uninitialized'
+        else:
+            return state
@@ -1,5 +1,7 @@
 import asyncio
-from math import ceil
+import copy
+import logging
+import time
 
 import aiohttp
 import base64
@@ -12,8 +14,12 @@ from ..Contracts.Contract import Transaction
 from ..Contracts.Wallet import Wallet
 from ..Contracts.Jetton import Jetton, JettonWallet
 from ..Enums.Address import AddressForm
-from .utils import markets_adresses, get, process_jetton_data
-from ._orbs_ton_access import get_http_endpoint
+from .utils import markets_adresses, get_content, get_jetton_content
+from ._orbs_ton_access import EndpointPool
+from .transport import HttpTransport
+from .address_codec import default_address_codec
+from .derivation import JettonWalletCodeCache, parse_nft_item_code, prepare_nft_item_derivation, derive_nft_item_addresses
+from .flow_control import make_rate_limiter, AdaptiveConcurrencyLimiter, RetryPolicy, CircuitBreaker, SingleFlight, deepcopy_except, sliding_window, prefetch
 
 
 class TonCenterClientError(BaseException):
@@ -41,18 +47,32 @@ class TonCenterClient:
                  addresses_form: str = AddressForm.USER_FRIENDLY,
                  base_url=None,
                  testnet=False,
-                 orbs_access=False  # https://www.orbs.com/ton-access/
+                 orbs_access=False,  # https://www.orbs.com/ton-access/
+                 pool_size: int = 100,  # max simultaneous http connections
+                 rps: float = None,  # max requests per second for all methods of the client, None for unlimited
+                 burst: int = None,  # max requests sent at once before rps applies, 1 by default
+                 max_retries: int = 5,  # retries of 429, 5xx responses and connection errors
+                 circuit_breaker: CircuitBreaker = None,  # fail fast while the backend keeps failing
+                 derive_jetton_wallets: bool = False  # compute jetton wallet addresses locally for standard jettons
                  ):
         self.form = addresses_form
+        self.transport = HttpTransport(pool_size=pool_size,
+                                       rate_limiter=make_rate_limiter(rps, burst),
+                                       concurrency_limiter=AdaptiveConcurrencyLimiter(max_limit=pool_size or 1000),
+                                       retry_policy=RetryPolicy(max_retries=max_retries),
+                                       circuit_breaker=circuit_breaker)
+        self.single_flight = SingleFlight()
+        self.jetton_wallet_codes = JettonWalletCodeCache() if derive_jetton_wallets else None
         self.delay = 0
         self.base_url = base_url
         self.testnet = testnet
+        self.orbs_access = orbs_access
+        self.endpoints = None
         if orbs_access:
+            # requests are spread across healthy orbs nodes
             self.headers = {}
-            if testnet:
-                self.base_url = get_http_endpoint({'network': 'testnet', 'protocol': 'rest'})
-                return
-            self.base_url = get_http_endpoint({'protocol': 'rest'})
+            self.base_url = None
+            self.endpoints = EndpointPool('testnet' if testnet else 'mainnet', transport=self.transport)
             return
         if testnet:
             if base_url is None:
@@ -71,38 +91,73 @@ class TonCenterClient:
         else:
             self.headers = {}
 
+    async def init(self):
+        """
+        Loads orbs topology if ``orbs_access`` is used, otherwise does nothing.
+        """
+        if self.endpoints is not None and not self.endpoints.endpoints:
+            await self.endpoints.refresh()
+        return self
+
+    async def _request(self, method: str, api_method: str, **kwargs) -> aiohttp.ClientResponse:
+        if self.endpoints is None:
+            return await self.transport.request(method, self.base_url + api_method, headers=self.headers, **kwargs)
+        base_url = await self.endpoints.get()
+        started = time.monotonic()
+        try:
+            response = await self.transport.request(method, base_url + api_method, headers=self.headers, **kwargs)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            self.endpoints.report(base_url, False)
+            raise
+        self.endpoints.report(base_url, response.status < 500 and response.status != 429, time.monotonic() - started)
+        return response
+
     def _process_address(self, address):
-        if self.form == AddressForm.RAW:
-            return Address(address).to_string(is_user_friendly=False)
-        elif self.form == AddressForm.USER_FRIENDLY:
-            if self.testnet:
-                return Address(address).to_string(True, True, True, True)
-            else:
-                return Address(address).to_string(True, True, True)
+        return default_address_codec.convert(address, self.form, self.testnet)
 
     def set_delay(self, delay: float = 0.1):
+        """
+        Deprecated, use ``rps`` parameter of the constructor instead.
+        Limits the client to one request per ``delay`` seconds.
+        """
         self.delay = delay
+        self.transport.rate_limiter = make_rate_limiter(1 / delay if delay else None)
+
+    async def close(self):
+        if self.endpoints is not None:
+            await self.endpoints.close()
+        await self.transport.close()
+
+    async def __aenter__(self):
+        return await self.init()
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
 
     async def run_get_method(self, method: str, address: str, stack: list):
-        async with aiohttp.ClientSession() as session:
-            url = self.base_url + 'runGetMethod'
-            data = {
-                "address": address,
-                "method": method,
-                "stack": stack
-            }
-            await asyncio.sleep(self.delay)
-            response = await session.post(url=url, json=data, headers=self.headers)
-            response = await process_response(response)
-            if response['result']['exit_code'] != 0:
-                raise GetMethodError(
-                    f'get method {method} for address {self._process_address(address)} exit code is {response["result"]["exit_code"]}')
-            return response['result']['stack']
+        """
+        Concurrent calls with the same address, method and stack share one request.
+        """
+        key = SingleFlight.make_key('run_get_method', address, method, stack)
+        return await self.single_flight.do(key, lambda: self._run_get_method(method, address, stack), copy.deepcopy)
+
+    async def _run_get_method(self, method: str, address: str, stack: list):
+        data = {
+            "address": address,
+            "method": method,
+            "stack": stack
+        }
+        response = await self._request('POST', 'runGetMethod', json=data)
+        response = await process_response(response)
+        if response['result']['exit_code'] != 0:
+            raise GetMethodError(
+                f'get method {method} for address {self._process_address(address)} exit code is {response["result"]["exit_code"]}')
+        return response['result']['stack']
 
     async def get_nft_owner(self, nft_address: str):
-        sale = await self._get_nft_sale(nft_address)
+        data = await self.run_get_method(method='get_nft_data', address=nft_address, stack=[])
+        sale = await self._get_nft_sale(nft_address, data)
         if not sale:
-            data = await self.run_get_method(method='get_nft_data', address=nft_address, stack=[])
             owner_address = read_address(Cell.one_from_boc(base64.b64decode(data[3][1]['bytes']))).to_string()
         else:
             owner_address = sale['owner']
@@ -124,22 +179,17 @@ class TonCenterClient:
             }
         }
         content_data = await self.run_get_method(method='get_nft_content', address=result['collection_address'], stack=[['num', result['index']], ['tvm.Cell', data[4][1]['bytes']]])
-        collection_content_url = Cell.one_from_boc(base64.b64decode(content_data[0][1]['bytes'])).bits.get_top_upped_array().decode().split('\x01')[-1]
-        # if '\x01' in collection_content_url:
-        #     collection_content_url = collection_content_url.split('\x01')[1]
-        nft_content_url = collection_content_url + Cell.one_from_boc(base64.b64decode(content_data[0][1]['bytes'])).refs[0].bits.get_top_upped_array().decode()
-
-        result['metadata'] = await get(nft_content_url)
+        result['metadata'] = await get_content(content_data[0][1]['bytes'], self.transport)
 
-        sale = await self._get_nft_sale(nft_address)
+        sale = await self._get_nft_sale(nft_address, data)
         if not sale:
             return NftItem(result, provider=self)
         else:
             result['sale'] = sale
             return NftItem(result, provider=self)
 
-    async def _get_nft_sale(self, nft_address: str):
-        data = await self.run_get_method(method='get_nft_data', address=nft_address, stack=[])
+    async def _get_nft_sale(self, nft_address: str, nft_data: list = None):
+        data = nft_data or await self.run_get_method(method='get_nft_data', address=nft_address, stack=[])
         owner_address = self._process_address(read_address(Cell.one_from_boc(base64.b64decode(data[3][1]['bytes']))).to_string())
         try:
             data = await self.run_get_method(method='get_sale_data', address=owner_address, stack=[])
@@ -201,11 +251,12 @@ class TonCenterClient:
             return False
 
     async def get_collection(self, collection_address):
+        key = SingleFlight.make_key('get_collection', collection_address)
+        return await self.single_flight.do(key, lambda: self._get_collection(collection_address), deepcopy_except(self))
+
+    async def _get_collection(self, collection_address):
         data = await self.run_get_method(method='get_collection_data', address=collection_address, stack=[])
-        collection_content_url = Cell.one_from_boc(base64.b64decode(data[1][1]['bytes'])).bits.get_top_upped_array().decode().split('\x01')[-1]
-        # if '\x01' in collection_content_url:
-        #     collection_content_url = collection_content_url.split('\x01')[1]
-        collection_metadata = await get(collection_content_url)
+        collection_metadata = await get_content(data[1][1]['bytes'], self.transport)
         result = {
             'address': self._process_address(collection_address),
             'next_item_index': int(data[0][1], 16),
@@ -217,119 +268,176 @@ class TonCenterClient:
     async def get_collection_items(self, collection: NftCollection, limit_per_one_request=0):
         if not collection.is_full():
             await collection.update()
-        if not limit_per_one_request:
-            items = await asyncio.gather(*[self.run_get_method(address=collection.address, method='get_nft_address_by_index', stack=[['num', i]]) for i in range(collection.next_item_index)])
-        else:
-            items = []
-            for p in range(ceil(collection.next_item_index / limit_per_one_request)):
-                items += await asyncio.gather(*[
-                    self.run_get_method(address=collection.address, method='get_nft_address_by_index', stack=[['num', i]]) for i in range(p * limit_per_one_request, min(collection.next_item_index, limit_per_one_request * (p + 1)))])
-
-        result = []
-        for data in items:
-            result.append(NftItem(self._process_address(read_address(Cell.one_from_boc(base64.b64decode(data[0][1]['bytes'])))), self))
-        return result
+        window = limit_per_one_request or collection.next_item_index
+        return [item async for item in self.iter_collection_items(collection, window=window)]
+
+    async def iter_collection_items(self, collection: NftCollection, start_index: int = 0, stop_index: int = None,
+                                    window: int = 100, ordered: bool = True, derive_addresses: bool = False,
+                                    processes: int = None):
+        """
+        Yields NftItem (with ``index`` attribute) for every index in [start_index, stop_index) keeping ``window``
+        get-method calls in flight. Pass ``start_index`` to resume an interrupted crawl.
+        With ``derive_addresses`` item addresses of standard collections are computed locally from the collection's
+        item code (in a pool of ``processes`` if specified) instead of calling get_nft_address_by_index for every index.
+        """
+        if stop_index is None:
+            if not collection.is_full():
+                await collection.update()
+            stop_index = collection.next_item_index
+        if derive_addresses:
+            try:
+                code = await prepare_nft_item_derivation(self, collection.address, start_index, stop_index)
+            except ValueError as e:
+                logging.warning(f'{e}, falling back to get-methods')
+            else:
+                async for index, address in derive_nft_item_addresses(code, collection.address, start_index, stop_index, processes):
+                    item = NftItem(self._process_address(address), self)
+                    item.index = index
+                    yield item
+                return
+        async for index, address in sliding_window(lambda i: self._get_nft_address_by_index(collection.address, i),
+                                                   range(start_index, stop_index), max(1, window), ordered):
+            item = NftItem(address, self)
+            item.index = index
+            yield item
+
+    async def _get_nft_address_by_index(self, collection_address: str, index: int):
+        data = await self.run_get_method(address=collection_address, method='get_nft_address_by_index', stack=[['num', index]])
+        return self._process_address(read_address(Cell.one_from_boc(base64.b64decode(data[0][1]['bytes']))))
+
+    async def _get_nft_item_code(self, collection_address: str):
+        params = {
+            'address': collection_address
+        }
+        response = await self._request('GET', 'getAddressInformation', params=params)
+        response = await process_response(response)
+        return parse_nft_item_code(base64.b64decode(response['result']['data']))
 
     async def get_transactions(self, address: str, limit: int = 10**9, limit_per_one_request: int = 100):
-        async with aiohttp.ClientSession() as session:
-            url = self.base_url + 'getTransactions'
-            transactions = []
-            params = {
-                'address': address,
-                'limit': limit_per_one_request,
-                'archival': 1
-            }
-            response = await session.get(url=url, params=params, headers=self.headers)
+        return [tr async for tr in self.iter_transactions(address, limit, limit_per_one_request=limit_per_one_request)]
+
+    async def iter_transactions(self, address: str, limit: int = None, from_lt: int = None, from_hash: str = None,
+                                to_lt: int = 0, limit_per_one_request: int = 100):
+        """
+        Yields transactions from newest to oldest, starting with ``from_lt`` (inclusive, latest by default)
+        down to ``to_lt`` (exclusive). The next page is fetched while the current one is consumed.
+        ``from_lt`` without ``from_hash`` is supported, but history above it is still walked.
+        """
+        count = 0
+        async for page in prefetch(self._transaction_pages(address, from_lt, from_hash, to_lt, limit_per_one_request)):
+            for tr in page:
+                if limit is not None and count >= limit:
+                    return
+                if from_lt is not None and int(tr['transaction_id']['lt']) > from_lt:
+                    continue
+                yield self._parse_transaction(tr)
+                count += 1
+
+    async def _transaction_pages(self, address: str, from_lt: int = None, from_hash: str = None, to_lt: int = 0,
+                                 limit_per_one_request: int = 100):
+        params = {
+            'address': address,
+            'limit': limit_per_one_request,
+            'archival': 1
+        }
+        if to_lt:
+            params['to_lt'] = to_lt
+        if from_lt is not None and from_hash is not None:
+            params['lt'] = from_lt
+            params['hash'] = from_hash
+        first = True
+        while True:
+            response = await self._request('GET', 'getTransactions', params=params)
             response = await process_response(response)
-            transactions += response['result']
-            while len(response['result']) == limit_per_one_request and len(transactions) < limit:
-                params = {
-                    'address': address,
-                    'limit': limit_per_one_request,
-                    'hash': transactions[-1]['transaction_id']['hash'],
-                    'lt': transactions[-1]['transaction_id']['lt'],
-                    'archival': 1
-                }
-                response = await session.get(url=url, params=params, headers=self.headers)
-                response = await process_response(response)
-                transactions += response['result'][1:]
-            result = []
-            for tr in transactions:
-                temp = {
-                    'utime': tr['utime'],
-                    'fee': tr['fee'],
-                    'data': tr['data'],
-                    'hash': tr['transaction_id']['hash'],
-                    'lt': tr['transaction_id']['lt'],
-                    'in_msg': {
-                        'created_lt': tr['in_msg']['created_lt'],
-                        'source': self._process_address(tr['in_msg']['source']) if tr['in_msg']['source'] else '',
-                        'destination': self._process_address(tr['in_msg']['destination']) if tr['in_msg']['destination'] else '',
-                        'value': tr['in_msg']['value'],
-                        'msg_data': tr['in_msg']['msg_data']['text'] if 'text' in tr['in_msg']['msg_data'] else tr['in_msg']['msg_data']['body']
-                    },
-                    'out_msgs': [
-                        {
-                            'created_lt': out_msg['created_lt'],
-                            'source': self._process_address(out_msg['source']) if out_msg['source'] else '',
-                            'destination': self._process_address(out_msg['destination']) if out_msg['destination'] else '',
-                            'value': out_msg['value'],
-                            'msg_data': out_msg['msg_data']['text'] if 'text' in out_msg['msg_data'] else out_msg['msg_data']['body']
-                        }
-                        for out_msg in tr['out_msgs']
-                    ]
+            transactions = response['result']
+            yield transactions if first else transactions[1:]  # the first one is the last of the previous page
+            if len(transactions) < limit_per_one_request:
+                return
+            first = False
+            params['lt'] = transactions[-1]['transaction_id']['lt']
+            params['hash'] = transactions[-1]['transaction_id']['hash']
+
+    def _parse_transaction(self, tr: dict) -> Transaction:
+        return Transaction({
+            'utime': tr['utime'],
+            'fee': tr['fee'],
+            'data': tr['data'],
+            'hash': tr['transaction_id']['hash'],
+            'lt': tr['transaction_id']['lt'],
+            'in_msg': {
+                'created_lt': tr['in_msg']['created_lt'],
+                'source': self._process_address(tr['in_msg']['source']) if tr['in_msg']['source'] else '',
+                'destination': self._process_address(tr['in_msg']['destination']) if tr['in_msg']['destination'] else '',
+                'value': tr['in_msg']['value'],
+                'msg_data': tr['in_msg']['msg_data']['text'] if 'text' in tr['in_msg']['msg_data'] else tr['in_msg']['msg_data']['body']
+            },
+            'out_msgs': [
+                {
+                    'created_lt': out_msg['created_lt'],
+                    'source': self._process_address(out_msg['source']) if out_msg['source'] else '',
+                    'destination': self._process_address(out_msg['destination']) if out_msg['destination'] else '',
+                    'value': out_msg['value'],
+                    'msg_data': out_msg['msg_data']['text'] if 'text' in out_msg['msg_data'] else out_msg['msg_data']['body']
                 }
-                result.append(Transaction(temp))
-            return result[:limit]
+                for out_msg in tr['out_msgs']
+            ]
+        })
 
     async def get_jetton_data(self, jetton_master_address: str):
+        key = SingleFlight.make_key('get_jetton_data', jetton_master_address)
+        return await self.single_flight.do(key, lambda: self._get_jetton_data(jetton_master_address), deepcopy_except(self))
+
+    async def _get_jetton_data(self, jetton_master_address: str):
         data = await self.run_get_method(method='get_jetton_data', address=jetton_master_address, stack=[])
-        result = process_jetton_data(data[3][1]['bytes']) if isinstance(process_jetton_data(data[3][1]['bytes']), dict) else await get(process_jetton_data(data[3][1]['bytes']))
+        result = await get_jetton_content(data[3][1]['bytes'], self.transport)
         result['address'] = self._process_address(jetton_master_address)
         result['supply'] = int(data[0][1], 16)
 
         return Jetton(result, self)
 
     async def send_boc(self, boc):
-        async with aiohttp.ClientSession() as session:
-            url = self.base_url + 'sendBoc'
-            data = {
-                'boc': boc
-            }
-            response = await session.post(url=url, json=data, headers=self.headers)
-            return response.status
+        data = {
+            'boc': boc
+        }
+        response = await self._request('POST', 'sendBoc', json=data)
+        return response.status
 
     async def get_wallet_seqno(self, address: str):
         data = await self.run_get_method(address=address, method='seqno', stack=[])
         return int(data[0][1], 16)
 
     async def get_balance(self, address: str):
-        async with aiohttp.ClientSession() as session:
-            url = self.base_url + 'getAddressBalance'
-            params = {
-                'address': address
-            }
-            response = await session.get(url=url, params=params, headers=self.headers)
-            response = await process_response(response)
-            return int(response['result'])
+        params = {
+            'address': address
+        }
+        response = await self._request('GET', 'getAddressBalance', params=params)
+        response = await process_response(response)
+        return int(response['result'])
 
     async def get_state(self, address: str):
-        async with aiohttp.ClientSession() as session:
-            url = self.base_url + 'getAddressState'
-            params = {
-                'address': address
-            }
-            response = await session.get(url=url, params=params, headers=self.headers)
-            response = await process_response(response)
-            return response['result']
+        params = {
+            'address': address
+        }
+        response = await self._request('GET', 'getAddressState', params=params)
+        response = await process_response(response)
+        return response['result']
 
     async def get_jetton_wallet_address(self, jetton_master_address: str, owner_address: str):
+        if self.jetton_wallet_codes is not None:
+            return self._process_address(await self.jetton_wallet_codes.get_address(self, jetton_master_address, owner_address))
+        return await self._get_jetton_wallet_address(jetton_master_address, owner_address)
+
+    async def _get_jetton_wallet_address(self, jetton_master_address: str, owner_address: str):
         cell = Cell()
         cell.bits.write_address(Address(owner_address))
         data = await self.run_get_method(address=jetton_master_address, method='get_wallet_address', stack=[["tvm.Slice", bytes_to_b64str(cell.to_boc(False))]])
         jetton_wallet_address = self._process_address(read_address(Cell.one_from_boc(base64.b64decode(data[0][1]['bytes']))).to_string())
         return jetton_wallet_address
 
+    async def _get_jetton_wallet_code(self, jetton_master_address: str):
+        data = await self.run_get_method(method='get_jetton_data', address=jetton_master_address, stack=[])
+        return base64.b64decode(data[4][1]['bytes'])
+
     async def get_jetton_wallet(self, jetton_wallet_address: str):
         data = await self.run_get_method(address=jetton_wallet_address, method='get_wallet_data', stack=[])
         wallet = {
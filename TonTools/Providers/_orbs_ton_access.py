@@ -1,11 +1,16 @@
 """ORBS TON ACCESS PART BY @arterialist"""
 
 
+import asyncio
+import logging
 import time
-from typing import List, Set, Optional
+from typing import Dict, List, Set, Optional, Tuple
 import random
 import requests
 
+from .transport import HttpTransport, default_transport
+from .flow_control import SingleFlight
+
 STALE_PERIOD = 10 * 60 * 1000  # 10 Min
 
 
@@ -22,10 +27,7 @@ class Nodes:
         self.init_time = 0
 
     def init(self, nodes_url: str):
-        self.node_index = -1
-        self.committee.clear()
-        self.topology = []
-        self.init_time = int(time.time() * 1000)
+        self._reset()
 
         try:
             response = requests.get(nodes_url)
@@ -35,6 +37,28 @@ class Nodes:
         except Exception as e:
             raise ValueError(f"exception in fetch({nodes_url}): {e}")
 
+        self._set_topology(topology)
+
+    async def async_init(self, nodes_url: str, transport: HttpTransport = None):
+        self._reset()
+        transport = transport if transport is not None else default_transport
+
+        try:
+            response = await transport.get(nodes_url)
+            response.raise_for_status()
+            topology = await response.json(content_type=None)
+        except Exception as e:
+            raise ValueError(f"exception in fetch({nodes_url}): {e}")
+
+        self._set_topology(topology)
+
+    def _reset(self):
+        self.node_index = -1
+        self.committee.clear()
+        self.topology = []
+        self.init_time = int(time.time() * 1000)
+
+    def _set_topology(self, topology: List[dict]):
         # remove unhealthy nodes
         for node in topology:
             if node["Healthy"] == "1":
@@ -70,7 +94,14 @@ class Access:
         self.nodes = Nodes()
 
     def init(self):
-        self.nodes.init(f"https://{self.host}/mngr/nodes?npm_version=2.3.1")
+        self.nodes.init(self.nodes_url)
+
+    async def async_init(self, transport: HttpTransport = None):
+        await self.nodes.async_init(self.nodes_url, transport)
+
+    @property
+    def nodes_url(self) -> str:
+        return f"https://{self.host}/mngr/nodes?npm_version=2.3.1"
 
     @staticmethod
     def make_protonet(edge_protocol: str, network: str) -> str:
@@ -130,6 +161,84 @@ class Access:
         return res
 
 
+class EndpointPool:
+    """
+    All healthy nodes of a network and protocol, requests are spread across them by node weight.
+
+    Topology is cached for ``ttl`` seconds and then refreshed in the background (the old one is used meanwhile).
+    Nodes reported as failed or slower than ``slow_request_time`` are skipped for ``eject_time`` seconds,
+    if all nodes are ejected they are used anyway.
+    """
+
+    def __init__(self,
+                 network: str = "mainnet",
+                 edge_protocol: str = "toncenter-api-v2",
+                 suffix: str = "",
+                 ttl: float = STALE_PERIOD / 1000,  # seconds
+                 eject_time: float = 30,  # seconds
+                 slow_request_time: float = 10,  # seconds, None to not eject slow nodes
+                 transport: HttpTransport = None
+                 ):
+        self.network = network
+        self.edge_protocol = edge_protocol
+        self.suffix = suffix
+        self.ttl = ttl
+        self.eject_time = eject_time
+        self.slow_request_time = slow_request_time
+        self.transport = transport
+        self.endpoints: List[Tuple[str, int]] = []  # (url, weight)
+        self.updated = 0.0
+        self._ejected: Dict[str, float] = {}  # url: time.monotonic() until which the node is skipped
+        self._single_flight = SingleFlight()
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    async def get(self) -> str:
+        if not self.endpoints:
+            await self.refresh()
+        elif time.monotonic() - self.updated > self.ttl and (self._refresh_task is None or self._refresh_task.done()):
+            self._refresh_task = asyncio.ensure_future(self._background_refresh())
+        return self.choose()
+
+    def choose(self) -> str:
+        now = time.monotonic()
+        available = [(url, weight) for url, weight in self.endpoints if self._ejected.get(url, 0) <= now]
+        if not available:
+            available = self.endpoints
+        urls, weights = zip(*available)
+        return random.choices(urls, weights)[0]
+
+    def report(self, url: str, ok: bool, elapsed: float = 0):
+        """
+        Result of a request to ``url``, failed and slow nodes are ejected.
+        """
+        if not ok or (self.slow_request_time is not None and elapsed > self.slow_request_time):
+            logging.info(f'Orbs node {url} is ejected for {self.eject_time}s ({"failed" if not ok else f"{elapsed:.1f}s"})')
+            self._ejected[url] = time.monotonic() + self.eject_time
+
+    async def refresh(self):
+        await self._single_flight.do('refresh', self._refresh)
+
+    async def _refresh(self):
+        access = Access()
+        await access.async_init(self.transport)
+        healthy = access.nodes.get_healthy_for(access.make_protonet(self.edge_protocol, self.network))
+        urls = access.build_urls(self.network, self.edge_protocol, self.suffix)
+        self.endpoints = [(url, node["Weight"]) for url, node in zip(urls, healthy)]
+        self._ejected = {url: until for url, until in self._ejected.items() if until > time.monotonic()}
+        self.updated = time.monotonic()
+
+    async def _background_refresh(self):
+        try:
+            await self.refresh()
+        except Exception as e:
+            logging.warning(f'Failed to refresh orbs topology, the old one is used: {e}')
+            self.updated = time.monotonic()
+
+    async def close(self):
+        if self._refresh_task is not None and not self._refresh_task.done():
+            self._refresh_task.cancel()
+
+
 def get_endpoints(
         network: str = "mainnet",
         edge_protocol: str = "toncenter-api-v2",
@@ -150,3 +259,26 @@ def get_http_endpoints(config: dict = None, single: bool = False) -> List[str]:
 def get_http_endpoint(config: dict = None) -> str:
     endpoints = get_http_endpoints(config, True)
     return endpoints[0]
+
+
+async def async_get_endpoints(
+        network: str = "mainnet",
+        edge_protocol: str = "toncenter-api-v2",
+        suffix: str = "",
+        single: bool = False,
+        transport: HttpTransport = None
+) -> List[str]:
+    access = Access()
+    await access.async_init(transport)
+    return access.build_urls(network, edge_protocol, suffix, single)
+
+
+async def async_get_http_endpoints(config: dict = None, single: bool = False, transport: HttpTransport = None) -> List[str]:
+    network = config.get("network") if config and config.get("network") else "mainnet"
+    suffix = "jsonRPC" if not config or config.get("protocol") != "rest" else ""
+    return await async_get_endpoints(network, "toncenter-api-v2", suffix, single, transport)
+
+
+async def async_get_http_endpoint(config: dict = None, transport: HttpTransport = None) -> str:
+    endpoints = await async_get_http_endpoints(config, True, transport)
+    return endpoints[0]
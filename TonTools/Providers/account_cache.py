@@ -0,0 +1,89 @@
+"""
+Cache of lite server account handles.
+"""
+
+import collections
+import time
+import typing
+
+from ton.account import Account
+
+from .address_codec import default_address_codec
+from .flow_control import SingleFlight
+
+
+class AccountHandleCache:
+    """
+    LRU of ``ton`` Account handles keyed by address and masterchain seqno.
+
+    A handle keeps the loaded account state and smart contract id (``Smc_Load``), so state reads and get-methods
+    of an account within one masterchain block share them. The current masterchain seqno is requested
+    at most every ``seqno_ttl`` seconds, a handle of an older block is replaced on access.
+    """
+
+    def __init__(self,
+                 client,  # initialized LsClient
+                 maxsize: int = 1000,  # 0 to disable caching
+                 seqno_ttl: float = 1  # seconds
+                 ):
+        self.client = client
+        self.maxsize = maxsize
+        self.seqno_ttl = seqno_ttl
+        self.single_flight = SingleFlight()
+        self._handles: typing.OrderedDict[bytes, typing.Tuple[int, Account]] = collections.OrderedDict()
+        self._seqno: typing.Optional[int] = None
+        self._seqno_updated = 0.0
+
+    async def seqno(self) -> int:
+        if self._seqno is None or time.monotonic() - self._seqno_updated >= self.seqno_ttl:
+            return await self.single_flight.do('seqno', self._load_seqno)
+        return self._seqno
+
+    async def _load_seqno(self) -> int:
+        seqno = await self.client.get_masterchain_seqno()
+        if self._seqno is None or seqno >= self._seqno:
+            self._seqno = seqno
+        self._seqno_updated = time.monotonic()
+        return self._seqno
+
+    async def get(self, address: str, fresh: bool = False) -> Account:
+        """
+        Handle of the account for the current masterchain block. With ``fresh`` a new handle replaces the cached one,
+        so the state is read from the lite server again (e.g. wallet seqno right after a transfer).
+        """
+        if not self.maxsize:
+            return await self.client.find_account(address, preload_state=False)
+        seqno = await self.seqno()
+        key = default_address_codec.key(address)
+        entry = self._handles.get(key)
+        if not fresh and entry is not None and entry[0] == seqno:
+            self._handles.move_to_end(key)
+            return entry[1]
+        account = await self.client.find_account(address, preload_state=False)
+        self._handles[key] = (seqno, account)
+        self._handles.move_to_end(key)
+        while len(self._handles) > self.maxsize:
+            self._handles.popitem(last=False)
+        return account
+
+    async def get_state(self, address: str, fresh: bool = False):
+        """
+        Raw account state, loaded once per handle.
+        """
+        account = await self.get(address, fresh)
+        if account.state is None:
+            await self.single_flight.do(('state', id(account)), account.load_state)
+        return account.state
+
+    async def get_smc(self, address: str, fresh: bool = False) -> Account:
+        """
+        Handle with the smart contract loaded for get-methods, ``Smc_Load`` is sent once per handle.
+        """
+        account = await self.get(address, fresh)
+        if account.smc_id is None:
+            await self.single_flight.do(('smc', id(account)), account.load_smc)
+        return account
+
+    def clear(self):
+        self._handles.clear()
+        self._seqno = None
@@ -0,0 +1,86 @@
+import base64
+import functools
+import typing
+
+from tonsdk.utils import Address, crc16
+
+from ..Enums.Address import AddressForm
+
+
+BOUNCEABLE_TAG = 0x11
+TEST_FLAG = 0x80
+
+
+class AddressCodec:
+    """
+    Memoized address conversion shared by all providers.
+
+    Every distinct input string is parsed (and validated) by ``tonsdk.utils.Address`` once, the result is kept
+    as a compact 33-byte key (workchain byte + hash part). Encoded forms are cached by that key, so different
+    spellings of the same address share them. All caches are LRU of ``maxsize`` entries.
+    """
+
+    def __init__(self, maxsize: int = 100000):
+        self.maxsize = maxsize
+        self._convert = functools.lru_cache(maxsize)(self._convert_uncached)
+        self._key = functools.lru_cache(maxsize)(self._key_uncached)
+        self._encode = functools.lru_cache(maxsize)(self._encode_uncached)
+
+    @staticmethod
+    def _address_key(address: Address) -> bytes:
+        return bytes([address.wc & 0xff]) + bytes(address.hash_part)
+
+    def _key_uncached(self, address: str) -> bytes:
+        return self._address_key(Address(address))
+
+    @staticmethod
+    def _encode_uncached(key: bytes, form: str, testnet: bool) -> str:
+        if form == AddressForm.RAW:
+            return f'{key[0] - 256 if key[0] > 127 else key[0]}:{key[1:].hex()}'
+        if form == AddressForm.USER_FRIENDLY:
+            data = bytes([BOUNCEABLE_TAG | (TEST_FLAG if testnet else 0)]) + key
+            return base64.urlsafe_b64encode(data + bytes(crc16(data))).decode()
+        raise ValueError(f'unknown address form {form}')
+
+    def _convert_uncached(self, address: str, form: str, testnet: bool) -> str:
+        return self._encode(self._key(address), form, testnet)
+
+    def key(self, address: typing.Union[str, Address]) -> bytes:
+        """
+        33-byte key of the address: workchain (int8) and 256-bit hash part.
+        """
+        if isinstance(address, Address):
+            return self._address_key(address)
+        return self._key(address)
+
+    def convert(self, address: typing.Union[str, Address], form: str = AddressForm.USER_FRIENDLY,
+                testnet: bool = False) -> str:
+        """
+        Raw or url safe bounceable user friendly form of the address (like ``Address(address).to_string(...)``).
+        """
+        if isinstance(address, Address):
+            return self._encode(self._address_key(address), form, testnet)
+        return self._convert(address, form, testnet)
+
+    def convert_many(self, addresses: typing.Iterable[typing.Union[str, Address]], form: str = AddressForm.USER_FRIENDLY,
+                     testnet: bool = False) -> typing.List[str]:
+        convert = self.convert
+        return [convert(address, form, testnet) for address in addresses]
+
+    def from_wc_hex(self, wc: int, hex_: str, form: str = AddressForm.USER_FRIENDLY, testnet: bool = False) -> str:
+        return self._encode(bytes([int(wc) & 0xff]) + bytes.fromhex(hex_), form, testnet)
+
+    def cache_info(self) -> dict:
+        return {
+            'convert': self._convert.cache_info(),
+            'key': self._key.cache_info(),
+            'encode': self._encode.cache_info()
+        }
+
+    def clear(self):
+        self._convert.cache_clear()
+        self._key.cache_clear()
+        self._encode.cache_clear()
+
+
+default_address_codec = AddressCodec()
@@ -0,0 +1,208 @@
+"""
+Local computation of contract addresses from StateInit, so enumerating standard contracts
+doesn't need a get-method call per address.
+"""
+
+import asyncio
+import hashlib
+import logging
+import random
+import typing
+from concurrent.futures import ProcessPoolExecutor
+
+from tonsdk.boc import Cell
+from tonsdk.utils import Address
+
+from .flow_control import SingleFlight
+
+
+# StateInit with code and data only: refs descriptor, bits descriptor, b00110 + completion tag
+_STATE_INIT_DESCRIPTORS = bytes([2, 1, 0b00110100])
+
+
+class CodeInfo:
+    """
+    Hash and depth of a code cell, computed once and reused for every derived address.
+    """
+
+    def __init__(self, code: typing.Union[Cell, bytes, bytearray]):
+        if isinstance(code, (bytes, bytearray)):
+            code = Cell.one_from_boc(bytes(code))
+        self.cell = code
+        self.hash = code.bytes_hash()
+        self.depth = code.get_max_depth()
+
+
+def state_init_address(code: CodeInfo, data_hash: bytes, data_depth: int = 0, workchain: int = 0) -> str:
+    """
+    Raw address of a contract with given code and data. Equal to ``Address(wc:hash(StateInit))``
+    but doesn't rehash the code cell.
+    """
+    state_init_repr = _STATE_INIT_DESCRIPTORS + code.depth.to_bytes(2, 'big') + data_depth.to_bytes(2, 'big') \
+        + code.hash + data_hash
+    return f'{workchain}:{hashlib.sha256(state_init_repr).hexdigest()}'
+
+
+def _address_bits(address: Address) -> int:
+    """
+    addr_std$10 anycast:nothing$0 workchain_id:int8 address:bits256 (267 bits)
+    """
+    return (0b100 << 264) | ((address.wc & 0xff) << 256) | int.from_bytes(address.hash_part, 'big')
+
+
+def nft_item_data_hash(index: int, collection_address: Address) -> bytes:
+    """
+    Hash of init data of standard (TEP-62 reference implementation) nft item:
+    index:uint64 collection_address:MsgAddress, 331 bits without refs.
+    """
+    bits = (index << 267) | _address_bits(collection_address)
+    data = (bits << 5 | 0b10000).to_bytes(42, 'big')  # 331 bits + completion tag
+    return hashlib.sha256(b'\x00\x53' + data).digest()  # refs descriptor, bits descriptor (42 + 41)
+
+
+def nft_item_address(code: CodeInfo, index: int, collection_address: Address) -> str:
+    return state_init_address(code, nft_item_data_hash(index, collection_address), 0, collection_address.wc)
+
+
+def nft_item_addresses(code: typing.Union[CodeInfo, bytes], collection_address: str, start: int, stop: int) -> typing.List[str]:
+    if not isinstance(code, CodeInfo):
+        code = CodeInfo(code)
+    collection_address = Address(collection_address)
+    return [nft_item_address(code, i, collection_address) for i in range(start, stop)]
+
+
+def parse_nft_item_code(collection_data: typing.Union[Cell, bytes]) -> Cell:
+    """
+    Extracts nft item code from data of standard collection:
+    owner_address next_item_index ^content ^nft_item_code ^royalty_params
+    """
+    if isinstance(collection_data, (bytes, bytearray)):
+        collection_data = Cell.one_from_boc(bytes(collection_data))
+    return collection_data.refs[1]
+
+
+async def prepare_nft_item_derivation(provider, collection_address: str, start: int, stop: int,
+                                      verify_sample: int = 3) -> CodeInfo:
+    """
+    Fetches nft item code of the collection and checks addresses derived from it for ``verify_sample``
+    indexes (first, last and random ones) against on-chain get-method.
+    Provider should have ``_get_nft_item_code(collection_address)`` and ``_get_nft_address_by_index(collection_address, index)``.
+    Raises ``ValueError`` if the collection isn't standard.
+    """
+    try:
+        code_info = CodeInfo(await provider._get_nft_item_code(collection_address))
+    except IndexError:
+        raise ValueError(f'collection {collection_address} data has non-standard layout')
+    if stop <= start:
+        return code_info
+    address = Address(collection_address)
+    sample = {start, stop - 1} | set(random.sample(range(start, stop), min(max(verify_sample - 2, 0), stop - start)))
+    onchain = await asyncio.gather(*[provider._get_nft_address_by_index(collection_address, i) for i in sample])
+    for i, onchain_address in zip(sample, onchain):
+        if Address(onchain_address).to_string(False) != nft_item_address(code_info, i, address):
+            raise ValueError(f'collection {collection_address} is not standard, item addresses can\'t be derived locally')
+    return code_info
+
+
+async def derive_nft_item_addresses(code: CodeInfo, collection_address: str, start: int, stop: int,
+                                    processes: int = None, chunk_size: int = 10000):
+    """
+    Yields ``(index, raw address)`` of collection items computed locally from the collection's item code,
+    in a pool of ``processes`` if specified. At most two chunks per process are computed ahead of the consumer.
+    """
+    chunks = [(i, min(i + chunk_size, stop)) for i in range(start, stop, chunk_size)]
+    if processes:
+        loop = asyncio.get_running_loop()
+        code_boc = bytes(code.cell.to_boc(False))
+        ahead = processes * 2
+        with ProcessPoolExecutor(processes) as executor:
+            futures = [loop.run_in_executor(executor, nft_item_addresses, code_boc, collection_address, a, b)
+                       for a, b in chunks[:ahead]]
+            for n, (a, b) in enumerate(chunks):
+                addresses = await futures[n]
+                futures[n] = None  # free memory of consumed chunks
+                if n + ahead < len(chunks):
+                    c, d = chunks[n + ahead]
+                    futures.append(loop.run_in_executor(executor, nft_item_addresses, code_boc, collection_address, c, d))
+                for i, address in zip(range(a, b), addresses):
+                    yield i, address
+    else:
+        address = Address(collection_address)
+        for a, b in chunks:
+            for i in range(a, b):
+                yield i, nft_item_address(code, i, address)
+            await asyncio.sleep(0)  # let other coroutines run between chunks
+
+
+def jetton_wallet_data(owner_address: Address, jetton_master_address: Address, wallet_code: CodeInfo) -> typing.Tuple[bytes, int]:
+    """
+    Hash and depth of init data of standard (TEP-74 reference implementation) jetton wallet:
+    balance:Coins(0) owner_address:MsgAddress jetton_master_address:MsgAddress ^jetton_wallet_code, 538 bits and 1 ref.
+    """
+    bits = (_address_bits(owner_address) << 267) | _address_bits(jetton_master_address)  # zero balance is 4 zero bits
+    data = (bits << 6 | 0b100000).to_bytes(68, 'big')  # 538 bits + completion tag
+    data_repr = b'\x01\x87' + data + wallet_code.depth.to_bytes(2, 'big') + wallet_code.hash  # 1 ref, bits descriptor (68 + 67)
+    return hashlib.sha256(data_repr).digest(), wallet_code.depth + 1
+
+
+def jetton_wallet_address(wallet_code: CodeInfo, owner_address: Address, jetton_master_address: Address) -> str:
+    data_hash, data_depth = jetton_wallet_data(owner_address, jetton_master_address, wallet_code)
+    return state_init_address(wallet_code, data_hash, data_depth, jetton_master_address.wc)
+
+
+class JettonWalletCodeCache:
+    """
+    Jetton wallet code of every jetton master, fetched once per master with ``get_jetton_data``.
+
+    The first address derived for a master is checked against ``get_wallet_address`` get-method,
+    after that addresses are computed locally. Masters whose wallets don't have the standard data layout
+    are remembered and always served by the get-method.
+    Provider should have ``_get_jetton_wallet_code(jetton_master_address)`` and
+    ``_get_jetton_wallet_address(jetton_master_address, owner_address)``.
+    """
+
+    def __init__(self):
+        self._codes: typing.Dict[str, typing.Optional[CodeInfo]] = {}  # raw master address: wallet code, None for non-standard
+        self._single_flight = SingleFlight()
+
+    async def get_address(self, provider, jetton_master_address: str, owner_address: str) -> str:
+        """
+        Returns jetton wallet address of ``owner_address`` (raw if derived locally).
+        """
+        master = Address(jetton_master_address)
+        key = master.to_string(False)
+        owner = Address(owner_address)
+        if key not in self._codes:
+            checked_owner, onchain = await self._single_flight.do(
+                key, lambda: self._prepare(provider, key, jetton_master_address, owner_address))
+            if onchain is not None and checked_owner == owner.to_string(False):
+                return onchain
+        code = self._codes[key]
+        if code is None:
+            return await provider._get_jetton_wallet_address(jetton_master_address, owner_address)
+        return jetton_wallet_address(code, owner, master)
+
+    async def _prepare(self, provider, key: str, jetton_master_address: str,
+                       owner_address: str) -> typing.Tuple[str, typing.Optional[str]]:
+        """
+        Returns raw ``owner_address`` and its get-method result if it was needed for the check.
+        """
+        owner = Address(owner_address)
+        try:
+            code = CodeInfo(await provider._get_jetton_wallet_code(jetton_master_address))
+        except Exception as e:
+            logging.info(f'Failed to parse jetton wallet code of {jetton_master_address}: {e}')
+            self._codes[key] = None
+            return owner.to_string(False), None
+        onchain = await provider._get_jetton_wallet_address(jetton_master_address, owner_address)
+        if Address(onchain).to_string(False) != jetton_wallet_address(code, owner, Address(jetton_master_address)):
+            logging.info(f'Jetton {jetton_master_address} wallets are not standard, their addresses can\'t be derived locally')
+            code = None
+        self._codes[key] = code
+        return owner.to_string(False), onchain
+
+    def forget(self, jetton_master_address: str):
+        self._codes.pop(Address(jetton_master_address).to_string(False), None)
+
+    def clear(self):
+        self._codes.clear()
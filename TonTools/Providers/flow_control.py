@@ -0,0 +1,479 @@
+import asyncio
+import collections
+import copy
+import logging
+import random
+import time
+import typing
+import weakref
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+
+class TokenBucket:
+    """
+    Token bucket rate limiter.
+
+    Tokens are refilled at ``rate`` per second up to ``burst``. Every ``acquire()`` reserves a token
+    immediately (the balance may go negative) and sleeps until the reserved token is due, so any number
+    of concurrently gathered coroutines is spread evenly at exactly ``rate`` requests per second.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        if rate <= 0:
+            raise ValueError('rate must be positive')
+        if burst < 1:
+            raise ValueError('burst must be at least 1')
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def set_rate(self, rate: float, burst: int = None):
+        self._refill()
+        self.rate = rate
+        if burst is not None:
+            self.burst = burst
+            self._tokens = min(self._tokens, burst)
+
+    async def acquire(self):
+        self._refill()
+        self._tokens -= 1
+        if self._tokens < 0:
+            await asyncio.sleep(-self._tokens / self.rate)
+
+
+def make_rate_limiter(rps: float = None, burst: int = None):
+    if not rps:
+        return None
+    return TokenBucket(rps, burst or 1)
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    AIMD limit of simultaneous requests.
+
+    The limit grows by ``increase`` per ``limit`` successful responses (about one per round trip of the
+    whole window) and is multiplied by ``decrease_factor`` when the backend reports overload (429, 503,
+    connection errors). Overload signals of requests started before the last decrease are ignored,
+    so one burst of 429s shrinks the window only once.
+    """
+
+    def __init__(self,
+                 max_limit: int = 100,
+                 min_limit: int = 1,
+                 initial_limit: int = None,  # max_limit by default
+                 increase: float = 1,
+                 decrease_factor: float = 0.5
+                 ):
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.limit = float(initial_limit or max_limit)
+        self.increase = increase
+        self.decrease_factor = decrease_factor
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._waiters: typing.Deque[asyncio.Future] = collections.deque()
+
+    def _wake(self):
+        free = int(self.limit) - self.in_flight
+        for waiter in self._waiters:
+            if free <= 0:
+                break
+            if not waiter.done():
+                waiter.set_result(None)
+                free -= 1
+
+    async def acquire(self) -> float:
+        """
+        Waits for a free slot and returns the start time to pass to ``release()``.
+        """
+        while self.in_flight >= int(self.limit):
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    self._wake()  # pass the slot we were woken for to the next waiter
+                raise
+            finally:
+                self._waiters.remove(waiter)
+        self.in_flight += 1
+        return time.monotonic()
+
+    def release(self, started: float, overloaded: bool = False):
+        self.in_flight -= 1
+        if overloaded:
+            if started >= self._last_decrease:
+                self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+                self._last_decrease = time.monotonic()
+        else:
+            self.limit = min(self.max_limit, self.limit + self.increase / self.limit)
+        self._wake()
+
+
+class RetryPolicy:
+    """
+    Retries with jittered exponential backoff. ``Retry-After`` response header, if present, takes precedence.
+    """
+
+    def __init__(self,
+                 max_retries: int = 5,
+                 base_delay: float = 0.5,  # seconds
+                 max_delay: float = 30,  # seconds
+                 retry_statuses: typing.Iterable[int] = (429, 500, 502, 503, 504)
+                 ):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_statuses = set(retry_statuses)
+
+    def get_delay(self, attempt: int, retry_after: str = None) -> float:
+        delay = parse_retry_after(retry_after)
+        if delay is not None:
+            return min(self.max_delay, delay) + random.uniform(0, self.base_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+def parse_retry_after(value: str = None):
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        date = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+    return max(0.0, (date - datetime.now(timezone.utc)).total_seconds())
+
+
+_KEY_SCALARS = (str, int, float, bool, bytes, type(None))
+
+
+def _freeze(value):
+    if isinstance(value, _KEY_SCALARS):
+        return type(value).__name__, value  # 1, 1.0 and True are different arguments
+    if isinstance(value, (list, tuple)):
+        return 'seq', tuple(_freeze(v) for v in value)
+    if isinstance(value, dict):
+        return 'map', tuple(sorted((_freeze(k), _freeze(v)) for k, v in value.items()))
+    raise TypeError(f'{type(value).__name__} can\'t be a part of a single flight key')
+
+
+def deepcopy_except(*objects) -> typing.Callable[[typing.Any], typing.Any]:
+    """
+    Deep copy function which keeps references to ``objects`` (e.g. the provider of returned contracts).
+    """
+    def deepcopy(value):
+        return copy.deepcopy(value, {id(obj): obj for obj in objects})
+    return deepcopy
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical calls: while a call with some key is in flight, other callers with
+    the same key await its result (or exception) instead of issuing their own request.
+    The shared call is shielded, so cancelling one of the callers doesn't cancel it for the others.
+    If the result was shared by several callers and ``copy_result`` is given, every caller gets its own copy,
+    otherwise the result must be treated as read-only.
+    """
+
+    def __init__(self):
+        self._calls: typing.Dict[typing.Hashable, asyncio.Future] = {}
+        self._shared: typing.MutableSet[asyncio.Future] = weakref.WeakSet()
+
+    @staticmethod
+    def make_key(*args) -> typing.Optional[tuple]:
+        """
+        Key of a call with strings, numbers, bools, None, bytes and lists, tuples and dicts of them as arguments.
+        None if there are other arguments, such calls aren't coalesced.
+        """
+        try:
+            return _freeze(args)
+        except TypeError:
+            return None
+
+    async def do(self, key: typing.Optional[typing.Hashable], factory: typing.Callable[[], typing.Awaitable],
+                 copy_result: typing.Callable[[typing.Any], typing.Any] = None):
+        if key is None:
+            return await factory()
+        call = self._calls.get(key)
+        if call is None or call.get_loop() is not asyncio.get_running_loop():
+            call = asyncio.ensure_future(factory())
+            self._calls[key] = call
+            call.add_done_callback(lambda _: self._forget(key, call))
+        else:
+            self._shared.add(call)
+        result = await asyncio.shield(call)
+        if copy_result is not None and call in self._shared:
+            return copy_result(result)
+        return result
+
+    def _forget(self, key: typing.Hashable, call: asyncio.Future):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+        if not call.cancelled():
+            call.exception()  # all callers may be gone, mark exception as retrieved
+
+
+async def sliding_window(func: typing.Callable[[typing.Any], typing.Awaitable],
+                         args: typing.Iterable,
+                         window: int,
+                         ordered: bool = True) -> typing.AsyncIterator[typing.Tuple[typing.Any, typing.Any]]:
+    """
+    Calls ``func(arg)`` for every arg keeping at most ``window`` calls in flight and yields ``(arg, result)``
+    as soon as possible (in order of ``args`` if ``ordered``). ``args`` are consumed lazily, so memory usage
+    doesn't depend on their number. Calls still in flight are cancelled if the consumer stops iterating.
+    """
+    args = iter(args)
+    pending: typing.Dict[asyncio.Future, typing.Any] = {}
+    order: typing.Deque[asyncio.Future] = collections.deque()
+
+    def fill():
+        while len(pending) < window:
+            try:
+                arg = next(args)
+            except StopIteration:
+                return
+            task = asyncio.ensure_future(func(arg))
+            pending[task] = arg
+            if ordered:
+                order.append(task)
+
+    try:
+        fill()
+        while pending:
+            if ordered:
+                task = order.popleft()
+                await asyncio.wait([task])
+                done = [task]
+            else:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                arg = pending.pop(task)
+                fill()
+                yield arg, task.result()
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def prefetch(pages: typing.AsyncIterator) -> typing.AsyncIterator:
+    """
+    Yields items of ``pages`` while the next one is already being fetched, so the network round trip
+    overlaps with the consumer's processing of the current item. At most one item is fetched ahead.
+    """
+    pages = pages.__aiter__()
+    next_page = asyncio.ensure_future(pages.__anext__())
+    try:
+        while True:
+            try:
+                page = await next_page
+            except StopAsyncIteration:
+                return
+            next_page = asyncio.ensure_future(pages.__anext__())
+            yield page
+    finally:
+        if not next_page.done():
+            next_page.cancel()
+        try:
+            await next_page
+        except (asyncio.CancelledError, StopAsyncIteration, Exception):
+            pass
+        if hasattr(pages, 'aclose'):
+            await pages.aclose()
+
+
+class LatencyTracker:
+    """
+    Latencies of the last ``window`` calls.
+    """
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self.samples: typing.Deque[float] = collections.deque(maxlen=window)
+        self.min_samples = min_samples
+
+    def record(self, seconds: float):
+        self.samples.append(seconds)
+
+    def percentile(self, p: float) -> typing.Optional[float]:
+        """
+        ``p`` (0..1) percentile of recorded latencies, None until ``min_samples`` are recorded.
+        """
+        if len(self.samples) < self.min_samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(int(p * len(ordered)), len(ordered) - 1)]
+
+
+async def hedge(primary: typing.Callable[[], typing.Awaitable],
+                secondary: typing.Callable[[], typing.Awaitable],
+                delay: float,
+                hedge_on: typing.Tuple[typing.Type[BaseException], ...] = (Exception,)):
+    """
+    Calls ``primary()`` and, if it hasn't returned in ``delay`` seconds or has failed with one of ``hedge_on``
+    errors, ``secondary()`` too. Returns the first successful result, the other call is cancelled.
+    Other errors of ``primary()`` are raised right away. If both calls fail, the last error is raised.
+    """
+    first = asyncio.ensure_future(primary())
+    pending = {first}
+    try:
+        done, pending = await asyncio.wait(pending, timeout=delay)
+        if first in done:
+            error = first.exception()
+            if error is None:
+                return first.result()
+            if not isinstance(error, hedge_on):
+                raise error
+        pending.add(asyncio.ensure_future(secondary()))
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class CircuitBreaker:
+    """
+    Skips calls to a failing backend.
+
+    Closed: calls pass, outcomes of the last ``window`` calls are kept. When at least ``min_calls`` are recorded and
+    the share of failed ones (errors and calls slower than ``slow_call_time``) reaches ``failure_rate``, the breaker opens.
+    Open: calls are rejected with ``CircuitOpenError`` for ``open_time`` seconds.
+    Half-open: up to ``half_open_calls`` trial calls pass. If they succeed the breaker closes, if one fails
+    it opens again for twice as long (up to ``max_open_time``).
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self,
+                 name: str = '',
+                 failure_rate: float = 0.5,
+                 slow_call_time: float = None,  # seconds, None to not count slow calls as failed
+                 window: int = 20,
+                 min_calls: int = 10,
+                 open_time: float = 5,  # seconds
+                 max_open_time: float = 60,  # seconds
+                 half_open_calls: int = 1
+                 ):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.slow_call_time = slow_call_time
+        self.min_calls = min_calls
+        self.open_time = open_time
+        self.max_open_time = max_open_time
+        self.half_open_calls = half_open_calls
+        self.state = self.CLOSED
+        self._outcomes: typing.Deque[bool] = collections.deque(maxlen=window)
+        self._opened_at = 0.0
+        self._current_open_time = open_time
+        self._trials = 0
+        self._trial_successes = 0
+
+    def allow(self) -> bool:
+        """
+        True if a call may be made now. In half-open state it takes a trial slot, so every allowed call
+        must be followed by ``record()`` or ``release()``.
+        """
+        if self.state == self.OPEN:
+            if time.monotonic() - self._opened_at < self._current_open_time:
+                return False
+            self.state = self.HALF_OPEN
+            self._trials = 0
+            self._trial_successes = 0
+        if self.state == self.HALF_OPEN:
+            if self._trials >= self.half_open_calls:
+                return False
+            self._trials += 1
+        return True
+
+    @property
+    def available(self) -> bool:
+        """
+        True if ``allow()`` would let a call pass now, without taking a trial slot.
+        """
+        if self.state == self.OPEN:
+            return time.monotonic() - self._opened_at >= self._current_open_time
+        if self.state == self.HALF_OPEN:
+            return self._trials < self.half_open_calls
+        return True
+
+    def record(self, ok: bool, elapsed: float = None):
+        if ok and self.slow_call_time is not None and elapsed is not None and elapsed > self.slow_call_time:
+            ok = False
+        if self.state == self.HALF_OPEN:
+            if not ok:
+                self._open(min(self._current_open_time * 2, self.max_open_time))
+                return
+            self._trial_successes += 1
+            if self._trial_successes >= self.half_open_calls:
+                self.state = self.CLOSED
+                self._outcomes.clear()
+                self._current_open_time = self.open_time
+                logging.info(f'Circuit {self.name} is closed')
+            return
+        if self.state == self.OPEN:
+            return  # calls started before the breaker opened
+        self._outcomes.append(ok)
+        if len(self._outcomes) >= self.min_calls and self._outcomes.count(False) >= self.failure_rate * len(self._outcomes):
+            self._open(self.open_time)
+
+    def release(self):
+        """
+        Frees the trial slot of a call that finished without result (e.g. was cancelled).
+        """
+        if self.state == self.HALF_OPEN and self._trials > 0:
+            self._trials -= 1
+
+    def _open(self, open_time: float):
+        self.state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._current_open_time = open_time
+        logging.warning(f'Circuit {self.name} is open for {open_time}s')
+
+    async def call(self, factory: typing.Callable[[], typing.Awaitable],
+                   failure_on: typing.Tuple[typing.Type[BaseException], ...] = (Exception,),
+                   failed: typing.Callable[[typing.Any], bool] = None):
+        """
+        Awaits ``factory()`` if the breaker allows it, otherwise raises ``CircuitOpenError``.
+        ``failure_on`` errors and results for which ``failed(result)`` is true count as failures,
+        other errors mean that the backend has answered.
+        """
+        if not self.allow():
+            raise CircuitOpenError(f'circuit {self.name} is open')
+        started = time.monotonic()
+        try:
+            result = await factory()
+        except failure_on:
+            self.record(False)
+            raise
+        except asyncio.CancelledError:
+            self.release()
+            raise
+        except BaseException:
+            self.record(True, time.monotonic() - started)
+            raise
+        self.record(failed is None or not failed(result), time.monotonic() - started)
+        return result
@@ -0,0 +1,138 @@
+"""
+Compiled GraphQL query templates.
+
+A query is compiled once per (operation type, table, fields, shape of arguments) into a document with ``$variables``,
+later calls with the same shape only produce a new dict of variable values. Several queries to the same table
+can be compiled into one document with aliased sub-queries (``compile_batch``).
+Strings, bools, floats, 32-bit ints and lists of them become variables, other values (big ints, None)
+are inlined into the template.
+"""
+
+import functools
+import typing
+
+from graphql_query import Argument, Field, Operation, Query, Variable
+
+
+_INT32 = range(-2 ** 31, 2 ** 31)
+
+
+def fields_key(fields: list) -> tuple:
+    """
+    Hashable form of fields list, e.g. ``["updated_at", {"data": ["nft_index"]}]``.
+    """
+    result = []
+    for field in fields:
+        if isinstance(field, str):
+            result.append(field)
+        elif isinstance(field, dict):
+            # dicts should contain exactly one key
+            name, sub_fields = next(iter(field.items()))
+            result.append((name, fields_key(sub_fields)))
+    return tuple(result)
+
+
+def _scalar_type(value) -> typing.Optional[str]:
+    if isinstance(value, bool):
+        return 'Boolean!'
+    if isinstance(value, int):
+        return 'Int!' if value in _INT32 else None
+    if isinstance(value, float):
+        return 'Float!'
+    if isinstance(value, str):
+        return 'String!'
+    return None
+
+
+def _literal(value) -> str:
+    if value is None:
+        return 'null'
+    if isinstance(value, str):
+        return f'"{value}"'
+    return str(value)
+
+
+def _flatten(value, name: str, variables: dict):
+    """
+    Shape of the argument value, variables it needs are added to ``variables``.
+    """
+    if isinstance(value, dict):
+        return 'obj', tuple((k, _flatten(v, f'{name}_{k}', variables)) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        if value and not any(isinstance(v, (dict, list, tuple)) for v in value):
+            types = {_scalar_type(v) for v in value}
+            gql_type = types.pop() if len(types) == 1 else None
+            if gql_type is None:
+                return 'lit', '[' + ', '.join(_literal(v) for v in value) + ']'
+            variables[name] = list(value)
+            return 'var', f'[{gql_type}]!'
+        return 'list', tuple(_flatten(v, f'{name}_{i}', variables) for i, v in enumerate(value))
+    gql_type = _scalar_type(value)
+    if gql_type is None:
+        return 'lit', _literal(value)
+    variables[name] = value
+    return 'var', gql_type
+
+
+def args_shape(args: dict, prefix: str = '') -> typing.Tuple[tuple, dict]:
+    """
+    Hashable shape of query arguments and values of its variables (names start with ``prefix``).
+    """
+    variables = {}
+    shape = tuple((k, _flatten(v, prefix + k, variables)) for k, v in args.items())
+    return shape, variables
+
+
+def batch_shape(args_list: typing.List[dict]) -> typing.Tuple[tuple, dict]:
+    """
+    Shapes of arguments of aliased sub-queries ``q0``, ``q1``, ... and values of their variables.
+    """
+    shapes, variables = [], {}
+    for i, args in enumerate(args_list):
+        shape, query_variables = args_shape(args, f'q{i}_')
+        shapes.append(shape)
+        variables.update(query_variables)
+    return tuple(shapes), variables
+
+
+def _build_value(shape, name: str, variables: list):
+    kind, value = shape
+    if kind == 'obj':
+        return [Argument(name=k, value=_build_value(s, f'{name}_{k}', variables)) for k, s in value]
+    if kind == 'list':
+        return [_build_value(s, f'{name}_{i}', variables) for i, s in enumerate(value)]
+    if kind == 'lit':
+        return value
+    variables.append(Variable(name=name, type=value))
+    return f'${name}'  # argument values are rendered as is, graphql_query doesn't accept Variable in lists of objects
+
+
+def _build_fields(fields: tuple) -> list:
+    return [field if isinstance(field, str) else Field(name=field[0], fields=_build_fields(field[1]))
+            for field in fields]
+
+
+def _build_query(table_name: str, fields: tuple, shape: tuple, variables: list, alias: str = None) -> Query:
+    prefix = f'{alias}_' if alias else ''
+    arguments = [Argument(name=k, value=_build_value(s, prefix + k, variables)) for k, s in shape]
+    return Query(name=table_name, alias=alias, arguments=arguments, fields=_build_fields(fields))
+
+
+@functools.lru_cache(maxsize=1024)
+def compile_query(type: str, table_name: str, fields: tuple, shape: tuple) -> str:
+    """
+    Rendered query document for ``fields_key(fields)`` and ``args_shape(args)[0]``.
+    """
+    variables = []
+    query = _build_query(table_name, fields, shape, variables)
+    return Operation(type=type, variables=variables, queries=[query]).render()
+
+
+@functools.lru_cache(maxsize=256)
+def compile_batch(type: str, table_name: str, fields: tuple, shapes: tuple) -> str:
+    """
+    Rendered document with a sub-query per shape of ``batch_shape(args_list)[0]``, results are under ``q0``, ``q1``, ...
+    """
+    variables = []
+    queries = [_build_query(table_name, fields, shape, variables, f'q{i}') for i, shape in enumerate(shapes)]
+    return Operation(type=type, variables=variables, queries=queries).render()
@@ -0,0 +1,271 @@
+"""
+Pool of lite server connections with health scoring.
+"""
+
+import asyncio
+import logging
+import random
+import time
+import typing
+
+from .LsClient import LsClient
+from .flow_control import CircuitBreaker, CircuitOpenError
+
+
+class LsPoolError(BaseException):
+    pass
+
+
+class LiteServerHealth:
+    """
+    EWMA of latency and error rate of a lite server and its lag behind the freshest masterchain block seen in the pool.
+    """
+
+    def __init__(self, alpha: float = 0.2):
+        self.alpha = alpha
+        self.latency: typing.Optional[float] = None  # seconds
+        self.error_rate = 0.0
+        self.consecutive_errors = 0
+        self.seqno: typing.Optional[int] = None
+        self.lag = 0  # masterchain blocks
+
+    def record(self, ok: bool, elapsed: float = None):
+        self.error_rate += self.alpha * ((0.0 if ok else 1.0) - self.error_rate)
+        if ok:
+            self.consecutive_errors = 0
+            if elapsed is not None:
+                self.latency = elapsed if self.latency is None else self.latency + self.alpha * (elapsed - self.latency)
+        else:
+            self.consecutive_errors += 1
+
+    def score(self, error_penalty: float, lag_penalty: float) -> float:
+        """
+        Expected cost of a request in seconds, lower is better.
+        """
+        return (self.latency or 0.0) + self.error_rate * error_penalty + self.lag * lag_penalty
+
+
+class _Member:
+    __slots__ = ('ls_index', 'client', 'health', 'breaker', 'state')
+
+    def __init__(self, ls_index: int, client: LsClient, health: LiteServerHealth,
+                 breaker: typing.Optional[CircuitBreaker] = None):
+        self.ls_index = ls_index
+        self.client = client
+        self.health = health
+        self.breaker = breaker
+        self.state = 'standby'  # active, standby or reconnecting
+
+
+class LsPool:
+    """
+    ``size`` active connections to different lite servers and ``standby`` initialized spare ones.
+
+    Every call goes to the active connection with the best ``LiteServerHealth.score``. A connection with ``max_errors``
+    errors in a row or lagging more than ``max_lag`` blocks is replaced by the best standby and reconnected
+    to another lite server in the background, so a bad lite server never blocks requests.
+    Masterchain seqno and latency of all connections are probed every ``probe_interval`` seconds.
+    With ``make_breaker`` every connection has its own circuit breaker, a connection whose breaker is open is skipped
+    until it lets a trial call pass, so one failing lite server never blocks the others.
+    """
+
+    def __init__(self,
+                 config: dict,  # global config
+                 make_client: typing.Callable[[int], LsClient],  # not initialized client for a lite server index
+                 size: int = 3,
+                 standby: int = 1,
+                 ls_index: int = None,  # lite server to start from, None for random
+                 max_errors: int = 3,
+                 max_lag: int = 10,  # masterchain blocks
+                 probe_interval: float = 10,  # seconds, None to disable probing
+                 error_penalty: float = 5,  # seconds added to the score at 100% error rate
+                 lag_penalty: float = 0.5,  # seconds added to the score per block of lag
+                 alpha: float = 0.2,  # weight of the last sample in EWMA
+                 make_breaker: typing.Callable[[int], CircuitBreaker] = None  # breaker for a lite server index, None to disable
+                 ):
+        self.config = config
+        self.make_client = make_client
+        self.size = size
+        self.standby = standby
+        self.max_errors = max_errors
+        self.max_lag = max_lag
+        self.probe_interval = probe_interval
+        self.error_penalty = error_penalty
+        self.lag_penalty = lag_penalty
+        self.alpha = alpha
+        self.make_breaker = make_breaker
+        self.members: typing.List[_Member] = []
+        count = len(config['liteservers'])
+        start = random.randrange(count) if ls_index is None else ls_index % count
+        self._indexes = [(start + i) % count for i in range(count)]  # order of lite servers to try
+        self._next = 0
+        self._tasks: typing.Set[asyncio.Task] = set()
+        self._closed = False
+
+    def _next_index(self) -> int:
+        used = {member.ls_index for member in self.members}
+        for _ in range(len(self._indexes)):
+            index = self._indexes[self._next % len(self._indexes)]
+            self._next += 1
+            if index not in used:
+                return index
+        raise LsPoolError('all lite servers are in use')
+
+    async def _connect(self, ls_index: int) -> typing.Optional[_Member]:
+        client = self.make_client(ls_index)
+        try:
+            await client.init()
+        except Exception as e:
+            logging.warning(f'Failed to connect to lite server {ls_index}: {e}')
+            return None
+        breaker = self.make_breaker(ls_index) if self.make_breaker is not None else None
+        return _Member(ls_index, client, LiteServerHealth(self.alpha), breaker)
+
+    async def init(self):
+        wanted = min(self.size + self.standby, len(self._indexes))
+        while len(self.members) < wanted and self._next < len(self._indexes):
+            indexes = [self._indexes[i] for i in range(self._next, min(self._next + wanted - len(self.members), len(self._indexes)))]
+            self._next += len(indexes)
+            for member in await asyncio.gather(*[self._connect(i) for i in indexes]):
+                if member is not None:
+                    self.members.append(member)
+        if not self.members:
+            raise LsPoolError('failed to connect to any lite server')
+        for member in self.members:
+            member.state = 'active' if self.active_count < self.size else 'standby'
+        if self.probe_interval:
+            self._spawn(self._probe_loop())
+
+    @property
+    def active_count(self) -> int:
+        return sum(member.state == 'active' for member in self.members)
+
+    def _score(self, member: _Member) -> float:
+        return member.health.score(self.error_penalty, self.lag_penalty)
+
+    @staticmethod
+    def _available(member: _Member) -> bool:
+        return member.state == 'active' and (member.breaker is None or member.breaker.available)
+
+    def best(self, exclude: typing.Collection[_Member] = ()) -> _Member:
+        active = [member for member in self.members if self._available(member) and member not in exclude]
+        if not active:
+            raise LsPoolError('no healthy lite servers')
+        return min(active, key=self._score)
+
+    async def execute(self, func: typing.Callable[[LsClient], typing.Awaitable], attempts: int = 2,
+                      exclude: typing.Collection[_Member] = ()):
+        """
+        Runs ``func(client)`` on the best connection, after an error tries the next best one (``attempts`` in total).
+        """
+        tried = list(exclude)
+        attempts += len(tried)
+        while True:
+            member = self.best(tried)
+            try:
+                return await self.run(member, func)
+            except Exception:
+                tried.append(member)
+                if len(tried) >= attempts or not any(self._available(m) and m not in tried for m in self.members):
+                    raise
+
+    async def run(self, member: _Member, func: typing.Callable[[LsClient], typing.Awaitable]):
+        """
+        Runs ``func(client)`` on the connection through its circuit breaker and records the outcome in its health.
+        """
+        started = time.monotonic()
+        try:
+            if member.breaker is None:
+                result = await func(member.client)
+            else:
+                result = await member.breaker.call(lambda: func(member.client))
+        except CircuitOpenError:
+            raise
+        except Exception:
+            self.report(member, False)
+            raise
+        self.report(member, True, time.monotonic() - started)
+        return result
+
+    def report(self, member: _Member, ok: bool, elapsed: float = None):
+        member.health.record(ok, elapsed)
+        if member.health.consecutive_errors >= self.max_errors or member.health.lag > self.max_lag:
+            self.eject(member)
+
+    def eject(self, member: _Member):
+        """
+        Replaces the connection with a standby one and reconnects it to another lite server in the background.
+        """
+        if member.state == 'reconnecting' or self._closed:
+            return
+        logging.warning(f'Lite server {member.ls_index} is unhealthy (errors in a row: {member.health.consecutive_errors}, '
+                        f'lag: {member.health.lag}), reconnecting')
+        was_active = member.state == 'active'
+        member.state = 'reconnecting'
+        if was_active:
+            self._promote()
+        self._spawn(self._reconnect(member))
+
+    def _promote(self):
+        standby = [member for member in self.members if member.state == 'standby']
+        if standby and self.active_count < self.size:
+            min(standby, key=self._score).state = 'active'
+
+    async def _reconnect(self, member: _Member):
+        delay = 1
+        try:
+            await asyncio.wait_for(member.client.close(), 5)
+        except (Exception, asyncio.TimeoutError):
+            pass
+        while not self._closed:
+            try:
+                index = self._next_index()
+            except LsPoolError:
+                index = member.ls_index
+            new = await self._connect(index)
+            if new is not None:
+                member.ls_index, member.client, member.health, member.breaker = new.ls_index, new.client, new.health, new.breaker
+                member.state = 'standby'
+                self._promote()
+                return
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 60)
+
+    async def _probe(self, member: _Member):
+        started = time.monotonic()
+        try:
+            member.health.seqno = await asyncio.wait_for(member.client.get_masterchain_seqno(), member.client.default_timeout)
+        except (Exception, asyncio.TimeoutError):
+            member.health.record(False)
+            return
+        member.health.record(True, time.monotonic() - started)
+
+    async def _probe_loop(self):
+        while not self._closed:
+            await asyncio.sleep(self.probe_interval)
+            members = [member for member in self.members if member.state != 'reconnecting']
+            await asyncio.gather(*[self._probe(member) for member in members])
+            seqnos = [member.health.seqno for member in members if member.health.seqno is not None]
+            if not seqnos:
+                continue
+            last = max(seqnos)
+            for member in members:
+                if member.health.seqno is not None:
+                    member.health.lag = last - member.health.seqno
+                if member.health.consecutive_errors >= self.max_errors or member.health.lag > self.max_lag:
+                    self.eject(member)
+
+    def _spawn(self, coroutine: typing.Coroutine):
+        task = asyncio.ensure_future(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def close(self):
+        self._closed = True
+        for task in list(self._tasks):
+            task.cancel()
+        for member in self.members:
+            try:
+                await asyncio.wait_for(member.client.close(), 5)
+            except (Exception, asyncio.TimeoutError):
+                pass
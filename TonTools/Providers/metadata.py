@@ -0,0 +1,312 @@
+import asyncio
+import collections
+import hashlib
+import json
+import os
+import threading
+import time
+import typing
+from pathlib import Path
+
+from .transport import HttpTransport, default_transport
+
+
+IPFS_GATEWAYS = (
+    'https://ipfs.io/ipfs/',
+    'https://gateway.pinata.cloud/ipfs/',
+    'https://dweb.link/ipfs/',
+)
+
+
+def ipfs_path(url: str) -> typing.Optional[str]:
+    """
+    Returns ``<cid>/<path>`` part of ``ipfs://`` or gateway (``https://<gateway>/ipfs/``) link, None for other links.
+    """
+    if url.startswith('ipfs://'):
+        return url[len('ipfs://'):]
+    if '/ipfs/' in url:
+        return url.split('/ipfs/', 1)[1]
+    return None
+
+
+def content_key(url: str) -> str:
+    """
+    The same IPFS content has one key regardless of the gateway it was linked through.
+    """
+    path = ipfs_path(url)
+    return 'ipfs://' + path if path is not None else url
+
+
+def is_immutable(url: str) -> bool:
+    """
+    IPFS links are content addressed (the CID is a hash of the content), so their data never changes.
+    """
+    return ipfs_path(url) is not None
+
+
+class MetadataCache:
+    """
+    Two-tier cache of off-chain metadata json: in-memory LRU and optional on-disk store.
+
+    Entries are keyed by ``content_key()`` of the url. IPFS entries never expire, other entries live ``ttl`` seconds.
+    On-disk entries are evicted least recently used first when the store grows over ``max_disk_size`` bytes.
+    Cached values are stored as json text, so every ``get()`` returns a fresh object the caller may modify.
+    """
+
+    def __init__(self,
+                 memory_size: int = 10000,  # max entries kept in memory, 0 to disable memory tier
+                 path: typing.Union[str, Path] = None,  # directory of the on-disk tier, None to disable it
+                 ttl: float = 24 * 60 * 60,  # seconds, for mutable (non IPFS) urls
+                 max_disk_size: int = 512 * 1024 ** 2  # bytes
+                 ):
+        self.memory_size = memory_size
+        self.ttl = ttl
+        self.max_disk_size = max_disk_size
+        self._memory: typing.OrderedDict[str, typing.Tuple[typing.Optional[float], str]] = collections.OrderedDict()
+        self.path = Path(path).expanduser() if path is not None else None
+        self._disk_size = None
+
+    @staticmethod
+    def _key(url: str) -> str:
+        return hashlib.sha256(url.encode()).hexdigest()
+
+    def _expires(self, url: str) -> typing.Optional[float]:
+        return None if is_immutable(url) else time.time() + self.ttl
+
+    def _memory_get(self, url: str) -> typing.Optional[str]:
+        entry = self._memory.get(url)
+        if entry is None:
+            return None
+        expires, text = entry
+        if expires is not None and expires < time.time():
+            del self._memory[url]
+            return None
+        self._memory.move_to_end(url)
+        return text
+
+    def _memory_set(self, url: str, expires: typing.Optional[float], text: str):
+        if not self.memory_size:
+            return
+        self._memory[url] = (expires, text)
+        self._memory.move_to_end(url)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def _disk_get(self, url: str) -> typing.Optional[typing.Tuple[typing.Optional[float], str]]:
+        file = self.path / self._key(url)
+        try:
+            with open(file, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry.get('url') != url:
+            return None
+        if entry['expires'] is not None and entry['expires'] < time.time():
+            self._disk_remove(file)
+            return None
+        os.utime(file)  # mtime is used as last access time for eviction
+        return entry['expires'], entry['data']
+
+    def _disk_set(self, url: str, expires: typing.Optional[float], text: str):
+        self.path.mkdir(parents=True, exist_ok=True)
+        file = self.path / self._key(url)
+        tmp = file.with_name(f'{file.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'url': url, 'expires': expires, 'data': text}, f)
+        old_size = file.stat().st_size if file.exists() else 0
+        os.replace(tmp, file)
+        if self._disk_size is None:
+            self._disk_size = self._scan_disk_size()
+        else:
+            self._disk_size += file.stat().st_size - old_size
+        if self._disk_size > self.max_disk_size:
+            self._evict()
+
+    def _disk_remove(self, file: Path):
+        try:
+            size = file.stat().st_size
+            file.unlink()
+        except OSError:
+            return
+        if self._disk_size is not None:
+            self._disk_size -= size
+
+    def _entries(self) -> typing.List[Path]:
+        return [file for file in self.path.iterdir() if file.is_file() and file.suffix != '.tmp']
+
+    def _scan_disk_size(self) -> int:
+        return sum(file.stat().st_size for file in self._entries())
+
+    def _evict(self):
+        files = sorted(self._entries(), key=lambda file: file.stat().st_mtime)
+        for file in files:
+            if self._disk_size <= self.max_disk_size * 0.9:
+                break
+            self._disk_remove(file)
+
+    async def get(self, url: str) -> typing.Any:
+        text = self._memory_get(url)
+        if text is None and self.path is not None:
+            entry = await asyncio.to_thread(self._disk_get, url)
+            if entry is not None:
+                expires, text = entry
+                self._memory_set(url, expires, text)
+        return json.loads(text) if text is not None else None
+
+    async def set(self, url: str, data: typing.Any):
+        text = json.dumps(data)
+        expires = self._expires(url)
+        self._memory_set(url, expires, text)
+        if self.path is not None:
+            await asyncio.to_thread(self._disk_set, url, expires, text)
+
+    def clear_memory(self):
+        self._memory.clear()
+
+
+default_metadata_cache = MetadataCache()
+
+
+def set_default_metadata_cache(cache: MetadataCache):
+    """
+    Replaces the cache used by all providers, e.g. to enable the on-disk tier:
+    ``set_default_metadata_cache(MetadataCache(path='~/.cache/tontools'))``
+    """
+    global default_metadata_cache
+    default_metadata_cache = cache
+
+
+class GatewayStats:
+    def __init__(self):
+        self.latency = None  # EWMA of response time in seconds, None until the first response
+        self.successes = 0
+        self.failures = 0
+
+    def record(self, latency: float, success: typing.Optional[bool], alpha: float = 0.3):
+        """
+        ``success`` is None for cancelled requests, ``latency`` is a lower bound then.
+        """
+        if success:
+            self.successes += 1
+        elif success is not None:
+            self.failures += 1
+        self.latency = latency if self.latency is None else alpha * latency + (1 - alpha) * self.latency
+
+    def to_dict(self):
+        return {
+            'latency': self.latency,
+            'successes': self.successes,
+            'failures': self.failures
+        }
+
+
+class MetadataFetcher:
+    """
+    Downloads off-chain metadata json.
+
+    IPFS content is requested from ``race_size`` fastest gateways at once, the first successful response
+    wins and the other requests are cancelled. If all of them fail, the remaining gateways are tried the same way.
+    Gateways are ranked by EWMA latency (failures count as ``timeout``), so the fastest ones are preferred over time.
+    Every download has a ``timeout`` deadline and at most ``max_concurrency`` downloads run simultaneously.
+    """
+
+    def __init__(self,
+                 gateways: typing.Iterable[str] = IPFS_GATEWAYS,
+                 race_size: int = 2,
+                 timeout: float = 15,  # seconds
+                 max_concurrency: int = 32,
+                 cache: MetadataCache = None  # default_metadata_cache by default
+                 ):
+        self.gateways = [gateway if gateway.endswith('/') else gateway + '/' for gateway in gateways]
+        self.race_size = race_size
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.cache = cache
+        self.stats: typing.Dict[str, GatewayStats] = {gateway: GatewayStats() for gateway in self.gateways}
+        self._semaphore: typing.Optional[asyncio.Semaphore] = None
+        self._semaphore_loop = None
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._semaphore_loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._semaphore_loop = loop
+        return self._semaphore
+
+    def ranked_gateways(self) -> typing.List[str]:
+        # gateways without measurements go first to get measured
+        return sorted(self.gateways, key=lambda gateway: self.stats[gateway].latency or 0)
+
+    def gateway_stats(self) -> typing.Dict[str, dict]:
+        return {gateway: stats.to_dict() for gateway, stats in self.stats.items()}
+
+    async def get(self, url: str, transport: HttpTransport = None):
+        cache = self.cache if self.cache is not None else default_metadata_cache
+        key = content_key(url)
+        result = await cache.get(key)
+        if result is not None:
+            return result
+        if transport is None:
+            transport = default_transport
+        async with self._get_semaphore():
+            path = ipfs_path(url)
+            if path is None:
+                response = await asyncio.wait_for(transport.get(url, throttle=False), self.timeout)  # metadata hosts are not limited by the provider's api key
+                result = await response.json(content_type=None)
+                if response.status != 200:
+                    return result
+            else:
+                result = await self._race(path, transport)
+        if isinstance(result, (dict, list)):
+            await cache.set(key, result)
+        return result
+
+    async def _fetch_from_gateway(self, gateway: str, path: str, transport: HttpTransport):
+        started = time.monotonic()
+        try:
+            response = await asyncio.wait_for(transport.get(gateway + path, throttle=False), self.timeout)
+            if response.status != 200:
+                raise ValueError(f'{gateway} responded with status {response.status}')
+            result = await response.json(content_type=None)
+        except asyncio.CancelledError:
+            self.stats[gateway].record(time.monotonic() - started, None)  # lost the race
+            raise
+        except Exception:
+            self.stats[gateway].record(self.timeout, False)
+            raise
+        self.stats[gateway].record(time.monotonic() - started, True)
+        return result
+
+    async def _race(self, path: str, transport: HttpTransport):
+        gateways = self.ranked_gateways()
+        error = None
+        for i in range(0, len(gateways), self.race_size):
+            tasks = [asyncio.ensure_future(self._fetch_from_gateway(gateway, path, transport))
+                     for gateway in gateways[i:i + self.race_size]]
+            for task in tasks:
+                task.add_done_callback(_retrieve_exception)
+            try:
+                for next_done in asyncio.as_completed(tasks):
+                    try:
+                        return await next_done
+                    except asyncio.CancelledError:
+                        raise
+                    except Exception as e:
+                        error = e
+            finally:
+                for task in tasks:
+                    task.cancel()
+        raise error
+
+
+def _retrieve_exception(task: asyncio.Future):
+    if not task.cancelled():
+        task.exception()
+
+
+default_metadata_fetcher = MetadataFetcher()
+
+
+def set_default_metadata_fetcher(fetcher: MetadataFetcher):
+    global default_metadata_fetcher
+    default_metadata_fetcher = fetcher
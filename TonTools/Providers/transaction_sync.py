@@ -0,0 +1,224 @@
+import abc
+import asyncio
+import contextlib
+import logging
+import sqlite3
+import threading
+import typing
+from pathlib import Path
+
+from tonsdk.utils import Address
+
+from .flow_control import sliding_window
+from ..Contracts.Contract import Transaction
+
+
+class Checkpoint(typing.NamedTuple):
+    lt: int
+    hash: str
+
+
+class CheckpointStore(abc.ABC):
+    """
+    Last delivered transaction of every address. Addresses are stored in raw form.
+    """
+
+    @abc.abstractmethod
+    async def get(self, address: str) -> typing.Optional[Checkpoint]:
+        pass
+
+    @abc.abstractmethod
+    async def set(self, address: str, checkpoint: Checkpoint):
+        pass
+
+    @abc.abstractmethod
+    async def delete(self, address: str):
+        pass
+
+    async def close(self):
+        pass
+
+
+class MemoryCheckpointStore(CheckpointStore):
+    def __init__(self):
+        self._checkpoints: typing.Dict[str, Checkpoint] = {}
+
+    async def get(self, address: str) -> typing.Optional[Checkpoint]:
+        return self._checkpoints.get(address)
+
+    async def set(self, address: str, checkpoint: Checkpoint):
+        self._checkpoints[address] = checkpoint
+
+    async def delete(self, address: str):
+        self._checkpoints.pop(address, None)
+
+
+class SqliteCheckpointStore(CheckpointStore):
+    """
+    Checkpoints in a SQLite file, every ``set()`` is committed before it returns, so they survive restarts.
+    """
+
+    def __init__(self, path: typing.Union[str, Path]):
+        self.path = Path(path).expanduser()
+        self._connection: typing.Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('CREATE TABLE IF NOT EXISTS checkpoints '
+                                     '(address TEXT PRIMARY KEY, lt INTEGER NOT NULL, hash TEXT NOT NULL)')
+            self._connection.commit()
+        return self._connection
+
+    def _execute(self, query: str, params: tuple = (), commit: bool = False) -> list:
+        with self._lock:
+            connection = self._connect()
+            rows = connection.execute(query, params).fetchall()
+            if commit:
+                connection.commit()
+            return rows
+
+    async def get(self, address: str) -> typing.Optional[Checkpoint]:
+        rows = await asyncio.to_thread(self._execute, 'SELECT lt, hash FROM checkpoints WHERE address = ?', (address,))
+        return Checkpoint(*rows[0]) if rows else None
+
+    async def set(self, address: str, checkpoint: Checkpoint):
+        await asyncio.to_thread(self._execute, 'INSERT OR REPLACE INTO checkpoints (address, lt, hash) VALUES (?, ?, ?)',
+                                (address, checkpoint.lt, checkpoint.hash), True)
+
+    async def delete(self, address: str):
+        await asyncio.to_thread(self._execute, 'DELETE FROM checkpoints WHERE address = ?', (address,), True)
+
+    async def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+
+class TransactionSync:
+    """
+    Incremental transaction sync: only transactions newer than the address checkpoint are fetched
+    (``to_lt`` of provider's ``iter_transactions``), so the cost of a poll depends on new activity, not history size.
+
+    New transactions are delivered to ``handler`` oldest first, one at a time. The checkpoint is advanced right after
+    the handler returns, so a transaction is never skipped: if the handler raises, the sync of the address stops and
+    the same transaction is delivered again on the next poll. With a persistent store a transaction can be delivered
+    twice only if the process dies between the handler returning and the checkpoint write, so handlers with side
+    effects should be idempotent by transaction hash.
+    Concurrent syncs of the same address are serialized.
+
+    At most ``chunk_size`` transactions are kept in memory: when more are new, only the newest transaction of every
+    chunk is remembered while walking back to the checkpoint, then the chunks are fetched again oldest first.
+    """
+
+    def __init__(self,
+                 provider,
+                 store: CheckpointStore = None,  # MemoryCheckpointStore by default
+                 start_lt: int = 0,  # lt to start from for addresses without checkpoint, 0 for the whole history
+                 chunk_size: int = 100  # transactions kept in memory per address
+                 ):
+        self.provider = provider
+        self.store = store if store is not None else MemoryCheckpointStore()
+        self.start_lt = start_lt
+        self.chunk_size = chunk_size
+        self._locks: typing.Dict[str, typing.List] = {}  # address: [lock, number of its users]
+
+    @staticmethod
+    def _key(address: str) -> str:
+        return Address(address).to_string(False)
+
+    @contextlib.asynccontextmanager
+    async def _lock(self, key: str):
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[key]
+
+    async def get_new_transactions(self, address: str) -> typing.List[Transaction]:
+        """
+        Transactions newer than the checkpoint, oldest first. Doesn't advance the checkpoint.
+        All of them are loaded into memory, use ``iter_new_transactions`` for long ranges.
+        """
+        return [tr async for tr in self.iter_new_transactions(address)]
+
+    async def iter_new_transactions(self, address: str) -> typing.AsyncIterator[Transaction]:
+        """
+        Yields transactions newer than the checkpoint, oldest first. Doesn't advance the checkpoint.
+        """
+        checkpoint = await self.store.get(self._key(address))
+        to_lt = checkpoint.lt if checkpoint is not None else self.start_lt
+        newest: typing.List[Transaction] = []
+        heads: typing.List[Checkpoint] = []  # newest transaction of every chunk
+        count = 0
+        async for tr in self.provider.iter_transactions(address, to_lt=to_lt):
+            if count % self.chunk_size == 0:
+                heads.append(Checkpoint(int(tr.lt), tr.hash))
+            if count < self.chunk_size:
+                newest.append(tr)
+            count += 1
+        for head in reversed(heads[1:]):
+            chunk = [tr async for tr in self.provider.iter_transactions(address, limit=self.chunk_size, from_lt=head.lt,
+                                                                        from_hash=head.hash, to_lt=to_lt)]
+            for tr in reversed(chunk):
+                yield tr
+        for tr in reversed(newest):
+            yield tr
+
+    async def sync(self, address: str,
+                   handler: typing.Callable[[str, Transaction], typing.Optional[typing.Awaitable]]) -> int:
+        """
+        Delivers new transactions of ``address`` to ``handler(address, transaction)`` (sync or async)
+        and returns their number.
+        """
+        key = self._key(address)
+        async with self._lock(key):
+            count = 0
+            async for tr in self.iter_new_transactions(address):
+                result = handler(address, tr)
+                if asyncio.iscoroutine(result) or isinstance(result, asyncio.Future):
+                    await result
+                await self.store.set(key, Checkpoint(int(tr.lt), tr.hash))
+                count += 1
+            return count
+
+    async def sync_many(self, addresses: typing.Iterable[str],
+                        handler: typing.Callable[[str, Transaction], typing.Optional[typing.Awaitable]],
+                        window: int = 10) -> typing.Dict[str, typing.Union[int, BaseException]]:
+        """
+        Syncs ``addresses`` keeping ``window`` of them in flight. Returns number of delivered transactions
+        (or the error) for every address, an error of one address doesn't stop the others.
+        """
+        async def sync_one(address):
+            try:
+                return await self.sync(address, handler)
+            except (asyncio.CancelledError, KeyboardInterrupt, SystemExit):
+                raise
+            except BaseException as e:  # provider errors are derived from BaseException
+                logging.warning(f'Failed to sync transactions of {address}: {e}')
+                return e
+        return {address: result async for address, result in sliding_window(sync_one, addresses, window, ordered=False)}
+
+    async def run(self, addresses: typing.Iterable[str],
+                  handler: typing.Callable[[str, Transaction], typing.Optional[typing.Awaitable]],
+                  interval: float = 5, window: int = 10):
+        """
+        Polls ``addresses`` every ``interval`` seconds until cancelled.
+        """
+        addresses = list(addresses)
+        while True:
+            await self.sync_many(addresses, handler, window)
+            await asyncio.sleep(interval)
+
+    async def reset(self, address: str):
+        await self.store.delete(self._key(address))
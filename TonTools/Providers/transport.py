@@ -0,0 +1,136 @@
+import asyncio
+import typing
+
+import aiohttp
+
+from .flow_control import TokenBucket, AdaptiveConcurrencyLimiter, RetryPolicy, CircuitBreaker
+
+
+OVERLOAD_STATUSES = (429, 503)
+
+
+class HttpTransport:
+    """
+    Long-lived aiohttp session shared by all methods of a provider.
+
+    Connections are kept alive and reused, DNS answers are cached. The session is created lazily
+    inside the running event loop (and recreated if the loop has changed), so the transport can be
+    constructed in a synchronous ``__init__``.
+
+    If ``rate_limiter`` is set, every request (unless sent with ``throttle=False``) waits for a token first,
+    ``concurrency_limiter`` adapts the number of simultaneous requests to what the backend accepts.
+    Responses with ``retry_policy.retry_statuses`` and connection errors are retried, other responses are
+    returned as is. With ``circuit_breaker`` requests fail fast with ``CircuitOpenError`` while the backend
+    keeps failing (5xx responses and connection errors after retries). Requests with ``throttle=False``
+    (metadata hosts, IPFS gateways) go to third-party servers, they bypass the breaker.
+    """
+
+    def __init__(self,
+                 pool_size: int = 100,  # max simultaneous connections, 0 for unlimited
+                 pool_size_per_host: int = 0,  # 0 for unlimited
+                 dns_cache_ttl: int = 300,  # seconds
+                 keepalive_timeout: float = 30,  # seconds
+                 timeout: typing.Optional[float] = 300,  # total timeout of one request in seconds, pass None explicitly to disable
+                 connect_timeout: typing.Optional[float] = 30,  # seconds to connect to a host, None to disable
+                 headers: dict = None,
+                 rate_limiter: TokenBucket = None,
+                 concurrency_limiter: AdaptiveConcurrencyLimiter = None,
+                 retry_policy: RetryPolicy = None,
+                 circuit_breaker: CircuitBreaker = None,
+                 ):
+        self.pool_size = pool_size
+        self.pool_size_per_host = pool_size_per_host
+        self.dns_cache_ttl = dns_cache_ttl
+        self.keepalive_timeout = keepalive_timeout
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.headers = headers or {}
+        self.rate_limiter = rate_limiter
+        self.concurrency_limiter = concurrency_limiter
+        self.retry_policy = retry_policy
+        self.circuit_breaker = circuit_breaker
+        self._session: typing.Optional[aiohttp.ClientSession] = None
+        self._loop: typing.Optional[asyncio.AbstractEventLoop] = None
+
+    async def get_session(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_size,
+                limit_per_host=self.pool_size_per_host,
+                ttl_dns_cache=self.dns_cache_ttl,
+                keepalive_timeout=self.keepalive_timeout,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                headers=self.headers,
+                timeout=aiohttp.ClientTimeout(total=self.timeout, sock_connect=self.connect_timeout),
+            )
+            self._loop = loop
+        return self._session
+
+    async def request(self, method: str, url: str, throttle: bool = True, **kwargs) -> aiohttp.ClientResponse:
+        """
+        Sends request and reads the whole body, so the connection is returned to the pool
+        immediately. ``.json()``, ``.text()`` and ``.status`` of the returned response stay usable.
+        """
+        if self.circuit_breaker is None or not throttle:
+            return await self._request(method, url, throttle, **kwargs)
+        return await self.circuit_breaker.call(lambda: self._request(method, url, throttle, **kwargs),
+                                               (aiohttp.ClientError, asyncio.TimeoutError),
+                                               lambda response: response.status >= 500)
+
+    async def _request(self, method: str, url: str, throttle: bool, **kwargs) -> aiohttp.ClientResponse:
+        attempt = 0
+        while True:
+            if throttle and self.rate_limiter is not None:
+                await self.rate_limiter.acquire()
+            limiter = self.concurrency_limiter if throttle else None
+            started = await limiter.acquire() if limiter is not None else 0
+            overloaded = True
+            try:
+                response = await self._send(method, url, **kwargs)
+                overloaded = response.status in OVERLOAD_STATUSES
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if not self._should_retry(attempt):
+                    raise
+                response = None
+            finally:
+                if limiter is not None:
+                    limiter.release(started, overloaded)
+            if response is not None and not (self._should_retry(attempt) and response.status in self.retry_policy.retry_statuses):
+                return response
+            retry_after = response.headers.get('Retry-After') if response is not None else None
+            await asyncio.sleep(self.retry_policy.get_delay(attempt, retry_after))
+            attempt += 1
+
+    def _should_retry(self, attempt: int) -> bool:
+        return self.retry_policy is not None and attempt < self.retry_policy.max_retries
+
+    async def _send(self, method: str, url: str, **kwargs) -> aiohttp.ClientResponse:
+        session = await self.get_session()
+        async with session.request(method, url, **kwargs) as response:
+            await response.read()
+            return response
+
+    async def get(self, url: str, **kwargs) -> aiohttp.ClientResponse:
+        return await self.request('GET', url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> aiohttp.ClientResponse:
+        return await self.request('POST', url, **kwargs)
+
+    async def close(self):
+        if self._session is not None and not self._session.closed and self._loop is asyncio.get_running_loop():
+            await self._session.close()
+        self._session = None
+        self._loop = None
+
+    async def __aenter__(self):
+        await self.get_session()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+
+default_transport = HttpTransport()
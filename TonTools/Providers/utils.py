@@ -1,9 +1,13 @@
+import base64
+import hashlib
 import typing
 import unicodedata
 from base64 import b64decode
-import aiohttp
 
-from tonsdk.boc import Cell
+from tonsdk.boc import Cell, Slice
+
+from . import metadata
+from .transport import HttpTransport, default_transport
 
 
 def is_hex(s: str):
@@ -14,39 +18,182 @@ def is_hex(s: str):
         return False
 
 
-def _get_refs(callback, default: typing.Any = ''):
-    try:
-        return callback()
-    except IndexError:
-        return default
+OFFCHAIN_CONTENT_PREFIX = 0x01
+ONCHAIN_CONTENT_PREFIX = 0x00
+CHUNKED_DATA_PREFIX = 0x01
+
+TEP64_KEYS = ['uri', 'name', 'description', 'image', 'image_data', 'symbol', 'decimals', 'amount_style', 'render_type']
+TEP64_KEYS_BY_HASH = {int.from_bytes(hashlib.sha256(key.encode()).digest(), 'big'): key for key in TEP64_KEYS}
+
+
+def _read_label_len(_slice: Slice, max_len: int) -> int:
+    bit_length = max_len.bit_length()  # #<= max_len
+    return _slice.read_uint(bit_length) if bit_length else 0
+
+
+def _read_hashmap_label(_slice: Slice, max_len: int) -> str:
+    if not _slice.read_bit():  # hml_short$0
+        length = 0
+        while _slice.read_bit():
+            length += 1
+        return _slice.read_bits(length).to01()
+    if not _slice.read_bit():  # hml_long$10
+        length = _read_label_len(_slice, max_len)
+        return _slice.read_bits(length).to01()
+    bit = str(_slice.read_bit())  # hml_same$11
+    length = _read_label_len(_slice, max_len)
+    return bit * length
+
+
+def parse_hashmap(cell: Cell, key_len: int) -> typing.Dict[int, Slice]:
+    """
+    Parses ``Hashmap key_len`` (the root of non-empty HashmapE) into {key: value slice}.
+    """
+    result = {}
+    _parse_hashmap_node(cell, key_len, '', result)
+    return result
+
+
+def _parse_hashmap_node(cell: Cell, n: int, prefix: str, result: dict):
+    _slice = cell.begin_parse()
+    label = _read_hashmap_label(_slice, n)
+    prefix += label
+    m = n - len(label)
+    if m == 0:
+        result[int(prefix, 2) if prefix else 0] = _slice
+        return
+    left, right = _slice.read_ref(), _slice.read_ref()
+    _parse_hashmap_node(left, m - 1, prefix + '0', result)
+    _parse_hashmap_node(right, m - 1, prefix + '1', result)
+
+
+def read_snake_data(_slice: Slice) -> bytes:
+    result = _slice.read_bytes(len(_slice) // 8)
+    cell = _slice.read_ref() if _slice.ref_offset < len(_slice.refs) else None
+    while cell is not None:
+        result += cell.bits.get_top_upped_array()
+        cell = cell.refs[0] if cell.refs else None
+    return result
+
+
+def _read_content_data(_slice: Slice) -> bytes:
+    if not len(_slice) and _slice.ref_offset < len(_slice.refs):
+        _slice = _slice.read_ref().begin_parse()  # value is ^ContentData
+    if not len(_slice):
+        return b''
+    prefix = _slice.read_uint(8)
+    if prefix == CHUNKED_DATA_PREFIX:
+        chunks = _slice.load_dict()
+        if chunks is None:
+            return b''
+        chunks = parse_hashmap(chunks, 32)
+        return b''.join(read_snake_data(chunks[i].read_ref().begin_parse()) for i in sorted(chunks))
+    return read_snake_data(_slice)
+
+
+def _decode_value(key: str, value: bytes) -> str:
+    if key == 'image_data':
+        try:
+            return value.decode()
+        except UnicodeDecodeError:
+            return base64.b64encode(value).decode()
+    return unicodedata.normalize('NFKD', value.decode(errors='replace'))
+
+
+def decode_content(data: typing.Union[str, bytes, Cell]) -> typing.Union[str, dict]:
+    """
+    Decodes TEP-64 token content (base64 boc, boc bytes or Cell), the boc is parsed once.
+    Returns url for off-chain content and dict of known on-chain keys (unknown keys are named by their hex hash)
+    for on-chain content. On-chain dict may contain ``uri`` (semi-chain content).
+    """
+    if isinstance(data, str):
+        data = b64decode(data)
+    cell = Cell.one_from_boc(data) if isinstance(data, bytes) else data
+    _slice = cell.begin_parse()
+    if len(_slice) < 8:
+        return ''
+    prefix = _slice.preload_uint(8)
+    if prefix != ONCHAIN_CONTENT_PREFIX:
+        if prefix == OFFCHAIN_CONTENT_PREFIX:
+            _slice.skip_bits(8)
+        return read_snake_data(_slice).decode(errors='replace')  # some old contracts store url without prefix
+    _slice.skip_bits(8)
+    result = {}
+    root = _slice.load_dict()
+    if root is None:
+        return result
+    for key_hash, value in parse_hashmap(root, 256).items():
+        key = TEP64_KEYS_BY_HASH.get(key_hash, format(key_hash, '064x'))
+        result[key] = _decode_value(key, _read_content_data(value))
+    return result
+
+
+async def get_content(data: typing.Union[str, bytes, Cell], transport: HttpTransport = None) -> dict:
+    """
+    Returns metadata of TEP-64 content: downloads off-chain json, merges on-chain values over semi-chain json.
+    """
+    content = decode_content(data)
+    if isinstance(content, str):
+        return await get(content, transport)
+    if content.get('uri'):
+        offchain = await get(content['uri'], transport)
+        if isinstance(offchain, dict):
+            content = {**offchain, **{k: v for k, v in content.items() if k != 'uri'}}
+    return content
+
+
+def _decimals(content: dict) -> int:
+    decimals = content.get('decimals')
+    return int(decimals) if decimals not in (None, '') else 9  # TEP-64 default
 
 
 def process_jetton_data(data):
-    if not len(Cell.one_from_boc(b64decode(data)).refs):
-        url = Cell.one_from_boc(b64decode(data)).bits.get_top_upped_array().decode().split('\x01')[-1]
-        return url
-    else:
-        symbol = _get_refs(lambda: Cell.one_from_boc(b64decode(data)).refs[0].refs[1].refs[0].refs[1].refs[0].bits.get_top_upped_array().decode().split('\x00')[-1])
-        desc1 = _get_refs(lambda: unicodedata.normalize("NFKD", Cell.one_from_boc(b64decode(data)).refs[0].refs[1].refs[1].refs[0].refs[0].bits.get_top_upped_array().decode().split('\x00')[-1]))
-        desc2 = _get_refs(lambda: unicodedata.normalize("NFKD", Cell.one_from_boc(b64decode(data)).refs[0].refs[1].refs[1].refs[0].refs[0].refs[0].bits.get_top_upped_array().decode().split('\x00')[-1]))
-        decimals = _get_refs(lambda: Cell.one_from_boc(b64decode(data)).refs[0].refs[1].refs[1].refs[1].refs[0].bits.get_top_upped_array().decode().split('\x00')[-1], 0)
-        name = _get_refs(lambda: Cell.one_from_boc(b64decode(data)).refs[0].refs[1].refs[0].refs[0].refs[0].bits.get_top_upped_array().decode().split('\x00')[-1])
-        image = _get_refs(lambda: Cell.one_from_boc(b64decode(data)).refs[0].refs[0].refs[0].bits.get_top_upped_array().decode().split('\x00')[-1])
-        return {
-            'name': name,
-            'description': desc1 + desc2,
-            'image': image,
-            'symbol': symbol,
-            'decimals': int(decimals)
-        }
-
-
-async def get(url: str):
-    if 'ipfs' in url:
-        url = 'https://ipfs.io/ipfs/' + url.split('ipfs://')[-1]
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url) as response:
-            return await response.json(content_type=None)
+    content = decode_content(data)
+    if isinstance(content, str):
+        return content
+    return {
+        'name': content.get('name', ''),
+        'description': content.get('description', ''),
+        'image': content.get('image', ''),
+        'symbol': content.get('symbol', ''),
+        'decimals': _decimals(content),
+        **({'image_data': content['image_data']} if 'image_data' in content else {}),
+        **({'uri': content['uri']} if 'uri' in content else {})
+    }
+
+
+async def get_jetton_content(data: typing.Union[str, bytes, Cell], transport: HttpTransport = None) -> dict:
+    """
+    Jetton metadata with TEP-64 defaults filled in.
+    """
+    content = await get_content(data, transport)
+    return {
+        **content,
+        'name': content.get('name', ''),
+        'description': content.get('description', ''),
+        'symbol': content.get('symbol', ''),
+        'decimals': _decimals(content),
+    }
+
+
+async def load_config(config: typing.Union[str, dict], transport: HttpTransport = None) -> typing.Union[str, dict]:
+    """
+    Downloads global config if ``config`` is an url, otherwise returns it as is.
+    """
+    # noinspection HttpUrlsUsage
+    if isinstance(config, str) and (config.find('http://') == 0 or config.find('https://') == 0):
+        transport = transport if transport is not None else default_transport
+        response = await transport.get(config)
+        response.raise_for_status()
+        return await response.json(content_type=None)
+    return config
+
+
+async def get(url: str, transport: HttpTransport = None):
+    """
+    Returns off-chain metadata json, see ``metadata.MetadataFetcher``.
+    """
+    return await metadata.default_metadata_fetcher.get(url, transport)
 
 markets_adresses = {
     '0:584ee61b2dff0837116d0fcb5078d93964bcbe9c05fd6a141b1bfca5d6a43e18': 'Getgems Sales',
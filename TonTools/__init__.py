@@ -8,6 +8,8 @@ from .Providers.TonApiClient import *
 from .Providers.TonCenterClient import *
 from .Providers.DtonClient import *
 from .Providers.SafeLsClient import *
+from .Providers.LsProcessPool import *
+from .Providers.transaction_sync import *
 
 from .Enums.Address import *
 from .Enums.Jetton import *
@@ -0,0 +1,138 @@
+import pytest
+from tonsdk.boc import Cell
+from tvm_valuetypes import deserialize_boc
+from pytonlib.utils.tlb import Transaction as PytonlibTransaction, Slice as PytonlibSlice
+
+from TonTools.Contracts.tlb import parse_transaction_status
+from TonTools.Contracts.utils import transaction_status
+
+
+def _var_uint(cell: Cell, value: int, header_bits: int):
+    length = (value.bit_length() + 7) // 8
+    cell.bits.write_uint(length, header_bits)
+    if length:
+        cell.bits.write_uint(value, length * 8)
+
+
+def _compute_vm(description: Cell, exit_code: int):
+    description.bits.write_bit(1)  # tr_phase_compute_vm$1
+    description.bits.write_uint(0, 3)  # success, msg_state_used, account_activated
+    description.bits.write_coins(1000)  # gas_fees
+    vm = Cell()
+    _var_uint(vm, 500, 3)  # gas_used
+    _var_uint(vm, 10000, 3)  # gas_limit
+    vm.bits.write_bit(0)  # gas_credit
+    vm.bits.write_int(0, 8)  # mode
+    vm.bits.write_int(exit_code, 32)
+    vm.bits.write_bit(0)  # exit_arg
+    vm.bits.write_uint(10, 32)  # vm_steps
+    vm.bits.write_uint(0, 256)  # vm_init_state_hash
+    vm.bits.write_uint(0, 256)  # vm_final_state_hash
+    description.refs.append(vm)
+
+
+def _compute_skipped(description: Cell, reason: str):
+    description.bits.write_bit(0)  # tr_phase_compute_skipped$0
+    for bit in reason:
+        description.bits.write_bit(int(bit))
+
+
+def _action(description: Cell, result_code: int = None):
+    if result_code is None:
+        description.bits.write_bit(0)
+        return
+    description.bits.write_bit(1)
+    action = Cell()
+    action.bits.write_uint(0, 3)  # success, valid, no_funds
+    action.bits.write_bit(0)  # acst_unchanged
+    action.bits.write_bit(0)  # total_fwd_fees
+    action.bits.write_bit(0)  # total_action_fees
+    action.bits.write_int(result_code, 32)
+    action.bits.write_bit(0)  # result_arg
+    for _ in range(4):  # tot_actions, spec_actions, skipped_actions, msgs_created
+        action.bits.write_uint(0, 16)
+    action.bits.write_uint(0, 256)  # action_list_hash
+    _var_uint(action, 0, 3)  # tot_msg_size cells
+    _var_uint(action, 0, 3)  # tot_msg_size bits
+    description.refs.append(action)
+
+
+def _transaction(compute, action_result_code: int = None) -> bytes:
+    description = Cell()
+    description.bits.write_uint(0, 4)  # trans_ord$0000
+    description.bits.write_bit(0)  # credit_first
+    description.bits.write_bit(0)  # storage_ph
+    description.bits.write_bit(0)  # credit_ph
+    compute(description)
+    _action(description, action_result_code)
+    description.bits.write_bit(0)  # aborted
+    description.bits.write_bit(0)  # bounce
+    description.bits.write_bit(0)  # destroyed
+
+    tr = Cell()
+    tr.bits.write_uint(0b0111, 4)
+    tr.bits.write_uint(1, 256)  # account_addr
+    tr.bits.write_uint(2, 64)  # lt
+    tr.bits.write_uint(0, 256)  # prev_trans_hash
+    tr.bits.write_uint(1, 64)  # prev_trans_lt
+    tr.bits.write_uint(1677658702, 32)  # now
+    tr.bits.write_uint(0, 15)  # outmsg_cnt
+    tr.bits.write_uint(2, 2)  # orig_status: acc_state_active
+    tr.bits.write_uint(2, 2)  # end_status: acc_state_active
+    msgs = Cell()
+    msgs.bits.write_bit(0)  # in_msg
+    msgs.bits.write_bit(0)  # out_msgs
+    tr.refs.append(msgs)
+    tr.bits.write_coins(1000)  # total_fees
+    tr.bits.write_bit(0)  # extra currencies
+    state_update = Cell()
+    state_update.bits.write_uint(0x72, 8)
+    state_update.bits.write_uint(0, 256)
+    state_update.bits.write_uint(0, 256)
+    tr.refs.append(state_update)
+    tr.refs.append(description)
+    return bytes(tr.to_boc(False))
+
+
+def _pytonlib_status(boc: bytes) -> bool:
+    tr = PytonlibTransaction(PytonlibSlice(deserialize_boc(boc)))
+    return not (tr.description.action and tr.description.action.result_code) and \
+        not (tr.description.compute_ph.type == 'tr_phase_compute_vm' and tr.description.compute_ph.exit_code)
+
+
+@pytest.mark.parametrize('exit_code, action_result_code, expected', [
+    (0, None, True),
+    (0, 0, True),
+    (37, None, False),
+    (-14, 0, False),
+    (0, 33, False),
+])
+def test_compute_and_action_codes(exit_code, action_result_code, expected):
+    boc = _transaction(lambda description: _compute_vm(description, exit_code), action_result_code)
+    assert parse_transaction_status(boc) is expected
+    assert _pytonlib_status(boc) is expected
+    assert transaction_status(boc.hex()) is expected
+
+
+@pytest.mark.parametrize('reason', ['00', '01', '10'])
+@pytest.mark.parametrize('action_result_code', [None, 0, 33])
+def test_compute_skipped(reason, action_result_code):
+    boc = _transaction(lambda description: _compute_skipped(description, reason), action_result_code)
+    assert parse_transaction_status(boc) == _pytonlib_status(boc) == (not action_result_code)
+
+
+@pytest.mark.parametrize('action_result_code', [None, 0, 33])
+def test_compute_skipped_suspended(action_result_code):
+    # pytonlib doesn't know cskip_suspended$110, it's compared on the same transaction with cskip_no_gas$10
+    boc = _transaction(lambda description: _compute_skipped(description, '110'), action_result_code)
+    no_gas = _transaction(lambda description: _compute_skipped(description, '10'), action_result_code)
+    assert parse_transaction_status(boc) == transaction_status(boc.hex()) == _pytonlib_status(no_gas)
+
+
+@pytest.mark.parametrize('action_result_code', [None, 33])
+def test_compute_skipped_invalid_reason(action_result_code):
+    boc = _transaction(lambda description: _compute_skipped(description, '111'), action_result_code)
+    with pytest.raises(ValueError):
+        parse_transaction_status(boc)
+    with pytest.raises((AssertionError, IndexError)):  # pytonlib parser reports the error
+        transaction_status(boc.hex())